@@ -32,6 +32,7 @@ from configform import ConfigForm
 from utils import sstr
 from resources import Resources
 import db
+import imagecache
 
 clr.AddReference('System')
 from System.Threading import ThreadExceptionEventHandler
@@ -115,6 +116,9 @@ def __launch(delegate):
       # shut down our database connection
       db.shutdown()
       
+      # free up all the cover images that we loaded while running
+      imagecache.clear()
+      
       # shut down the localization/internationalization system
       i18n.uninstall()
       
@@ -14,6 +14,22 @@ class BookData(object):
    persistable book objects. 
    '''
    
+   # the attributes that each BookData stores its properties in.  listing
+   # them here (instead of using a __dict__) keeps BookData objects small.
+   __slots__ = [ '__series_s', '__issue_num_s', '__volume_year_n',
+      '__published_s', '__released_s', '__pub_year_n', '__pub_month_n',
+      '__pub_day_n', '__rel_year_n', '__rel_month_n', '__rel_day_n',
+      '__format_s', '__title_s', '__crossovers_sl', '__summary_s',
+      '__publisher_s', '__imprint_s', '__characters_sl', '__teams_sl',
+      '__locations_sl', '__writers_sl', '__pencillers_sl', '__inkers_sl',
+      '__colorists_sl', '__letterers_sl', '__cover_artists_sl', '__editors_sl',
+      '__tags_sl', '__notes_s', '__path_s', '__webpage_s', '__cover_url_s',
+      '__rating_n', '__page_count_n', '__issue_key_s', '__series_key_s',
+      '__updated_s', '__not_updated' ]
+   
+   # maps each property -> its blank value (see blank()), once it's computed
+   __BLANKMAP = None
+   
    #===========================================================================   
    def __init__(self):
       self.__series_s = ""
@@ -52,10 +68,11 @@ class BookData(object):
       self.__page_count_n = 0
       self.__issue_key_s = ""
       self.__series_key_s = ""
+      self.__updated_s = ""
       
-      self.__updated_properties = BookData.all_properties()
-      self.dont_update("page_count_n")
-      self.dont_update("path_s")
+      # the properties that will NOT be updated when this BookData is 
+      # "updated" (see updated_properties())
+      self.__not_updated = ["page_count_n", "path_s"]
       
       
    #===========================================================================
@@ -81,7 +98,7 @@ class BookData(object):
       be updated when this BookData is "updated".   By default, it contains
       everything except read-only attributes like path_s and page_count_n.
       ''' 
-      return set(self.__updated_properties) 
+      return set(BookData.all_properties()) - set(self.__not_updated)
    
    
    #===========================================================================   
@@ -90,10 +107,25 @@ class BookData(object):
       Use this member to REMOVE the given property from the set of properties
       that are updated when this BookData is "updated".
       '''
-      if property in self.__updated_properties:
-         self.__updated_properties.remove(property)
-      elif not property in BookData.__dict__:
+      if not property in BookData.__dict__:
          raise Exception("unrecognized property: " + property)
+      elif not property in self.__not_updated:
+         self.__not_updated.append(property)
+   
+   
+   #===========================================================================   
+   def copy(self):
+      '''
+      Returns a new, plain BookData that contains a copy of all of the 
+      properties in this one (and updates the same properties when it is 
+      "updated", which does nothing at all for a plain BookData.)
+      '''
+      book = BookData()
+      for property in BookData.all_properties():
+         value = getattr(self, property)
+         setattr(book, property, list(value) if type(value)==list else value)
+      book.__not_updated = list(self.__not_updated)
+      return book
    
    
    #==========================================================================
@@ -132,13 +164,14 @@ class BookData(object):
       
       Values return by this method will never be None.
       '''   
-      if not hasattr(cls, "__BLANKMAP"):
+      if BookData.__BLANKMAP is None:
          book = BookData() 
-         cls.__BLANKMAP = {x : getattr(book, x) for x in cls.all_properties()}
-         for prop in cls.__BLANKMAP.values():
+         blankmap = {x : getattr(book, x) for x in BookData.all_properties()}
+         for prop in blankmap.values():
             if prop == None: raise Exception("None not allowed")
+         BookData.__BLANKMAP = blankmap
               
-      return cls.__BLANKMAP[property]
+      return BookData.__BLANKMAP[property]
     
     
    #===========================================================================   
@@ -496,3 +529,13 @@ class BookData(object):
       __set_series_key_s, __set_series_key_s,
       "The db Series Key object for this book.  Not None, may be empty.")   
       
+      
+   #===========================================================================
+   def __set_updated_s(self, updated_s = None):
+      self.__updated_s = BookData.blank("updated_s") \
+         if updated_s is None else sstr(updated_s).strip()
+   
+   updated_s = property( lambda self : self.__updated_s, 
+      __set_updated_s, __set_updated_s,
+      "When the db last changed this book's issue.  Not None, may be empty.")
+      
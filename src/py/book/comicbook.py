@@ -10,7 +10,7 @@ from time import strftime
 from dbmodels import IssueRef, SeriesRef
 from pluginbookdata import PluginBookData
 import utils
-from utils import sstr, is_number
+from utils import sstr, is_number, natural_key
 import clr
 import db
 import fnameparser 
@@ -35,6 +35,9 @@ class ComicBook(object):
    # automatically, instead of scraped.  Despite the CV in the name, 
    # this is a database independent magic value.
    CVDBSKIP = 'CVDBSKIP'
+   
+   # the (compiled) pattern that finds the CVDBSKIP flag in the tags or notes
+   __CVDBSKIP_RE = re.compile(r'(?i)' + CVDBSKIP)
 
    #===========================================================================   
    def __init__(self, crbook, scraper):
@@ -45,6 +48,15 @@ class ComicBook(object):
       self.__scraper = scraper;
       self.__bookdata = PluginBookData(crbook, scraper)
       self.__parse_extra_details_from_path()
+      
+      # the last value that __unique_series_s computed, along with the details
+      # of this book that it was computed from: a (details, value) tuple
+      self.__unique_series_memo = None
+      
+      # the values that __extract_refs parsed out of this book's details, as 
+      # an (issue_ref or "skip", series_ref) tuple, or None if they haven't
+      # been parsed yet (or have changed since they were.)
+      self.__refs_memo = None
 
    
    #===========================================================================
@@ -74,6 +86,10 @@ class ComicBook(object):
    # The number of pages in this book, an integer >= 0.
    page_count_n = property( lambda self : self.__bookdata.page_count_n )
    
+   # When the database last changed this book's issue (as of the last time
+   # this book was scraped; see Issue.updated_s.)  Not None, may be empty.
+   updated_s = property( lambda self : self.__bookdata.updated_s )
+   
    # the unique id string associated with this comic book's series.  all comic
    # books that appear to be from the same series will have the same id string,
    # which will be different for each series. will not be null or None.
@@ -83,16 +99,16 @@ class ComicBook(object):
    # will be None if not available, which is always the case for books that 
    # haven't been scraped before.
    issue_ref = property( lambda self : None if 
-      self.__extract_issue_ref() == 'skip' else self.__extract_issue_ref() )
+      self.__extract_refs()[0] == 'skip' else self.__extract_refs()[0] )
    
    # a SeriesRef object identifying this book's series in the database, if 
    # available.  will be None if not available, which is always the case for 
    # books that haven't been scraped before.
-   series_ref = property( lambda self : self.__extract_series_ref() )
+   series_ref = property( lambda self : self.__extract_refs()[1] )
     
    # true if this book as has been marked to "skip forever" (the scraper should
    # silently skip this book if this value is true, regardless of self.issue_ref
-   skip_b = property( lambda self : self.__extract_issue_ref() == 'skip' ) 
+   skip_b = property( lambda self : self.__extract_refs()[0] == 'skip' ) 
 
    #==========================================================================
    def create_image_of_page(self, page_index):
@@ -132,9 +148,23 @@ class ComicBook(object):
          bd.notes_s =self.__add_key_to_notes(bd.notes_s, None)
          log.debug("Added ", ComicBook.CVDBSKIP, " flag to comic book 'Notes'")
          
+      self.__refs_memo = None
       bd.update()
          
 
+   # =============================================================================
+   def __extract_refs(self):
+      '''
+      Returns a tuple containing the results of __extract_issue_ref and 
+      __extract_series_ref.  They're only parsed out of this book's details 
+      once, and then reused until skip_forever() or update() changes them.
+      '''
+      if self.__refs_memo is None:
+         self.__refs_memo = \
+            (self.__extract_issue_ref(), self.__extract_series_ref())
+      return self.__refs_memo
+      
+   
    # =============================================================================
    def __extract_issue_ref(self): 
       '''
@@ -153,9 +183,9 @@ class ComicBook(object):
       tagstring = ', '.join(bd.tags_sl)
       
       # check for the magic CVDBSKIP skip flag
-      skip_found = re.search(r'(?i)'+ComicBook.CVDBSKIP, tagstring)
-      if not skip_found:
-         skip_found = re.search(r'(?i)'+ComicBook.CVDBSKIP, bd.notes_s)
+      skip_found = ComicBook.__CVDBSKIP_RE.search(tagstring)
+      if not skip_found and bd.notes_s:
+         skip_found = ComicBook.__CVDBSKIP_RE.search(bd.notes_s)
       retval = "skip" if skip_found else None
    
       if retval is None:   
@@ -208,8 +238,18 @@ class ComicBook(object):
       a map, or for grouping ComicBooks), not for displaying to users.
       
       This value is NOT the same as the series_s property.
+      
+      The value is only recomputed if the details of this book that it depends
+      on have changed since the last time it was computed.
       '''
       bd = self.__bookdata
+      ignore_folders_b = self.__scraper.config.ignore_folders_b
+      details = (bd.series_s, bd.format_s, bd.volume_year_n, bd.path_s, 
+         ignore_folders_b)
+      if self.__unique_series_memo and \
+            self.__unique_series_memo[0] == details:
+         return self.__unique_series_memo[1]
+      
       sname = '' if not bd.series_s else bd.series_s
       if sname and bd.format_s:
          sname += bd.format_s
@@ -233,27 +273,70 @@ class ComicBook(object):
       # considered to belong to different series. 
       location = Path.GetDirectoryName(bd.path_s) if bd.path_s else None
       location = location if location else ''
-      hash = svolume if self.__scraper.config.ignore_folders_b \
-         else location + svolume
+      hash = svolume if ignore_folders_b else location + svolume
       if hash:  
          with MD5.Create() as md5:
             bytes = md5.ComputeHash(Encoding.UTF8.GetBytes(hash))
             hash = ''.join( [ "%02X" % x for x in bytes[:5] ] ).strip()
-      return sname + hash 
+      self.__unique_series_memo = (details, sname + hash)
+      return self.__unique_series_memo[1]
 
    #===========================================================================
-   def update(self, issue):
+   def update(self, issue, write_b=True):
       '''
       Copies all data in the given issue into this ComicBook object and its 
       backing data source, respecting all of the overwrite/ignore rules 
       defined in the the ScrapeEngine's Configuration object.  
       
+      If 'write_b' is False, the data is only copied into this ComicBook 
+      object; it isn't written out to the backing data source until write() 
+      is called.  That lets the data for many books be written out together.
+      
       As a side-effect, some detailed debug log information about the new values
       is also emitted.
       '''
+      self.__copy_issue(issue, self.__bookdata)
+      self.__refs_memo = None
+      if write_b:
+         self.__bookdata.update()
+         
+         
+   #===========================================================================
+   def write(self):
+      '''
+      Writes the data that was copied into this ComicBook object by the last 
+      call to update(issue, False) out to its backing data source.
+      '''
+      self.__bookdata.update()
+      
+      
+   #===========================================================================
+   def diff(self, issue):
+      '''
+      Works out what update(issue) WOULD change in this ComicBook, using all of
+      the same rules, but without changing this ComicBook or its backing data 
+      source at all.  Returns a list of (property, old value, new value) tuples,
+      one for each property that would change, i.e. ("series_s", "X", "Y").
+      '''
+      scratch = self.__bookdata.copy()
+      self.__copy_issue(issue, scratch)
+      changes = []
+      for property_s in sorted(scratch.updated_properties()):
+         old_value = getattr(self.__bookdata, property_s)
+         new_value = getattr(scratch, property_s)
+         if old_value != new_value:
+            changes.append( (property_s, old_value, new_value) )
+      return changes
+   
+   
+   #===========================================================================
+   def __copy_issue(self, issue, bd):
+      '''
+      Implements update() and diff(), by copying the data in the given issue 
+      into the given BookData (i.e. this ComicBook's, or a copy of it.)
+      '''
       log.debug("setting values for this comic book ('*' = changed):")
       config = self.__scraper.config
-      bd = self.__bookdata
       
       # series ---------------------
       value = self.__massage_new_string("Series", issue.series_name_s, \
@@ -323,7 +406,7 @@ class ComicBook(object):
       else: bd.volume_year_n = value
        
       # publisher and imprint -----
-      self.__update_publishers(issue, config)
+      self.__update_publishers(issue, config, bd)
       
       # characters ----------------
       value = self.__massage_new_string_list("Characters", \
@@ -435,20 +518,23 @@ class ComicBook(object):
       if value is None: bd.dont_update("series_key_s") 
       else: bd.series_key_s = value
       
-      # cover url -------------
-      self.__update_cover_url(issue)
+      # updated ---------------------
+      value = self.__massage_new_string("Updated", issue.updated_s, \
+         bd.updated_s, True, True, False )
+      if value is None: bd.dont_update("updated_s") 
+      else: bd.updated_s = value
       
-      bd.update();
+      # cover url -------------
+      self.__update_cover_url(issue, bd)
    
    #===========================================================================
-   def __update_publishers(self, issue, config):
+   def __update_publishers(self, issue, config, bd):
       '''
       Uses the given Configuration to copy the publisher and imprint data in
-      the given issue into the underlying BookData (changing them as required
+      the given issue into the given BookData (changing them as required
       by the Configuration).  Prints out a debug line for each value.
       '''
        
-      bd = self.__bookdata
       publisher_s = issue.publisher_s # publisher and (maybe) imprint owner
       imprint_s = issue.imprint_s # imprint, or '' if one there isn't one
       
@@ -493,15 +579,14 @@ class ComicBook(object):
       else: bd.publisher_s = value
    
    #===========================================================================
-   def __update_cover_url(self, issue):
+   def __update_cover_url(self, issue, bd):
       '''
       Obtains the appropriate cover art url for this book (if available), based
-      on the given Issue object.  Sets value in the underlying BookData, and 
+      on the given Issue object.  Sets value in the given BookData, and 
       prints out a debug line about it.  The implementing instance of BookData
       may or may not use this URL to install a cover image when saved out.
       '''
       config = self.__scraper.config
-      bd = self.__bookdata
       
       url_s = None
       alt_cover_key = sstr(issue.issue_key)+"-altcover"
@@ -925,5 +1010,25 @@ class ComicBook(object):
                bd.pub_year_n = int(extracted[2]) \
                   if is_number(extracted[2])\
                      else BookData.blank("pub_year_n")
-               
-               
\ No newline at end of file
+
+
+
+#==============================================================================
+def sort_books(books, rescrapes_first_b):
+   '''
+   Returns a new list that contains the given ComicBooks, sorted in order of
+   increasing series (unique_series_s), and where the series are the same, in
+   (natural) order of increasing issue number.  If 'rescrapes_first_b' is 
+   True, the books that can be scraped without asking the user anything (i.e.
+   they've been scraped before, or they're skipped) are sorted separately, 
+   and come before all of the others.
+   
+   The sort key of each book is only computed once, so this is fast even 
+   for very large numbers of books.
+   '''
+   
+   def sort_key(book):
+      slow_b = not (book.skip_b or book.issue_ref) if rescrapes_first_b \
+         else True
+      return (slow_b, book.unique_series_s, natural_key(book.issue_num_s))
+   return sorted(books, key=sort_key)
@@ -18,10 +18,21 @@ clr.AddReference('System')
 
 #==============================================================================
 class PluginBookData(BookData):
-   ''' A BookData object customized for working with ComicRack directly. '''
+   '''
+   A BookData object customized for working with ComicRack directly.  
+   
+   Each property is only read in from ComicRack the first time that it is 
+   needed (most of them are never needed for most books), and only the 
+   properties that have actually been changed since then are written back out 
+   when this BookData is "updated".
+   '''
+   
+   # the attributes that each PluginBookData stores its own state in
+   __slots__ = [ '__crbook', '__scraper', '__loaded', '__changed' ]
    
    __ISSUE_KEY = "comicvine_issue"
    __SERIES_KEY = "comicvine_volume"
+   __UPDATED = "comicvine_updated"
    
    #===========================================================================   
    def __init__(self, crbook, scraper):
@@ -35,46 +46,97 @@ class PluginBookData(BookData):
       if not "ComicBook" in utils.sstr(type(crbook)): 
          raise Exception("invalid backing ComicBook")
       
-      # a quick function to make splitting ComicRack comicbook fields easier 
-      def split(s):
-         return s.split(",") if s else [] 
-      
-      # load our own copy of all data from the ComicRack database
-      self.series_s = crbook.Series    # don't use shadows!  we'll parse these 3
-      self.issue_num_s = crbook.Number # values from the comic's filename our
-      self.pub_year_n =  crbook.Year   # self if they are not present!
-      self.pub_month_n = crbook.Month
-      self.pub_day_n = crbook.Day
-      self.rel_year_n = crbook.ReleasedTime.Year
-      self.rel_month_n = crbook.ReleasedTime.Month
-      self.rel_day_n = crbook.ReleasedTime.Day
-      self.volume_year_n = crbook.ShadowVolume
-      self.format_s = crbook.ShadowFormat
-      self.title_s = crbook.Title
-      self.crossovers_sl = split(crbook.AlternateSeries)
-      self.summary_s = crbook.Summary
-      self.publisher_s = crbook.Publisher
-      self.imprint_s = crbook.Imprint
-      self.characters_sl = split(crbook.Characters)
-      self.teams_sl = split(crbook.Teams)
-      self.locations_sl = split(crbook.Locations)
-      self.writers_sl = split(crbook.Writer)
-      self.pencillers_sl = split(crbook.Penciller)
-      self.inkers_sl = split(crbook.Inker)
-      self.colorists_sl = split(crbook.Colorist)
-      self.letterers_sl = split(crbook.Letterer)
-      self.cover_artists_sl = split(crbook.CoverArtist)
-      self.editors_sl = split(crbook.Editor)
-      self.tags_sl = split(crbook.Tags) 
-      self.notes_s = crbook.Notes
-      self.path_s = crbook.FilePath 
-      self.webpage_s = crbook.Web
-      self.rating_n = crbook.CommunityRating
-      self.page_count_n = crbook.PageCount
-      self.issue_key_s = crbook.GetCustomValue(PluginBookData.__ISSUE_KEY)
-      self.series_key_s = crbook.GetCustomValue(PluginBookData.__SERIES_KEY)
       self.__crbook = crbook;
       self.__scraper = scraper;
+      
+      # the properties that have been read in from the ComicRack book (or set) 
+      self.__loaded = set()
+      
+      # the properties that have changed since they were read in
+      self.__changed = set()
+      
+
+   #===========================================================================
+   def __lazy(property_s, read):
+      '''
+      Returns a property that overrides the BookData property with the given 
+      name.  Its value is read in from the ComicRack book (by passing that book 
+      to the given 'read' function) the first time that it is needed, and
+      setting it to a different value marks it as changed.
+      '''
+      base = BookData.__dict__[property_s]
+      def fget(self):
+         self.__load(property_s, base, read)
+         return base.fget(self)
+      def fset(self, value = None):
+         old_value = fget(self)
+         base.fset(self, value)
+         if base.fget(self) != old_value:
+            self.__changed.add(property_s)
+      return property(fget, fset, fset, base.__doc__)
+   
+   # don't use shadows for series_s, issue_num_s and pub_year_n!  ComicBook
+   # parses them from the comic's filename itself if they are not present.
+   series_s = __lazy("series_s", lambda crbook : crbook.Series)
+   issue_num_s = __lazy("issue_num_s", lambda crbook : crbook.Number)
+   pub_year_n = __lazy("pub_year_n", lambda crbook : crbook.Year)
+   pub_month_n = __lazy("pub_month_n", lambda crbook : crbook.Month)
+   pub_day_n = __lazy("pub_day_n", lambda crbook : crbook.Day)
+   rel_year_n = __lazy("rel_year_n", 
+      lambda crbook : crbook.ReleasedTime.Year)
+   rel_month_n = __lazy("rel_month_n", 
+      lambda crbook : crbook.ReleasedTime.Month)
+   rel_day_n = __lazy("rel_day_n", lambda crbook : crbook.ReleasedTime.Day)
+   volume_year_n = __lazy("volume_year_n", 
+      lambda crbook : crbook.ShadowVolume)
+   format_s = __lazy("format_s", lambda crbook : crbook.ShadowFormat)
+   title_s = __lazy("title_s", lambda crbook : crbook.Title)
+   crossovers_sl = __lazy("crossovers_sl", 
+      lambda crbook : crbook.AlternateSeries)
+   summary_s = __lazy("summary_s", lambda crbook : crbook.Summary)
+   publisher_s = __lazy("publisher_s", lambda crbook : crbook.Publisher)
+   imprint_s = __lazy("imprint_s", lambda crbook : crbook.Imprint)
+   characters_sl = __lazy("characters_sl", lambda crbook : crbook.Characters)
+   teams_sl = __lazy("teams_sl", lambda crbook : crbook.Teams)
+   locations_sl = __lazy("locations_sl", lambda crbook : crbook.Locations)
+   writers_sl = __lazy("writers_sl", lambda crbook : crbook.Writer)
+   pencillers_sl = __lazy("pencillers_sl", lambda crbook : crbook.Penciller)
+   inkers_sl = __lazy("inkers_sl", lambda crbook : crbook.Inker)
+   colorists_sl = __lazy("colorists_sl", lambda crbook : crbook.Colorist)
+   letterers_sl = __lazy("letterers_sl", lambda crbook : crbook.Letterer)
+   cover_artists_sl = __lazy("cover_artists_sl", 
+      lambda crbook : crbook.CoverArtist)
+   editors_sl = __lazy("editors_sl", lambda crbook : crbook.Editor)
+   tags_sl = __lazy("tags_sl", lambda crbook : crbook.Tags)
+   notes_s = __lazy("notes_s", lambda crbook : crbook.Notes)
+   path_s = __lazy("path_s", lambda crbook : crbook.FilePath)
+   webpage_s = __lazy("webpage_s", lambda crbook : crbook.Web)
+   cover_url_s = __lazy("cover_url_s", lambda crbook : None) # not in ComicRack
+   rating_n = __lazy("rating_n", lambda crbook : crbook.CommunityRating)
+   page_count_n = __lazy("page_count_n", lambda crbook : crbook.PageCount)
+   issue_key_s = __lazy("issue_key_s", 
+      lambda crbook : crbook.GetCustomValue(PluginBookData.__ISSUE_KEY))
+   series_key_s = __lazy("series_key_s", 
+      lambda crbook : crbook.GetCustomValue(PluginBookData.__SERIES_KEY))
+   updated_s = __lazy("updated_s", 
+      lambda crbook : crbook.GetCustomValue(PluginBookData.__UPDATED))
+   del __lazy
+   
+   
+   #===========================================================================
+   def __load(self, property_s, base, read):
+      '''
+      Reads in the value of the given property from the ComicRack book (using
+      the given 'read' function) and sets it on the given BookData property, 
+      unless that has already been done.
+      '''
+      if not property_s in self.__loaded:
+         self.__loaded.add(property_s)
+         value = read(self.__crbook)
+         if property_s.endswith("_sl"):
+            # ComicRack stores lists as comma separated strings
+            value = value.split(",") if value else []
+         base.fset(self, value)
                                     
    #==========================================================================
    def create_image_of_page(self, page_index):
@@ -104,8 +166,21 @@ class PluginBookData(BookData):
       Overridden to implement abstract method defined in superclass. Writes all 
       eligible properties in this object out to their counterparts in ComicRack 
       (i.e. back into the ComicBook object that was passed into __init__.) 
+      Properties that haven't changed since they were read in are skipped.
       '''
-      ok_to_update = self.updated_properties()
+      
+      # the parts of the release date are written out together, so if any
+      # one of them has changed, they all have to be written.
+      changed = set(self.__changed)
+      release_date = set(["rel_year_n", "rel_month_n", "rel_day_n"])
+      if changed & release_date:
+         changed.update(release_date)
+         
+      # the volume and format are read in from ComicRack's "shadow" values 
+      # (which it may have parsed from the filename) but written out to the
+      # real ones, so we can't tell if they've changed.  always write them.
+      changed.update(["volume_year_n", "format_s"])
+      ok_to_update = self.updated_properties() & changed
       
       
       # removes commas from the the given string  
@@ -228,6 +303,11 @@ class PluginBookData(BookData):
             PluginBookData.__SERIES_KEY, sstr(self.series_key_s))
          ok_to_update.remove("series_key_s")
          
+      if "updated_s" in ok_to_update:
+         self.__crbook.SetCustomValue(
+            PluginBookData.__UPDATED, sstr(self.updated_s))
+         ok_to_update.remove("updated_s")
+         
          
       # dates are a little special.  any element in the data could be blank
       # (missing), and we only update the released date if NONE of the 
@@ -294,3 +374,5 @@ class PluginBookData(BookData):
             log.debug(self.__class__.__name__ + " can't update property: " + s)
          raise Exception()
       
+      self.__changed.clear()
+      
@@ -29,16 +29,29 @@ from System.IO import IOException
 from System.Web import HttpUtility
 
 clr.AddReference('IronPython')
-from System.Threading import Thread, ThreadStart
+from System.Threading import Monitor, Thread, ThreadStart
 
 __CLIENTID = '&client=cvscraper'
 
 # this value is used to throttle our query speeds
 __next_query_time_ms = 0
 
+# a lock that guards __next_query_time_ms, which is shared by all threads
+__throttle_lock = object()
+
 # the amount of time to wait between queries
 __QUERY_DELAY_MS = 1100 
 
+# the number of queries that have been sent to comicvine (guarded by the lock)
+__query_count_n = 0
+
+# maps the id of each thread that has sent queries to comicvine -> the number
+# of queries it has sent (guarded by the lock)
+__thread_query_counts = {}
+
+# the total ms that queries have waited for their time slots (ditto)
+__query_wait_ms = 0
+
 # =============================================================================
 def _query_series_ids_dom(API_KEY, searchterm_s, page_n=1):
    ''' 
@@ -108,6 +121,31 @@ def _query_issue_ids_dom(API_KEY, seriesid_s, page_n=1):
    return __get_dom(QUERY.format(sstr(seriesid_s)) + PAGE )
 
 
+# =============================================================================
+def _query_issue_ids_bulk_dom(API_KEY, seriesids_sl, page_n=1):
+   '''
+   Performs a query that will obtain a dom containing all of the issue IDs 
+   (and the series ID of each issue) for ALL of the given series ids at once.
+   Like _query_issue_ids_dom, each page contains 100 results, so you may have 
+   to get more than one page of results.
+   
+   This method doesn't return null, but it may throw Exceptions.
+   '''
+   
+   # {0} is a list of series IDs, separated by '|' (which means OR).  sort the
+   # results so that they stay in the same order from one page to the next.
+   QUERY = 'https://comicvine.gamespot.com/api/issues/?api_key=' + API_KEY + \
+      __CLIENTID + '&format=xml&sort=id:asc' + \
+      '&field_list=name,issue_number,id,image,volume&filter=volume:{0}'
+   PAGE = "" if page_n == 1 \
+      else "&page={0}&offset={1}".format(page_n, (page_n-1)*100)
+   
+   if not seriesids_sl or page_n < 1:
+      raise ValueError('bad parameters')
+   return __get_dom(QUERY.format('|'.join([sstr(x) for x in seriesids_sl])) \
+      + PAGE)
+
+
 # =============================================================================
 def _query_issue_id_dom(API_KEY, seriesid_s, issue_num_s):
    '''
@@ -155,6 +193,26 @@ def _query_issue_details_dom(API_KEY, issueid_s):
    return __get_dom(url)
 
 
+# =============================================================================
+def _query_issue_updates_dom(API_KEY, issueids_sl):
+   '''
+   Performs a query that will obtain a dom containing the date that ComicVine
+   last updated each of the given issue IDs (at most 100 of them.)  Issues 
+   that don't exist are simply left out of the results.
+   
+   Never returns null, but may throw exceptions if there are problems.
+   '''
+   
+   # {0} is a list of issue IDs, separated by '|' (which means OR)
+   QUERY = 'https://comicvine.gamespot.com/api/issues/?api_key=' + API_KEY + \
+      __CLIENTID + '&format=xml&limit=100&field_list=id,date_last_updated' + \
+      '&filter=id:{0}'
+      
+   if not issueids_sl or len(issueids_sl) > 100:
+      raise ValueError('bad parameters')
+   return __get_dom(QUERY.format('|'.join([sstr(x) for x in issueids_sl])))
+
+
 # =============================================================================
 def __get_dom(url, lasttry=False):
    ''' 
@@ -185,8 +243,7 @@ def __get_dom(url, lasttry=False):
    dom = None   
    if not error_occurred:
       try:
-         xml = __strip_invalid_xml_chars(xml)
-         dom = xml2py.parseString(xml)
+         dom = _parse_dom(xml)
       except Exception, ex:
          if lasttry: raise ex
          else: error_occurred = True
@@ -240,6 +297,16 @@ def __get_page(url):
       raise DatabaseConnectionError("Comic Vine", url, wex)
 
 
+# =============================================================================
+def _parse_dom(xml):
+   '''
+   Parses the given ComicVine XML (i.e. the text of a ComicVine API response,
+   whether it was just downloaded or saved earlier) into a new dom tree, which
+   is returned.  May throw an exception if the XML can't be parsed.
+   '''
+   return xml2py.parseString(__strip_invalid_xml_chars(xml))
+
+
 # =============================================================================
 def __strip_invalid_xml_chars(xml):
    '''
@@ -261,15 +328,84 @@ def __strip_invalid_xml_chars(xml):
 # =============================================================================
 def wait_until_ready():
    '''
-   Waits until a fixed amount of time has passed since this function was 
-   last called.  Returns immediately if that much time has already passed.
+   Waits until a fixed amount of time has passed since the last time this 
+   function returned.  Returns immediately if that much time has already passed.
+   
+   This function is threadsafe.  When several threads call it at once, each one
+   reserves the next available time slot and waits for it, so queries are never
+   spaced more closely than __QUERY_DELAY_MS, no matter which thread makes them.
    '''
-   global __next_query_time_ms, __QUERY_DELAY_MS 
-   time_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
-   wait_ms = __next_query_time_ms - time_ms
+   global __next_query_time_ms, __query_count_n, __query_wait_ms
+   Monitor.Enter(__throttle_lock)
+   try:
+      time_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+      slot_ms = max(time_ms, __next_query_time_ms)
+      __next_query_time_ms = slot_ms + __QUERY_DELAY_MS
+      __query_count_n += 1
+      thread_id_n = Thread.CurrentThread.ManagedThreadId
+      __thread_query_counts[thread_id_n] = \
+         __thread_query_counts.get(thread_id_n, 0) + 1
+      __query_wait_ms += int(slot_ms - time_ms)
+   finally:
+      Monitor.Exit(__throttle_lock)
+      
+   wait_ms = int(slot_ms - time_ms)
    if wait_ms > 0:
       t = Thread(ThreadStart(lambda x=0: Thread.CurrentThread.Sleep(wait_ms)))
       t.Start()
       t.Join()
-   time_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
-   __next_query_time_ms = time_ms + __QUERY_DELAY_MS
+
+
+# =============================================================================
+def time_until_ready_ms():
+   '''
+   Returns the number of milliseconds until the next time slot that 
+   wait_until_ready() would give out, i.e. how long a query made right now
+   would have to wait.  Returns 0 if a query could be made right away.
+   This function is threadsafe.
+   '''
+   Monitor.Enter(__throttle_lock)
+   try:
+      time_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+      return max(0, int(__next_query_time_ms - time_ms))
+   finally:
+      Monitor.Exit(__throttle_lock)
+
+
+# =============================================================================
+def get_query_count_n():
+   '''
+   Returns the total number of queries that have been sent to comicvine (by
+   any thread) so far.  This function is threadsafe.
+   '''
+   Monitor.Enter(__throttle_lock)
+   try:
+      return __query_count_n
+   finally:
+      Monitor.Exit(__throttle_lock)
+
+
+# =============================================================================
+def get_thread_query_count_n():
+   '''
+   Returns the total number of queries that have been sent to comicvine by 
+   the calling thread so far.  This function is threadsafe.
+   '''
+   Monitor.Enter(__throttle_lock)
+   try:
+      return __thread_query_counts.get(Thread.CurrentThread.ManagedThreadId, 0)
+   finally:
+      Monitor.Exit(__throttle_lock)
+
+
+# =============================================================================
+def get_query_wait_ms():
+   '''
+   Returns the total number of milliseconds that queries (on any thread) have
+   spent waiting in wait_until_ready() so far.  This function is threadsafe.
+   '''
+   Monitor.Enter(__throttle_lock)
+   try:
+      return __query_wait_ms
+   finally:
+      Monitor.Exit(__throttle_lock)
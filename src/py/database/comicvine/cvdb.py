@@ -15,6 +15,7 @@ import log
 import utils
 from utils import is_string, sstr 
 from dbmodels import IssueRef, SeriesRef, Issue
+from pipeline import concurrent_map
 from resources import Resources
 import cvimprints
 
@@ -38,6 +39,14 @@ __max_search_results = 100
 # it is set when calling _initialize().
 __api_key = ""
 
+# the patterns that _parse_key_tag looks for: the current key tag format, and
+# the old one.  they're compiled once, since they're used for every book.
+__KEY_TAG_RE = re.compile(r'(?i)CVDB(\d{1,})')
+__OLD_KEY_TAG_RE = re.compile(r'(?i)ComicVine.?\[(\d{1,})')
+
+# the number of pages of results (after the first) that we request at once
+__PAGE_WORKERS_N = 3
+
 
 # =============================================================================
 def _initialize(**kwargs):
@@ -66,6 +75,30 @@ def _get_db_name_s():
    return "ComicVine";
 
 
+# =============================================================================
+def _get_query_count_n():
+   ''' ComicVine implementation of the identically named method in the db.py '''
+   return cvconnection.get_query_count_n()
+
+
+# =============================================================================
+def _get_thread_query_count_n():
+   ''' ComicVine implementation of the identically named method in the db.py '''
+   return cvconnection.get_thread_query_count_n()
+
+
+# =============================================================================
+def _get_throttle_wait_ms():
+   ''' ComicVine implementation of the identically named method in the db.py '''
+   return cvconnection.get_query_wait_ms()
+
+
+# =============================================================================
+def _time_until_ready_ms():
+   ''' ComicVine implementation of the identically named method in the db.py '''
+   return cvconnection.time_until_ready_ms()
+
+
 # =============================================================================
 def _create_key_tag_s(issue_key):
    ''' ComicVine implementation of the identically named method in the db.py '''
@@ -80,17 +113,31 @@ def _create_key_tag_s(issue_key):
 def _parse_key_tag(text_s):
    ''' ComicVine implementation of the identically named method in the db.py '''
    
-   tag_found = re.search(r'(?i)CVDB(\d{1,})', text_s)
+   tag_found = __KEY_TAG_RE.search(text_s)
    if not tag_found:
-      tag_found = re.search(r'(?i)ComicVine.?\[(\d{1,})', text_s); # old format!
+      tag_found = __OLD_KEY_TAG_RE.search(text_s) # old format!
    return int(tag_found.group(1).lower()) if tag_found else None
 
 
 # =============================================================================
 def _check_magic_file(path_s):
    ''' ComicVine implementation of the identically named method in the db.py '''
-   series_ref = None
+   file_s, url_s = _read_magic_file(path_s)
+   series_ref = __url_to_seriesref(url_s) if url_s else None
+   if file_s and not series_ref:
+      log.debug("ignoring bad cvinfo file: ", sstr(file_s))
+   return series_ref # may be None!
+
+
+# =============================================================================
+def _read_magic_file(path_s):
+   '''
+   Finds the cvinfo file (see _check_magic_file) for the given path, and reads
+   in its contents.  Returns a tuple containing the path of the file that was
+   found and its contents, either or both of which may be None.
+   '''
    file_s = None
+   line = None
    try:
       # 1. get the directory to search for a cvinfo file in, or None
       dir_s = path_s if path_s and Directory.Exists(path_s) else \
@@ -110,18 +157,14 @@ def _check_magic_file(path_s):
             with StreamReader(file_s, Encoding.UTF8, False) as sr:
                line = sr.ReadToEnd()
                line = line.strip() if line else line
-               series_ref = __url_to_seriesref(line)
    except:
       log.debug_exc("bad cvinfo file: " + sstr(file_s))
       
-   if file_s and not series_ref:
-      log.debug("ignoring bad cvinfo file: ", sstr(file_s))
-
-   return series_ref # may be None!
+   return file_s, line
 
 
 # =============================================================================
-def _query_series_refs(search_terms_s, callback_function):
+def _query_series_refs(search_terms_s, callback_function, series_filter):
    ''' ComicVine implementation of the identically named method in the db.py '''
    
    series_refs = set()
@@ -139,27 +182,95 @@ def _query_series_refs(search_terms_s, callback_function):
       
       # 3. if that didn't work, search comicvine directly
       if not series_refs:
-         series_refs = __query_series_refs(search_s, callback_function)
+         series_refs = __query_series_refs(
+            search_s, callback_function, series_filter)
       
       # 4. if that didn't work, cleanup terms more aggressively and try again
       if not series_refs:
          altsearch_s = __cleanup_search_terms(search_s, True);
          if search_terms_s and altsearch_s != search_s:
-            series_refs = __query_series_refs(altsearch_s, callback_function)
+            series_refs = __query_series_refs(
+               altsearch_s, callback_function, series_filter)
             
    return series_refs # may be empty if nothing worked
 
 
 # =============================================================================
-def __query_series_refs(search_terms_s, callback_function):
-   ''' A private implementation of the public method with the same name. '''
+def _query_series_refs_iter(search_terms_s, series_filter):
+   ''' ComicVine implementation of the identically named method in the db.py '''
+   
+   # this follows exactly the same steps as _query_series_refs, above
+   search_s = __cleanup_search_terms(search_terms_s, False)
+   if search_s:
+      series_ref = __url_to_seriesref(search_terms_s)
+      if series_ref:
+         yield [series_ref]
+      else:
+         found_b = False
+         pages = __iter_series_pages(search_s, series_filter)
+         try:
+            for page_refs, page_n, pages_n in pages: #@UnusedVariable
+               found_b = found_b or len(page_refs) > 0
+               yield page_refs
+         finally:
+            pages.close() # in case this generator is closed early
+         
+         if not found_b:
+            altsearch_s = __cleanup_search_terms(search_s, True);
+            if search_terms_s and altsearch_s != search_s:
+               pages = __iter_series_pages(altsearch_s, series_filter)
+               try:
+                  for page_refs, page_n, pages_n in pages: #@UnusedVariable
+                     yield page_refs
+               finally:
+                  pages.close()
+   
 
-   global __max_search_results
+# =============================================================================
+def __query_series_refs(search_terms_s, callback_function, series_filter):
+   ''' A private implementation of the public method with the same name. '''
 
-   cancelled_b = [False]
    series_refs = set()
+   pages = __iter_series_pages(search_terms_s, series_filter)
+   try:
+      for page_refs, page_n, pages_n in pages:
+         series_refs.update(page_refs)
+         
+         # do a callback for each page of results, but only if there's more 
+         # than one page.  the callback may cancel the whole search. 
+         if pages_n > 1 and page_n < pages_n and \
+               callback_function(len(series_refs), pages_n - 1):
+            return set() 
+   finally:
+      pages.close() # don't leave any page requests running
+      
+   return series_refs   
+
+
+# =============================================================================
+def __iter_series_pages(search_terms_s, series_filter):
+   ''' 
+   A generator that searches comicvine for the given search terms, one page of
+   results at a time.  For each page, it yields a tuple containing:
+        a list: the new SeriesRefs on that page (may be empty)
+        an integer: the number of that page (starting at 1)
+        an integer: the total number of pages that are expected
+        
+   'series_filter' is an optional function that takes a SeriesRef and returns
+   whether the caller wants it.  Unwanted SeriesRefs are never yielded and
+   don't count towards __max_search_results, so with a filter we can usually
+   stop requesting pages long before we run out of them.  
+   '''
+
+   global __max_search_results
+   RESULTS_PAGE_SIZE = 100
    
-   # 1. do the initial query, record how many results in total we're getting
+   # 1. plan the search.  ideally, we'd push the filter to comicvine and never
+   #    download unwanted results at all, but its 'search' api can't filter by
+   #    publisher or start year.  so instead we filter each page as it arrives.  
+   series_filter = series_filter if series_filter else lambda ref: True
+   
+   # 2. do the initial query, record how many results in total we're getting
    num_results_n = 0
    if search_terms_s and search_terms_s.strip():
       dom = cvconnection._query_series_ids_dom(__api_key, search_terms_s, 1)
@@ -168,69 +279,61 @@ def __query_series_refs(search_terms_s, callback_function):
          num_results_n = 0 # bug 329 
    
    if num_results_n > 0:
-
-      # 2. convert the results of the initial query to SeriesRefs and then add
-      #    them to the returned list. notice that the dom could contain single 
-      #    volume OR a list of volumes in its 'volume' variable.  
-      if not isinstance(dom.results.volume, list):
-         if len(series_refs) < __max_search_results:
-            series_refs.add( __volume_to_seriesref(dom.results.volume) )
-      else:
-         for volume in dom.results.volume:
-            if len(series_refs) < __max_search_results:
-               series_refs.add( __volume_to_seriesref(volume) )
-
-         # 3. if there were more than 100 results, we'll have to do some more 
-         #    queries now to get the rest of them
-         RESULTS_PAGE_SIZE = 100
-         iteration = RESULTS_PAGE_SIZE
-         if iteration < num_results_n:
-            num_remaining_pages = num_results_n // RESULTS_PAGE_SIZE
+      series_refs = set()
+      pages_n = (num_results_n + RESULTS_PAGE_SIZE - 1) // RESULTS_PAGE_SIZE 
+      page_n = 1
+      filtered_n = 0
+      
+      # the pages that we'll need even if nothing gets filtered out are 
+      # requested several at a time; any more are requested one at a time.
+      query_page = lambda n: \
+         cvconnection._query_series_ids_dom(__api_key, search_terms_s, n)
+      needed_n = min( pages_n, 
+         (__max_search_results + RESULTS_PAGE_SIZE - 1) // RESULTS_PAGE_SIZE )
+      doms = concurrent_map(query_page, range(2, needed_n+1), __PAGE_WORKERS_N)
+      try:
+         while True:
             
-            # 3a. do a callback for the first results (initial query)...
-            cancelled_b[0] = callback_function(
-               iteration, num_remaining_pages)
-
-            while iteration < num_results_n and \
-                  len(series_refs) < __max_search_results and \
-                  not cancelled_b[0]:
-
-               # 4. query for the next batch of results, in a new dom
-               dom = cvconnection._query_series_ids_dom(__api_key,
-                  search_terms_s, iteration//RESULTS_PAGE_SIZE+1)
-               iteration += RESULTS_PAGE_SIZE
-               
-               # 4a. do a callback for the most recent batch of results
-               cancelled_b[0] = callback_function(
-                  iteration, num_remaining_pages)
-
-               if "number_of_page_results" not in dom.__dict__ or \
-                     int(dom.number_of_page_results) < 1 or \
-                        not "volume" in dom.results.__dict__:
-                  log.debug("WARNING: got empty results page") # issue 33, 396
-               else:
-                  # 5. convert the current batch of results into SeriesRefs,
-                  #    and then add them to the returned list.  Again, the dom
-                  #    could contain a single volume, OR a list.
-                  if not isinstance(dom.results.volume, list):
-                     if len(series_refs) < __max_search_results:
-                        series_refs.add(
-                           __volume_to_seriesref(dom.results.volume))
-                  else:
-                     for volume in dom.results.volume:
-                        if len(series_refs) < __max_search_results:
-                           series_refs.add( __volume_to_seriesref(volume) )
-                        
-   # 6. Done.  series_refs now contained whatever SeriesRefs we could find
-   if not cancelled_b[0] and len( series_refs ) < num_results_n:
-      log.debug("...too many matches, only getting ",
-                "the first ", __max_search_results )
-
-   return set() if cancelled_b[0] else series_refs   
+            # 3. convert the results in the current dom to SeriesRefs, and 
+            #    yield them. notice that the dom could contain single volume 
+            #    OR a list of volumes in its 'volume' variable.  
+            page_refs = []
+            if page_n > 1 and ("number_of_page_results" not in dom.__dict__ \
+                  or int(dom.number_of_page_results) < 1 \
+                  or not "volume" in dom.results.__dict__):
+               log.debug("WARNING: got empty results page") # issue 33, 396
+            else:
+               for volume in __as_list(dom.results.volume):
+                  if len(series_refs) < __max_search_results:
+                     series_ref = _volume_to_seriesref(volume)
+                     if not series_filter(series_ref):
+                        filtered_n += 1
+                     elif series_ref not in series_refs:
+                        series_refs.add(series_ref)
+                        page_refs.append(series_ref)
+            yield page_refs, page_n, pages_n
+            
+            # 4. if there were more than 100 results, we'll have to do some 
+            #    more queries now to get the rest of them (or at least until
+            #    we have as many wanted results as we're allowed to return)
+            if page_n >= pages_n or len(series_refs) >= __max_search_results:
+               break
+            page_n += 1
+            dom = next(doms) if page_n <= needed_n else query_page(page_n)
+      finally:
+         doms.close()
+         
+         # 5. Done.  report how many requests this search took, compared to 
+         #    how many it would have taken to download every page of results
+         log.debug("...requested ", page_n, " of ", pages_n, 
+            " pages of results (", filtered_n, " results were filtered out)")
+         if len(series_refs) >= __max_search_results and page_n < pages_n:
+            log.debug("...too many matches, only getting ",
+                      "the first ", __max_search_results )
 
    
 # ==========================================================================   
-def __volume_to_seriesref(volume):
+def _volume_to_seriesref(volume):
    ''' Converts a cvdb "volume" dom element into a SeriesRef. '''
    publisher = '' if len(volume.publisher.__dict__) <= 1 else \
       volume.publisher.name
@@ -279,7 +382,7 @@ def __url_to_seriesref(url_s):
             dom = cvconnection._query_series_details_dom(__api_key, seriesid_s)
             num_results_n = int(dom.number_of_total_results)
             if num_results_n == 1:
-               series_ref = __volume_to_seriesref(dom.results)
+               series_ref = _volume_to_seriesref(dom.results)
          except:
             pass # happens when the user enters an non-existent key
 
@@ -338,10 +441,10 @@ def _query_issue_refs(series_ref, callback_function=lambda x : False):
       #    them to the returned set. notice that the dom could contain single 
       #    issue OR a list of issues in its 'issue' variable.  
       if not isinstance(dom.results.issue, list):
-         issue_refs.add( __issue_to_issueref(dom.results.issue) )
+         issue_refs.add( _issue_to_issueref(dom.results.issue) )
       else:
          for issue in dom.results.issue:
-            issue_refs.add( __issue_to_issueref(issue) )
+            issue_refs.add( _issue_to_issueref(issue) )
 
          # 3. if there were more than 100 results, we'll have to do some more 
          #    queries now to get the rest of them
@@ -352,34 +455,78 @@ def _query_issue_refs(series_ref, callback_function=lambda x : False):
             # 3a. do a callback for the first results (initial query)...
             cancelled_b[0] = callback_function( float(iteration)/num_results_n )
 
-            while iteration < num_results_n and not cancelled_b[0]:
-               # 4. query for the next batch of results, in a new dom
-               dom = cvconnection._query_issue_ids_dom(__api_key, 
-                  sstr(series_id_n), iteration//RESULTS_PAGE_SIZE+1)
-               iteration += RESULTS_PAGE_SIZE
-               
-               # 4a. do a callback for the most recent batch of results
-               cancelled_b[0] =callback_function(float(iteration)/num_results_n)
-
-               if int(dom.number_of_page_results) < 1:
-                  log.debug("WARNING: got empty results page")
-               else:
-                  # 5. convert the current batch of results into IssueRefs,
-                  #    and then add them to the returned list.  Again, the dom
-                  #    could contain a single issue, OR a list.
-                  if not isinstance(dom.results.issue, list):
-                     issue_refs.add(__issue_to_issueref(dom.results.issue))
+            # 4. query for the rest of the batches of results, several at a 
+            #    time, each in a new dom (they still arrive here in order) 
+            pages_n = (num_results_n + RESULTS_PAGE_SIZE-1) // RESULTS_PAGE_SIZE
+            query_page = lambda n: cvconnection._query_issue_ids_dom(
+               __api_key, sstr(series_id_n), n)
+            doms = concurrent_map(query_page, range(2, pages_n+1), 
+               __PAGE_WORKERS_N) 
+            try:
+               for dom in doms:
+                  if cancelled_b[0]:
+                     break
+                  iteration += RESULTS_PAGE_SIZE
+                  
+                  # 4a. do a callback for the most recent batch of results
+                  cancelled_b[0] = \
+                     callback_function(float(iteration)/num_results_n)
+   
+                  if int(dom.number_of_page_results) < 1:
+                     log.debug("WARNING: got empty results page")
                   else:
-                     for issue in dom.results.issue:
-                        issue_refs.add( __issue_to_issueref(issue) )
+                     # 5. convert the current batch of results into IssueRefs,
+                     #    and then add them to the returned list.  Again, the 
+                     #    dom could contain a single issue, OR a list.
+                     if not isinstance(dom.results.issue, list):
+                        issue_refs.add(_issue_to_issueref(dom.results.issue))
+                     else:
+                        for issue in dom.results.issue:
+                           issue_refs.add( _issue_to_issueref(issue) )
+            finally:
+               doms.close()
                         
    # 6. Done.  issue_refs now contained whatever IssueRefs we could find
    return set() if cancelled_b[0] else issue_refs
 
 
 
+# =============================================================================
+def _query_issue_refs_bulk(series_refs):
+   ''' ComicVine implementation of the identically named method in the db.py '''
+   
+   # 1. comicvine lets us ask for the issues in many series in one query, as
+   #    long as the filter (and so the url) doesn't get too long.
+   SERIES_PER_QUERY = 50
+   RESULTS_PAGE_SIZE = 100
+   series_ids_sl = sorted(set([sstr(ref.series_key) for ref in series_refs]))
+   issue_refs = dict([(id_s, set()) for id_s in series_ids_sl])
+   
+   for i in range(0, len(series_ids_sl), SERIES_PER_QUERY):
+      # 2. get every page of results for the next group of series...
+      ids_sl = series_ids_sl[i:i+SERIES_PER_QUERY]
+      page_n = 1
+      pages_n = 1
+      while page_n <= pages_n:
+         dom = cvconnection._query_issue_ids_bulk_dom(__api_key, ids_sl, page_n)
+         num_results_n = int(dom.number_of_total_results)
+         pages_n = (num_results_n + RESULTS_PAGE_SIZE - 1) // RESULTS_PAGE_SIZE
+         
+         # 3. ...and split the results back up into each issue's own series
+         if int(dom.number_of_page_results) > 0:
+            for issue in __as_list(dom.results.issue):
+               id_s = sstr(issue.volume.id)
+               if id_s in issue_refs:
+                  issue_refs[id_s].add( _issue_to_issueref(issue) )
+         page_n += 1
+      log.debug("...found issues for ", len(ids_sl), " series in ", 
+         max(1, pages_n), " requests")
+         
+   return dict([(ref, issue_refs[sstr(ref.series_key)]) for ref in series_refs])
+
+
 # ==========================================================================   
-def __issue_to_issueref(issue):
+def _issue_to_issueref(issue):
    ''' Converts a cvdb "issue" dom element into an IssueRef. '''
    issue_num_s = issue.issue_number
    issue_num_s = issue_num_s.strip() if is_string(issue_num_s) else ''
@@ -407,7 +554,7 @@ def query_issue_ref(series_ref, issue_num_s):
                   __api_key, series_key, issue_num_s)
          num_results_n = int(dom.number_of_total_results) if dom else 0
          
-   return __issue_to_issueref(dom.results.issue) if num_results_n==1 else None 
+   return _issue_to_issueref(dom.results.issue) if num_results_n==1 else None 
 
 
 # =============================================================================
@@ -428,6 +575,24 @@ def __alternate_issue_num_s(issue_num_s):
       issue_num_s = issue_num_s.replace(r'\.750*[^0-9]*$', '¾')
    return issue_num_s
 
+# =============================================================================
+def _query_issue_updates(issue_keys):
+   ''' ComicVine implementation of the identically named method in the db.py '''
+   
+   # comicvine lets us ask about up to 100 issues (one page) per query
+   PAGE_SIZE = 100
+   issue_ids_sl = sorted(set([sstr(key) for key in issue_keys]))
+   updates = {}
+   for i in range(0, len(issue_ids_sl), PAGE_SIZE):
+      dom = cvconnection._query_issue_updates_dom(
+         __api_key, issue_ids_sl[i:i+PAGE_SIZE])
+      if int(dom.number_of_page_results) > 0:
+         for issue in __as_list(dom.results.issue):
+            if is_string(issue.date_last_updated):
+               updates[sstr(issue.id)] = issue.date_last_updated.strip()
+   return updates
+
+
 # =============================================================================
 def _query_image( ref, lasttry = False ):
    ''' ComicVine implementation of the identically named method in the db.py '''
@@ -472,14 +637,21 @@ def _query_image( ref, lasttry = False ):
 
 
 # =============================================================================
-def _query_issue(issue_ref, slow_data):
-   ''' ComicVine implementation of the identically named method in the db.py '''
+def _query_issue(issue_ref, slow_data, dom=None):
+   ''' 
+   ComicVine implementation of the identically named method in the db.py 
+   
+   If the ComicVine issue details dom for the given issue is already available 
+   (i.e. it was saved in a local mirror; see mirrordb) pass it in, and it will
+   be parsed without querying ComicVine for it again.
+   '''
    
    # interesting: can we implement a cache here?  could speed things up...
    issue = Issue(issue_ref)
    
-   dom = cvconnection._query_issue_details_dom(
-            __api_key, sstr(issue_ref.issue_key))
+   if dom is None:
+      dom = cvconnection._query_issue_details_dom(
+               __api_key, sstr(issue_ref.issue_key))
    __issue_parse_simple_stuff(issue, dom)
    __issue_parse_series_details(issue, dom)
    __issue_parse_story_credits(issue, dom)
@@ -493,6 +665,19 @@ def _query_issue(issue_ref, slow_data):
    return issue
 
 
+#===========================================================================
+def _remember_series_details(series_ref):
+   '''
+   Remembers the start year and publisher of the given SeriesRef, so that 
+   _query_issue won't have to ask ComicVine for them when it parses the details
+   of any issue in that series.
+   '''
+   if __series_details_cache == None:
+      raise Exception(__name__ + " module isn't initialized!")
+   __series_details_cache[sstr(series_ref.series_key)] = \
+      (series_ref.volume_year_n, series_ref.publisher_s)
+
+
 #===========================================================================
 def __issue_parse_simple_stuff(issue, dom):
    ''' Parses in the 'easy' parts of the DOM '''
@@ -510,6 +695,9 @@ def __issue_parse_simple_stuff(issue, dom):
       issue.webpage_s = dom.results.site_detail_url
    if is_string(dom.results.name):
       issue.title_s = dom.results.name.strip();
+   if "date_last_updated" in dom.results.__dict__ and \
+         is_string(dom.results.date_last_updated):
+      issue.updated_s = dom.results.date_last_updated
       
    # grab the published (front cover) date
    if "cover_date" in dom.results.__dict__ and \
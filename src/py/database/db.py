@@ -15,17 +15,78 @@ source, and therefore may be quite slow and occassionally unreliable.
 '''
 
 import re
+import clr
 import cvdb
+import log
+import mirrordb
+import seriesindex
 import utils
+from dbutils import IssueNumberIndex
+from resources import Resources
 
+clr.AddReference('System')
+from System.Threading import Monitor
 
 # a limited-size cache for storing the results of SeriesRef searches
 # maps 'search terms string' -> 'list of SeriesRefs objects'
 __series_ref_cache = None
 
+# the search terms in __series_ref_cache, from oldest to newest
+__series_ref_cache_order = None
+
+# the maximum number of searches that __series_ref_cache may hold at once
+__SERIES_REF_CACHE_SIZE = 20
+
 # this cache is used to speed up query_issue_refs.
+# maps SeriesRef -> set of all the IssueRefs in that series
 __issue_refs_cache = None
 
+# the SeriesRefs in __issue_refs_cache, from oldest to newest
+__issue_refs_cache_order = None
+
+# the maximum number of IssueRefs (in all series) that __issue_refs_cache may
+# hold at once.  one long series can easily have over a thousand issues.
+__ISSUE_REFS_CACHE_SIZE = 5000
+
+# this cache is used to speed up query_issue_ref.  failed lookups (which may
+# just be network problems) aren't cached.
+# maps (SeriesRef, issue number string) -> IssueRef
+__issue_ref_cache = None
+
+# the keys in __issue_ref_cache, from oldest to newest
+__issue_ref_cache_order = None
+
+# the maximum number of IssueRefs that __issue_ref_cache may hold at once
+__ISSUE_REF_CACHE_SIZE = 1000
+
+# indexes all the IssueRefs in each series in __issue_refs_cache, so that
+# query_issue_ref can find issues in those series without querying. 
+# maps SeriesRef -> IssueNumberIndex
+__issue_indices = None
+
+# the dates that the database last changed each issue, as reported by the most
+# recent query_issue_updates() that included that issue.  query_issue uses 
+# these to recognize out of date issue details in the mirror database.
+# maps issue key (as a string) -> date string (see Issue.updated_s)
+__issue_updates = None
+
+# maps search terms -> the lock object that is held while searching for them,
+# along with the number of threads that are using that lock (a 2 item list.)
+# this module may be used by several threads at once (see SeriesLookahead), 
+# and these locks stop them from running the same search at the same time.
+# a lock is removed as soon as no thread is using it.
+__search_locks = None
+
+# guards __search_locks, __issue_updates and all of the caches above
+__lock = object()
+
+# whether series searches should try the local series index (see seriesindex)
+# before searching online.  set in initialize().
+__local_search_b = False
+
+# the maximum number of results to return from the local series index
+__max_local_results_n = 100
+
 
 # =============================================================================
 def initialize(**kwargs):
@@ -37,9 +98,23 @@ def initialize(**kwargs):
    Some database implementations may have additional keyword arugments.
    '''
    
-   global __series_ref_cache, __issue_refs_cache
+   global __series_ref_cache, __series_ref_cache_order, __issue_refs_cache, \
+      __issue_refs_cache_order, __issue_ref_cache, __issue_ref_cache_order, \
+      __issue_indices, __issue_updates, __search_locks, __local_search_b, \
+      __max_local_results_n
    __series_ref_cache = {}
+   __series_ref_cache_order = []
    __issue_refs_cache = {}
+   __issue_refs_cache_order = []
+   __issue_ref_cache = {}
+   __issue_ref_cache_order = []
+   __issue_indices = {}
+   __issue_updates = {}
+   __search_locks = {}
+   __local_search_b = kwargs.get("local_series_search", False)
+   __max_local_results_n = kwargs.get("cv_maxresults", 100)
+   seriesindex.load(Resources.SERIES_INDEX_FILE)
+   mirrordb._initialize(**kwargs)
    cvdb._initialize(**kwargs)
    
 # =============================================================================
@@ -49,9 +124,20 @@ def shutdown():
    this module might be holding onto.  Be sure to call this method before 
    shutting down the application, and don't use this module after shutting down!
    '''
-   global __series_ref_cache, __issue_refs_cache
+   global __series_ref_cache, __series_ref_cache_order, __issue_refs_cache, \
+      __issue_refs_cache_order, __issue_ref_cache, __issue_ref_cache_order, \
+      __issue_indices, __issue_updates, __search_locks
    __series_ref_cache = None
+   __series_ref_cache_order = None
    __issue_refs_cache = None
+   __issue_refs_cache_order = None
+   __issue_ref_cache = None
+   __issue_ref_cache_order = None
+   __issue_indices = None
+   __issue_updates = None
+   __search_locks = None
+   seriesindex.save()
+   mirrordb._shutdown()
    cvdb._shutdown()
 
 # =============================================================================
@@ -65,6 +151,55 @@ def get_db_name_s():
    return cvdb._get_db_name_s();
 
 
+# =============================================================================
+def get_query_count_n():
+   '''
+   Returns the total number of requests that have been sent over the network
+   to the backing database (by any thread) so far.  Requests that are answered
+   by a cache or by the local mirror database are not counted, so if this
+   number doesn't change while something runs, it ran entirely offline.
+   
+   This method does not perform any database reads or writes, i.e. it's fast.
+   '''
+   return cvdb._get_query_count_n()
+
+
+# =============================================================================
+def get_thread_query_count_n():
+   '''
+   Like get_query_count_n(), but only counts the requests that were sent by
+   the calling thread, so that one thread can tell whether IT needed the 
+   network, even while other threads (i.e. a SeriesLookahead) are using it.
+   
+   This method does not perform any database reads or writes, i.e. it's fast.
+   '''
+   return cvdb._get_thread_query_count_n()
+
+
+# =============================================================================
+def get_throttle_wait_ms():
+   '''
+   Returns the total number of milliseconds that requests to the backing 
+   database (on any thread) have spent waiting for the rate limit that they 
+   all share, so far.
+   
+   This method does not perform any database reads or writes, i.e. it's fast.
+   '''
+   return cvdb._get_throttle_wait_ms()
+
+
+# =============================================================================
+def time_until_ready_ms():
+   '''
+   Returns the number of milliseconds that a request to the backing database 
+   would have to wait if it were made right now, because of the rate limit 
+   that all requests share.  Returns 0 if there's no wait.
+   
+   This method does not perform any database reads or writes, i.e. it's fast.
+   '''
+   return cvdb._time_until_ready_ms()
+
+
 # =============================================================================
 def create_key_tag_s(issue_key):
    '''
@@ -107,11 +242,13 @@ def check_magic_file(path_s):
    
    This fuction may need to access the db in order to create a SeriesRef object.
    '''
-   return cvdb._check_magic_file(path_s)
+   series_ref = mirrordb._check_magic_file(path_s)
+   return series_ref if series_ref else cvdb._check_magic_file(path_s)
 
 # =============================================================================
 def query_series_refs( search_terms_s, ignored_search_terms_sl = list(), 
-                       callback_function=lambda x,y : False ):
+                       callback_function=lambda x,y : False, 
+                       series_filter=None, local_b=True ):
    '''
    This method takes a some search terms (space separated words as a single
    string) and uses them to query the database for comic book series objects 
@@ -133,31 +270,207 @@ def query_series_refs( search_terms_s, ignored_search_terms_sl = list(),
    The function must also return a boolean indicating whether or not to CANCEL
    the search.   If this returned value is ever true, this query will
    stop immediately and return an empty set of results.
-   '''
    
-   # strip 'ignored' search terms (if any) out of the search terms string
-   ig_terms = ignored_search_terms_sl
-   if ig_terms: 
-      ig_terms = '|'.join([x.strip() for x in ig_terms if x and x.isalnum()])
-   if ig_terms: 
-      search_terms_s=re.sub(r'(?i)\b(' +ig_terms+ r')\b', '', search_terms_s)
+   Finally, you can pass in an optional 'series_filter' function (see 
+   dbutils.create_series_filter), which takes a SeriesRef and returns whether
+   or not you want it.  Unwanted SeriesRefs are never returned, and since they
+   don't count towards the maximum number of search results, the search can 
+   often finish with fewer requests to the database.  Note that the results
+   for a given set of search terms are cached, so always pass in the same 
+   filter (or no filter) for the lifetime of this module.
+   
+   Every SeriesRef that is found online is recorded in a local series index
+   (and in the mirror database, if there is one; see mirrordb.)  If 'local_b'
+   is True, this method searches the mirror database first, and then, if the
+   module was initialized with 'local_series_search' set to True, that index.
+   It only goes online if it can't find anything there.  Pass False for
+   'local_b' when the user wants a fresh search.
    
+   This function is threadsafe.  If it is called for the same search terms on
+   two threads at once, the second call waits for the first one to finish, and
+   then returns the same results (without searching again.)
+   '''
+   
+   search_terms_s = __strip_ignored_terms(search_terms_s, 
+      ignored_search_terms_sl)
    
    # use caching here for when this method gets called repeatedly with the same
    # search term, which happens often if the user is jumping back and forth 
    # between the series and issues dialogs, for example.
-   global __series_ref_cache
    if __series_ref_cache == None: 
       raise Exception(__name__ + " module isn't initialized!")
    
-   if search_terms_s in __series_ref_cache:
-      return list(__series_ref_cache[search_terms_s])
+   if local_b:
+      series_refs = __search_local_index(search_terms_s, series_filter)
+      if series_refs:
+         return series_refs
+   
+   search_lock = __get_search_lock(search_terms_s)
+   Monitor.Enter(search_lock)
+   try:
+      if search_terms_s in __series_ref_cache:
+         return list(__series_ref_cache[search_terms_s])
+      else:
+         # don't cache the results of a cancelled search; they're incomplete
+         cancelled = [False]
+         def callback(num_matches_n, expected_callbacks_n):
+            cancelled[0] = callback_function(num_matches_n,expected_callbacks_n)
+            return cancelled[0]
+         series_refs = cvdb._query_series_refs(
+            search_terms_s, callback, series_filter)
+         if not cancelled[0]:
+            __cache_series_refs(search_terms_s, series_refs)
+         seriesindex.add(series_refs)
+         mirrordb._add_series_refs(series_refs)
+         return series_refs
+   finally:
+      Monitor.Exit(search_lock)
+      __release_search_lock(search_terms_s)
+      
+
+# =============================================================================
+def query_series_refs_iter( search_terms_s, ignored_search_terms_sl = list(),
+                            series_filter=None, local_b=True ):
+   '''
+   This method is a streaming version of query_series_refs(), above.  It takes
+   the same search terms, 'ignored' search terms, filter and 'local_b' flag, 
+   but instead of returning all of the matching SeriesRefs at once, it returns
+   a generator that yields them in lists (batches), one batch for each page of
+   results that arrives from the database.  Some batches may be empty.  
+   
+   Only a generator that runs all the way to the end has its results cached;
+   you can stop iterating at any time (to cancel the search) but then nothing 
+   is cached.   Like all generators, the returned one may be advanced from 
+   any thread, but it must not be advanced from two threads at the same time.
+   '''
+   
+   search_terms_s = __strip_ignored_terms(search_terms_s, 
+      ignored_search_terms_sl)
+   if __series_ref_cache == None: 
+      raise Exception(__name__ + " module isn't initialized!")
+   
+   local_refs = __search_local_index(search_terms_s, series_filter) \
+      if local_b else None
+   if local_refs:
+      yield local_refs
+      return
+
+   # if someone else is searching for these terms right now (i.e. a call to
+   # query_series_refs on another thread), wait for them to finish so that
+   # we can use their cached results instead of searching a second time.
+   search_lock = __get_search_lock(search_terms_s)
+   Monitor.Enter(search_lock)
+   Monitor.Exit(search_lock)
+   __release_search_lock(search_terms_s)
+   
+   Monitor.Enter(__lock)
+   try:
+      cached_refs = __series_ref_cache.get(search_terms_s)
+   finally:
+      Monitor.Exit(__lock)
+
+   if cached_refs is not None:
+      yield list(cached_refs)
    else:
-      series_refs = cvdb._query_series_refs(search_terms_s, callback_function)
-      if len(__series_ref_cache ) > 10:
-         __series_ref_cache = {} # keep the cache from ever getting too big
+      series_refs = []
+      batches = cvdb._query_series_refs_iter(search_terms_s, series_filter)
+      try:
+         for batch in batches:
+            series_refs.extend(batch)
+            seriesindex.add(batch)
+            mirrordb._add_series_refs(batch)
+            yield batch
+      finally:
+         batches.close() # in case this generator is closed early
+      __cache_series_refs(search_terms_s, series_refs)
+      
+
+# =============================================================================
+def __search_local_index(search_terms_s, series_filter):
+   ''' 
+   Searches the mirror database and then the local series index for SeriesRefs
+   that match the given search terms and pass the given filter (if any).  
+   Returns them in a list, which is always empty unless there is a mirror
+   database, or this module was initialized with 'local_series_search'.
+   '''
+   
+   series_refs = mirrordb._query_series_refs(search_terms_s, series_filter)
+   series_refs = series_refs if series_refs else []
+   if not series_refs and __local_search_b:
+      series_refs = seriesindex.search(search_terms_s)
+      if series_filter:
+         series_refs = [ref for ref in series_refs if series_filter(ref)]
+      series_refs = series_refs[:__max_local_results_n]
+      if series_refs:
+         log.debug("...found ", len(series_refs), 
+            " results in the local series index")
+   return series_refs
+
+
+# =============================================================================
+def __strip_ignored_terms(search_terms_s, ignored_search_terms_sl):
+   ''' Returns the given search terms, minus any of the 'ignored' terms. '''
+   
+   ig_terms = ignored_search_terms_sl
+   if ig_terms: 
+      ig_terms = '|'.join([x.strip() for x in ig_terms if x and x.isalnum()])
+   if ig_terms: 
+      search_terms_s=re.sub(r'(?i)\b(' +ig_terms+ r')\b', '', search_terms_s)
+   return search_terms_s
+      
+
+# =============================================================================
+def __get_search_lock(search_terms_s):
+   '''
+   Returns the lock object to hold while searching for the given terms.  Call
+   __release_search_lock for the same terms when you are done with it.
+   '''
+   
+   Monitor.Enter(__lock)
+   try:
+      if search_terms_s not in __search_locks:
+         __search_locks[search_terms_s] = [object(), 0]
+      __search_locks[search_terms_s][1] += 1
+      return __search_locks[search_terms_s][0]
+   finally:
+      Monitor.Exit(__lock)
+   
+   
+# =============================================================================
+def __release_search_lock(search_terms_s):
+   '''
+   Releases the lock that __get_search_lock returned for the given terms, and
+   removes it if no other thread is using it.
+   '''
+   
+   Monitor.Enter(__lock)
+   try:
+      search_lock = __search_locks.get(search_terms_s) \
+         if __search_locks is not None else None
+      if search_lock:
+         search_lock[1] -= 1
+         if search_lock[1] <= 0:
+            del __search_locks[search_terms_s]
+   finally:
+      Monitor.Exit(__lock)
+   
+   
+# =============================================================================
+def __cache_series_refs(search_terms_s, series_refs):
+   ''' 
+   Adds the given search results to __series_ref_cache, evicting the oldest
+   results if the cache is full.  
+   '''
+   
+   Monitor.Enter(__lock)
+   try:
+      if search_terms_s not in __series_ref_cache:
+         __series_ref_cache_order.append(search_terms_s)
+         while len(__series_ref_cache_order) > __SERIES_REF_CACHE_SIZE:
+            del __series_ref_cache[__series_ref_cache_order.pop(0)]
       __series_ref_cache[search_terms_s] = list(series_refs)
-      return series_refs
+   finally:
+      Monitor.Exit(__lock)
 
 
 # =============================================================================
@@ -183,20 +496,97 @@ def query_issue_refs(series_ref, callback_function=lambda x : False):
    # use caching here for when this method is called serveral times in a row
    # for the same series ref.  this happens all the time if the user is 
    # scraping a bunch of comics from the same series all at once.
-   global __issue_refs_cache
    if __issue_refs_cache == None:
       raise Exception(__name__ + " module isn't initialized!")
    
-   issue_refs = set()
-   if series_ref in __issue_refs_cache:
-      issue_refs = set(__issue_refs_cache[series_ref]) 
-   else: 
-      __issue_refs_cache = {} # only keep one element in cache (else too big!)
-      issue_refs = cvdb._query_issue_refs(series_ref, callback_function)
-      __issue_refs_cache[series_ref] = set(issue_refs) 
+   issue_refs = __get_cached_issue_refs(series_ref)
+   if issue_refs is None: 
+      issue_refs = mirrordb._query_issue_refs(series_ref)
+      if issue_refs is None:
+         issue_refs = cvdb._query_issue_refs(series_ref, callback_function)
+         mirrordb._add_issue_refs(series_ref, issue_refs, True)
+      __cache_issue_refs(series_ref, issue_refs)
    return issue_refs
 
 
+# =============================================================================
+def preload_issue_refs(series_refs):
+   '''
+   This method takes a list of SeriesRef objects, and gets all of the IssueRefs
+   in all of those series from the database in bulk (i.e. the issues of many 
+   series at once, in each query.)  It is much faster than calling 
+   query_issue_refs for each series when there are many short series.
+   
+   Nothing is returned; the IssueRefs are cached, so that query_issue_refs and
+   query_issue_ref can return them later without querying the database again
+   (as long as they stay in the cache.)  Series that are already cached are 
+   not loaded again.
+   '''
+   
+   if __issue_refs_cache == None:
+      raise Exception(__name__ + " module isn't initialized!")
+   
+   # 1. skip the series that are cached, or that the mirror database has
+   online_refs = []
+   for series_ref in set(series_refs):
+      if __get_cached_issue_refs(series_ref) is None:
+         issue_refs = mirrordb._query_issue_refs(series_ref)
+         if issue_refs is None:
+            online_refs.append(series_ref)
+         else:
+            __cache_issue_refs(series_ref, issue_refs)
+   
+   # 2. get the rest of them all at once
+   if online_refs:
+      bulk_issue_refs = cvdb._query_issue_refs_bulk(online_refs)
+      for series_ref, issue_refs in bulk_issue_refs.iteritems():
+         mirrordb._add_issue_refs(series_ref, issue_refs, True)
+         __cache_issue_refs(series_ref, issue_refs)
+
+
+# =============================================================================
+def __get_cached_issue_refs(series_ref):
+   ''' 
+   Returns a copy of the set of IssueRefs in __issue_refs_cache for the given
+   SeriesRef, or None if that series isn't cached.
+   '''
+   
+   Monitor.Enter(__lock)
+   try:
+      issue_refs = __issue_refs_cache.get(series_ref)
+      return None if issue_refs is None else set(issue_refs)
+   finally:
+      Monitor.Exit(__lock)
+   
+   
+# =============================================================================
+def __cache_issue_refs(series_ref, issue_refs):
+   ''' 
+   Adds the given set of all the IssueRefs in the given series to 
+   __issue_refs_cache (and indexes them in __issue_indices), evicting the 
+   oldest series if the cache holds too many IssueRefs.  Does nothing if the 
+   set is empty, since that usually means that the query was cancelled.
+   '''
+   
+   if issue_refs:
+      Monitor.Enter(__lock)
+      try:
+         if series_ref in __issue_refs_cache:
+            __issue_refs_cache_order.remove(series_ref)
+         __issue_refs_cache_order.append(series_ref)
+         __issue_refs_cache[series_ref] = set(issue_refs)
+         __issue_indices[series_ref] = IssueNumberIndex(issue_refs)
+         
+         total_n = sum([len(x) for x in __issue_refs_cache.itervalues()])
+         while total_n > __ISSUE_REFS_CACHE_SIZE and \
+               len(__issue_refs_cache_order) > 1:
+            oldest_ref = __issue_refs_cache_order.pop(0)
+            total_n -= len(__issue_refs_cache.pop(oldest_ref))
+            del __issue_indices[oldest_ref]
+      finally:
+         Monitor.Exit(__lock)
+
+
 # =============================================================================
 def query_issue_ref(series_ref, issue_num_s):
    '''
@@ -204,8 +594,49 @@ def query_issue_ref(series_ref, issue_num_s):
    representing an issue in that series.  It converts these two objects into
    a new IssueRef object if possible, or it returns None if it is not possible
    (if, for example, the issue number string doesn't match any issue.)
+   
+   If query_issue_refs() or preload_issue_refs() has recently been called for
+   the given SeriesRef, this method doesn't query the database; instead, it 
+   finds the issue number in those results (see dbutils.IssueNumberIndex).
    '''
-   return cvdb.query_issue_ref(series_ref, issue_num_s)
+   
+   # use caching here, because the same lookup is often made more than once,
+   # i.e. by the SeriesForm's cover art, the SeriesLookahead, and the engine.
+   if __issue_ref_cache == None:
+      raise Exception(__name__ + " module isn't initialized!")
+   
+   Monitor.Enter(__lock)
+   try:
+      index = __issue_indices.get(series_ref)
+   finally:
+      Monitor.Exit(__lock)
+   if index:
+      return index.find_unique(issue_num_s)
+   
+   key = (series_ref, issue_num_s)
+   Monitor.Enter(__lock)
+   try:
+      if key in __issue_ref_cache:
+         return __issue_ref_cache[key]
+   finally:
+      Monitor.Exit(__lock)
+      
+   issue_ref = mirrordb._query_issue_ref(series_ref, issue_num_s)
+   if not issue_ref:
+      issue_ref = cvdb.query_issue_ref(series_ref, issue_num_s)
+      if issue_ref:
+         mirrordb._add_issue_refs(series_ref, [issue_ref], False)
+   if issue_ref:
+      Monitor.Enter(__lock)
+      try:
+         if key not in __issue_ref_cache:
+            __issue_ref_cache_order.append(key)
+            while len(__issue_ref_cache_order) > __ISSUE_REF_CACHE_SIZE:
+               del __issue_ref_cache[__issue_ref_cache_order.pop(0)]
+         __issue_ref_cache[key] = issue_ref
+      finally:
+         Monitor.Exit(__lock)
+   return issue_ref
    
 
 # =============================================================================
@@ -219,7 +650,41 @@ def query_issue(issue_ref, slow_data=False):
    additional OPTIONAL data and add it to the Issue. 
    
    '''
-   return cvdb._query_issue(issue_ref, slow_data)
+   issue = mirrordb._query_issue(issue_ref, slow_data)
+   if issue:
+      # the mirror's details are out of date if the database has changed the
+      # issue since then (see query_issue_updates)
+      Monitor.Enter(__lock)
+      try:
+         updated_s = __issue_updates.get(utils.sstr(issue_ref.issue_key)) \
+            if __issue_updates else None
+      finally:
+         Monitor.Exit(__lock)
+      if updated_s and issue.updated_s < updated_s:
+         log.debug("...mirrored details are out of date for: ", issue_ref)
+         issue = None
+   return issue if issue else cvdb._query_issue(issue_ref, slow_data)
+
+
+# =============================================================================
+def query_issue_updates(issue_keys):
+   '''
+   This method takes a list of issue keys (i.e. IssueRef.issue_key) and asks
+   the database, in as few queries as possible, when it last changed the 
+   details of each of those issues.
+   
+   Returns a dict that maps each issue key (as a string) to the date that the
+   details of that issue were last changed (see Issue.updated_s).  Keys that 
+   the database doesn't know about are left out of the dict.
+   '''
+   issue_updates = cvdb._query_issue_updates(issue_keys) if issue_keys else {}
+   Monitor.Enter(__lock)
+   try:
+      if __issue_updates is not None:
+         __issue_updates.update(issue_updates)
+   finally:
+      Monitor.Exit(__lock)
+   return issue_updates
 
 
 # =============================================================================
@@ -257,6 +257,7 @@ class Issue(object):
       self.imprint_s = ''
       self.summary_s = ''
       self.webpage_s = '' 
+      self.updated_s = ''
       
       self.pub_day_n = -1
       self.pub_month_n = -1
@@ -343,6 +344,14 @@ class Issue(object):
       ''' called when you assign a value to 'self.webpage_s' '''   
       self.__webpage_s = '' if webpage_s == None else sstr(webpage_s)
    webpage_s = property( lambda self : self.__webpage_s, __set_webpage_s )
+   
+   
+   # when the db last changed the details of this Issue, as a string that sorts
+   # by date, i.e. 'YYYY-MM-DD HH:MM:SS'.  not None. maybe empty (unknown.)
+   def __set_updated_s(self, updated_s):
+      ''' called when you assign a value to 'self.updated_s' '''   
+      self.__updated_s = '' if updated_s == None else sstr(updated_s).strip()
+   updated_s = property( lambda self : self.__updated_s, __set_updated_s )
       
       
    # the publication day for this Issue, as an int. not None. 
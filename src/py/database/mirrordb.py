@@ -0,0 +1,522 @@
+#coding: utf-8
+'''
+This module is a second, local backend for the db module.  It keeps a mirror
+of (some part of) the ComicVine database in a SQLite database file, and it can
+answer most of the same queries that the cvdb module answers, but at disk
+speed, and without making any requests to ComicVine at all.
+
+The mirror is filled in two ways:  by bulk importing a ComicVine dataset (see
+import_dataset), and by "topping up" with whatever the db module finds online
+(see _add_series_refs and _add_issue_refs.)  Whenever the mirror can't answer
+a query, its query functions return None, and the db module goes online.
+
+SQLite is not part of every IronPython installation.  If it isn't available,
+this module quietly disables itself, and all of its queries return None.
+
+This module is threadsafe.
+
+@author: Cory Banack
+'''
+
+import re
+import clr
+import cvconnection
+import cvdb
+import log
+from dbmodels import IssueRef, SeriesRef
+from dbutils import IssueNumberIndex
+from utils import sstr
+
+clr.AddReference('System')
+from System import DateTime
+from System.IO import Directory, File, SearchOption
+from System.Text import Encoding
+from System.Threading import Monitor
+
+try:
+   import sqlite3
+except ImportError:
+   sqlite3 = None # IronPython.SQLite isn't installed; the mirror is disabled
+
+# the tables (and indexes) in the mirror database.  a volume is 'complete' if
+# the mirror contains every one of its issues, so it can answer issue queries.
+# 'completed_ms' is when the volume was last made complete (see __put_volume.)
+__SCHEMA_SL = [
+   "CREATE TABLE IF NOT EXISTS volumes (id INTEGER PRIMARY KEY, name TEXT, " +
+      "start_year INTEGER, publisher TEXT, count_of_issues INTEGER, " +
+      "image_url TEXT, complete INTEGER NOT NULL DEFAULT 0, " +
+      "completed_ms INTEGER NOT NULL DEFAULT 0)",
+   "CREATE TABLE IF NOT EXISTS volume_words (word TEXT NOT NULL, " +
+      "volume_id INTEGER NOT NULL, PRIMARY KEY (word, volume_id))",
+   "CREATE TABLE IF NOT EXISTS issues (id INTEGER PRIMARY KEY, " +
+      "volume_id INTEGER NOT NULL, issue_number TEXT NOT NULL, " +
+      "number_key TEXT NOT NULL, name TEXT, image_url TEXT, details_xml TEXT)",
+   "CREATE INDEX IF NOT EXISTS issues_by_volume " +
+      "ON issues (volume_id, number_key)",
+]
+
+# the number of days that a complete volume is trusted for.  after that, new
+# issues may have been added to it online, so it has to be completed again.
+__COMPLETE_DAYS_N = 7
+
+# the number of dataset files to import between each commit
+__IMPORT_BATCH_N = 500
+
+# the open connection to the mirror database, or None if the mirror is disabled
+__connection = None
+
+# the maximum number of results to return from a series search
+__max_search_results_n = 100
+
+# a lock that guards __connection
+__lock = object()
+
+
+# =============================================================================
+def _initialize(**kwargs):
+   '''
+   Mirror implementation of the identically named method in the db.py.  The
+   mirror is only enabled if you pass in the path of its database file, like
+   so:  _initialize(**{'mirror_database':'c:/path/to/mirror.db'})
+   The file will be created if it doesn't already exist.
+   '''
+
+   global __connection, __max_search_results_n
+   file_s = kwargs.get("mirror_database")
+   __max_search_results_n = kwargs.get("cv_maxresults", 100)
+   if file_s:
+      if not sqlite3:
+         log.debug("WARNING: SQLite isn't available; mirror is disabled")
+      else:
+         Monitor.Enter(__lock)
+         try:
+            try:
+               __connection = sqlite3.connect(file_s, check_same_thread=False)
+               for statement_s in __SCHEMA_SL:
+                  __connection.execute(statement_s)
+               columns_sl = [row[1] for row in 
+                  __connection.execute("PRAGMA table_info(volumes)")]
+               if not "completed_ms" in columns_sl:
+                  # a mirror from before volumes had 'completed_ms'; all of
+                  # its complete volumes will be treated as out of date
+                  __connection.execute("ALTER TABLE volumes ADD COLUMN " +
+                     "completed_ms INTEGER NOT NULL DEFAULT 0")
+               __connection.commit()
+               log.debug("using mirror database: ", file_s)
+            except:
+               log.debug_exc("problem opening mirror database: " + file_s)
+               __connection = None
+         finally:
+            Monitor.Exit(__lock)
+
+
+# =============================================================================
+def _shutdown():
+   ''' Mirror implementation of the identically named method in the db.py. '''
+
+   global __connection
+   Monitor.Enter(__lock)
+   try:
+      if __connection:
+         try:
+            __connection.commit()
+            __connection.close()
+         except:
+            log.debug_exc("problem closing mirror database")
+         __connection = None
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def _check_magic_file(path_s):
+   '''
+   Mirror implementation of the identically named method in the db.py.
+   Returns None if there's no magic file, or if its series isn't mirrored.
+   '''
+
+   url_s = cvdb._read_magic_file(path_s)[1]
+   if not url_s or not __connection:
+      return None
+
+   # 1. a comicvine issue url (4000-XXXXXXXX) is converted into its series id
+   match = re.match(r"^.*?\b4000-(?<num>\d{2,})\b.*$", url_s, re.I)
+   row = __fetch_one("SELECT volume_id FROM issues WHERE id=?",
+      int(match.group("num"))) if match else None
+   series_id_n = row[0] if row else None
+
+   # 2. a comicvine series url (4050-XXXXXXXX) contains its series id already
+   if not series_id_n:
+      match = re.match(r"^.*?\b(49|4050)-(?<num>\d{2,})\b.*$", url_s, re.I)
+      series_id_n = int(match.group("num")) if match else None
+
+   return __find_series_ref(series_id_n) if series_id_n else None
+
+
+# =============================================================================
+def _query_series_refs(search_terms_s, series_filter):
+   '''
+   Mirror implementation of the identically named method in the db.py.  A
+   mirrored series matches if its name contains every word in the search terms.
+   Returns None if no mirrored series match (or pass the given filter.)
+   '''
+
+   words_sl = __get_words(search_terms_s)
+   if not words_sl or not __connection:
+      return None
+
+   rows = __fetch_all("SELECT v.id, v.name, v.start_year, v.publisher, " +
+      "v.count_of_issues, v.image_url FROM volumes v " +
+      "JOIN volume_words w ON w.volume_id = v.id WHERE w.word IN (" +
+      ",".join("?" * len(words_sl)) + ") GROUP BY v.id " +
+      "HAVING COUNT(*) = ? ORDER BY v.count_of_issues DESC",
+      *(words_sl + [len(words_sl)]) )
+   series_refs = [__row_to_seriesref(row) for row in rows]
+   if series_filter:
+      series_refs = [ref for ref in series_refs if series_filter(ref)]
+   series_refs = series_refs[:__max_search_results_n]
+   if series_refs:
+      log.debug("...found ", len(series_refs), " results in mirror database")
+   return series_refs if series_refs else None
+
+
+# =============================================================================
+def _query_issue_refs(series_ref):
+   '''
+   Mirror implementation of the identically named method in the db.py.
+   Returns None unless every issue in the given series has been mirrored.  A
+   series whose mirrored issues may be out of date (because they're older than
+   __COMPLETE_DAYS_N, or because there are fewer of them than the given 
+   SeriesRef's issue count) doesn't count as mirrored.
+   '''
+
+   row = __fetch_one("SELECT completed_ms FROM volumes WHERE id=? " +
+      "AND complete=1", int(series_ref.series_key)) if __connection else None
+   if not row:
+      return None
+   if row[0] < __now_ms() - __COMPLETE_DAYS_N * 24 * 60 * 60 * 1000:
+      log.debug("...mirrored issues are out of date for: ", series_ref)
+      return None
+   rows = __fetch_all("SELECT issue_number, id, name, image_url " +
+      "FROM issues WHERE volume_id=?", int(series_ref.series_key))
+   if len(rows) < series_ref.issue_count_n:
+      log.debug("...mirrored issues are incomplete for: ", series_ref)
+      return None
+   return set([__row_to_issueref(row) for row in rows])
+
+
+# =============================================================================
+def _query_issue_ref(series_ref, issue_num_s):
+   '''
+   Mirror implementation of the identically named method in the db.py.
+   Returns None if there is no matching issue in the mirror.
+   '''
+
+   if not __connection:
+      return None
+
+   # 1. look for an exact match for the issue number
+   rows = __fetch_all("SELECT issue_number, id, name, image_url FROM issues " +
+      "WHERE volume_id=? AND number_key=?", int(series_ref.series_key),
+      __get_number_key_s(issue_num_s))
+   if len(rows) == 1:
+      return __row_to_issueref(rows[0])
+
+   # 2. no luck, so look for a looser match (i.e. '5.5' for '5½') amongst all
+   #    of the issues in the series (only if the mirror has all of them.)
+   issue_refs = _query_issue_refs(series_ref) if not rows else None
+   return IssueNumberIndex(issue_refs).find_unique(issue_num_s) \
+      if issue_refs else None
+
+
+# =============================================================================
+def _query_issue(issue_ref, slow_data):
+   '''
+   Mirror implementation of the identically named method in the db.py.
+   Returns None unless the details of the given issue have been mirrored.
+   '''
+
+   if not __connection:
+      return None
+   row = __fetch_one("SELECT details_xml, volume_id FROM issues WHERE id=?",
+      int(issue_ref.issue_key))
+   if not row or not row[0]:
+      return None
+
+   series_ref = __find_series_ref(row[1])
+   if series_ref:
+      cvdb._remember_series_details(series_ref)
+   dom = cvconnection._parse_dom(row[0])
+   return cvdb._query_issue(issue_ref, slow_data, dom)
+
+
+# =============================================================================
+def _add_series_refs(series_refs):
+   ''' Adds (or updates) the given SeriesRefs in the mirror. '''
+
+   if __connection and series_refs:
+      __write(lambda cursor: [__put_volume(cursor, series_ref)
+         for series_ref in series_refs])
+
+
+# =============================================================================
+def _add_issue_refs(series_ref, issue_refs, complete_b):
+   '''
+   Adds (or updates) the given IssueRefs, which all belong to the given
+   SeriesRef, in the mirror.  Set complete_b to True if they are ALL of the
+   IssueRefs in that series.
+   '''
+
+   if __connection and issue_refs:
+      def write(cursor):
+         __put_volume(cursor, series_ref, complete_b)
+         for issue_ref in issue_refs:
+            __put_issue(cursor, series_ref.series_key, issue_ref)
+      __write(write)
+
+
+# =============================================================================
+def import_dataset(dataset_dir_s):
+   '''
+   Imports a ComicVine dataset into the mirror.  The dataset is a directory
+   (searched recursively) full of .xml files, each of which contains a saved
+   ComicVine API response.   The following responses can be imported:
+
+     - volume details ('/volume/4050-N/' without a field_list) which include
+       the series and its complete list of issues
+     - issue details ('/issue/4000-N/') which include the issue and everything
+       needed to answer _query_issue for it
+     - series searches ('/search/?resources=volume') and issue lists
+       ('/issues/' with 'volume' in the field_list)
+
+   Any other files are skipped.  Returns the number of files imported.
+   '''
+
+   if not __connection:
+      raise Exception(__name__ + " module isn't initialized!")
+
+   files_sl = Directory.GetFiles(dataset_dir_s, "*.xml",
+      SearchOption.AllDirectories)
+   log.debug("importing ", len(files_sl), " files into mirror database...")
+   imported_n = 0
+   for i in range(0, len(files_sl), __IMPORT_BATCH_N):
+      def write(cursor):
+         batch_n = 0
+         for file_s in files_sl[i:i+__IMPORT_BATCH_N]:
+            try:
+               xml_s = File.ReadAllText(file_s, Encoding.UTF8)
+               if __import_dom(cursor, cvconnection._parse_dom(xml_s), xml_s):
+                  batch_n += 1
+               else:
+                  log.debug("...skipped unrecognized file: ", file_s)
+            except:
+               log.debug_exc("...skipped bad file: " + sstr(file_s))
+         return batch_n
+      imported_n += __write(write) or 0
+      log.debug("...imported ", imported_n, " of ", len(files_sl), " files")
+   return imported_n
+
+
+# =============================================================================
+def __import_dom(cursor, dom, xml_s):
+   '''
+   Imports the given ComicVine API response (both the xml and its parsed dom)
+   into the mirror, using the given cursor.  Returns False if the response
+   isn't a kind that can be imported, True otherwise.
+   '''
+
+   results = dom.results if "results" in dom.__dict__ else None
+   if results is None:
+      return False
+   as_list = lambda x: x if isinstance(x, list) else [x]
+
+   if "issue_number" in results.__dict__ and "volume" in results.__dict__:
+      # 1. issue details; keep the xml for _query_issue
+      __put_issue(cursor, int(results.volume.id),
+         cvdb._issue_to_issueref(results), xml_s)
+   elif "count_of_issues" in results.__dict__:
+      # 2. volume details; these list every issue in the volume, too
+      series_ref = cvdb._volume_to_seriesref(results)
+      issues = results.issues.__dict__.get("issue", []) \
+         if "issues" in results.__dict__ else None
+      __put_volume(cursor, series_ref, issues is not None)
+      for issue in as_list(issues) if issues else []:
+         __put_issue(cursor, series_ref.series_key,
+            cvdb._issue_to_issueref(issue))
+   elif "volume" in results.__dict__:
+      # 3. a page of series search results
+      for volume in as_list(results.volume):
+         __put_volume(cursor, cvdb._volume_to_seriesref(volume))
+   elif "issue" in results.__dict__:
+      # 4. a page of issues; only useful if each issue names its volume
+      issues = [x for x in as_list(results.issue) if "volume" in x.__dict__]
+      if not issues:
+         return False
+      for issue in issues:
+         __put_issue(cursor, int(issue.volume.id),
+            cvdb._issue_to_issueref(issue))
+   else:
+      return False
+   return True
+
+
+# =============================================================================
+def __put_volume(cursor, series_ref, complete_b=False):
+   '''
+   Adds (or updates) the given SeriesRef in the mirror, using the given cursor.
+   A volume that is complete stays complete (but see _query_issue_refs.)  
+   
+   The SeriesRef may be sparse (see ComicBook.series_ref), so its unknown 
+   details (no name, a year of -1, no publisher, etc.) never replace the known
+   details of a volume that is already in the mirror.
+   '''
+
+   volume_id_n = int(series_ref.series_key)
+   # a SeriesRef that was created without a name is named after its key
+   name_s = series_ref.series_name_s \
+      if series_ref.series_name_s != "Series " + sstr(volume_id_n) else None
+   cursor.execute("INSERT OR IGNORE INTO volumes (id) VALUES (?)",
+      (volume_id_n,))
+   cursor.execute("UPDATE volumes SET name=COALESCE(?, name), " +
+      "start_year=COALESCE(NULLIF(?, -1), start_year), " +
+      "publisher=COALESCE(NULLIF(?, ''), publisher), " +
+      "count_of_issues=COALESCE(NULLIF(?, 0), count_of_issues), " +
+      "image_url=COALESCE(?, image_url), " +
+      "complete=MAX(complete, ?) WHERE id=?", (name_s,
+      series_ref.volume_year_n, series_ref.publisher_s,
+      series_ref.issue_count_n, series_ref.thumb_url_s,
+      1 if complete_b else 0, volume_id_n))
+   if complete_b:
+      cursor.execute("UPDATE volumes SET completed_ms=? WHERE id=?",
+         (int(__now_ms()), volume_id_n))
+   if name_s:
+      cursor.execute("DELETE FROM volume_words WHERE volume_id=?",
+         (volume_id_n,))
+      cursor.executemany("INSERT INTO volume_words (word, volume_id) " +
+         "VALUES (?, ?)", [(word_s, volume_id_n)
+            for word_s in set(__get_words(name_s))])
+
+
+# =============================================================================
+def __put_issue(cursor, series_key, issue_ref, details_xml_s=None):
+   '''
+   Adds (or updates) the given IssueRef, which belongs to the series with the
+   given key, in the mirror, using the given cursor.  The issue's details xml
+   is optional; if it isn't given, any previously imported details are kept.
+   '''
+
+   issue_id_n = int(issue_ref.issue_key)
+   cursor.execute("INSERT OR IGNORE INTO issues (id, volume_id, " +
+      "issue_number, number_key) VALUES (?, 0, '', '')", (issue_id_n,))
+   cursor.execute("UPDATE issues SET volume_id=?, issue_number=?, " +
+      "number_key=?, name=?, image_url=COALESCE(?, image_url), " +
+      "details_xml=COALESCE(?, details_xml) WHERE id=?", (int(series_key),
+      issue_ref.issue_num_s, __get_number_key_s(issue_ref.issue_num_s),
+      issue_ref.title_s, issue_ref.thumb_url_s, details_xml_s, issue_id_n))
+
+
+# =============================================================================
+def __find_series_ref(series_id_n):
+   ''' Returns the mirrored SeriesRef with the given id, or None. '''
+
+   row = __fetch_one("SELECT id, name, start_year, publisher, " +
+      "count_of_issues, image_url FROM volumes WHERE id=?", int(series_id_n))
+   return __row_to_seriesref(row) if row else None
+
+
+# =============================================================================
+def __row_to_seriesref(row):
+   ''' Converts a row from the 'volumes' table into a SeriesRef. '''
+   return SeriesRef(row[0], row[1], row[2], row[3], row[4], row[5])
+
+
+# =============================================================================
+def __row_to_issueref(row):
+   ''' Converts a row from the 'issues' table into an IssueRef. '''
+   return IssueRef(row[0], sstr(row[1]), row[2], row[3])
+
+
+# =============================================================================
+def __get_words(name_s):
+   ''' Returns a list of the (lowercase) words in the given series name. '''
+   name_s = re.sub(r"'", '', sstr(name_s).lower()) if name_s else ''
+   return [word_s for word_s in re.split(r'\W+', name_s) if word_s]
+
+
+# =============================================================================
+def __get_number_key_s(issue_num_s):
+   '''
+   Returns the given issue number in the form that the mirror indexes it by:
+   lowercase, and without leading zeros (as ComicVine does; see issue #403.)
+   '''
+   issue_num_s = sstr(issue_num_s).strip().lower()
+   return issue_num_s.lstrip('0') or ('0' if issue_num_s else '')
+
+
+# =============================================================================
+def __now_ms():
+   ''' Returns the current time, in milliseconds. '''
+   return (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+
+
+# =============================================================================
+def __fetch_one(sql_s, *args):
+   ''' Runs the given query, and returns its first row (or None.) '''
+   rows = __fetch_all(sql_s, *args)
+   return rows[0] if rows else None
+
+
+# =============================================================================
+def __fetch_all(sql_s, *args):
+   '''
+   Runs the given query, and returns a list of all its rows.  Returns an empty
+   list if the mirror is disabled, or if the query fails.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      try:
+         return __connection.execute(sql_s, args).fetchall() \
+            if __connection else []
+      except:
+         log.debug_exc("problem querying mirror database")
+         return []
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def __write(write_function):
+   '''
+   Calls the given function with a cursor for the mirror database, and then
+   commits the changes that it made (or rolls them back, if it fails.)
+   Returns whatever the function returned.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      if not __connection:
+         return None
+      cursor = __connection.cursor()
+      try:
+         retval = write_function(cursor)
+         __connection.commit()
+         return retval
+      except:
+         __connection.rollback()
+         log.debug_exc("problem writing to mirror database")
+         return None
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+if __name__ == '__main__':
+   # usage:  ipy mirrordb.py <dataset directory> <mirror database file>
+   # (the plugin's mirror database file is 'mirror.db' in its profile folder)
+   import sys
+   log.install()
+   try:
+      _initialize(**{'mirror_database':sys.argv[2]})
+      import_dataset(sys.argv[1])
+   finally:
+      _shutdown()
+      log.uninstall()
@@ -0,0 +1,218 @@
+'''
+This module contains a persistent, local index of every comic book series
+(SeriesRef) that the db module has ever found while searching online.  The
+index can be searched for series by name, much like the online database can,
+but without making any requests at all.
+
+Series names are matched "fuzzily", by comparing the trigrams (the 3 letter
+sequences) in the search terms with those in each series name.  That way,
+small typos and differences in punctuation or word order don't keep a
+series from being found.  Matches are ranked by how similar their whole names
+are to the search terms, so 'Batman' comes before 'Batman and Robin'.
+
+This module is threadsafe.
+
+@author: Cory Banack
+'''
+
+import re
+import clr
+import log
+from dbmodels import SeriesRef
+from utils import sstr
+
+clr.AddReference('System')
+from System.IO import File, StreamReader, StreamWriter
+from System.Text import Encoding
+from System.Threading import Monitor
+
+# the minimum fraction of a search's trigrams that a series name must contain
+# in order for that series to match the search
+__MIN_SIMILARITY = 0.75
+
+# a lock that guards all of the module state below
+__lock = object()
+
+# the file that the index is loaded from and saved to, or None if not loaded
+__file_s = None
+
+# maps each indexed series key -> the SeriesRef for that series
+__series_refs = {}
+
+# maps each trigram -> the set of keys of the series whose names contain it
+__trigrams = {}
+
+# maps each indexed series key -> the number of trigrams in that series' name
+__trigram_counts = {}
+
+# becomes True when the index has changed since it was loaded (or saved)
+__dirty_b = False
+
+
+#==============================================================================
+def load(file_s):
+   '''
+   Loads the index from the given file (if it exists), replacing whatever was
+   in the index before.  The index will be saved back to the same file when
+   save() is called.
+   '''
+
+   global __file_s, __series_refs, __trigrams, __trigram_counts, __dirty_b
+   Monitor.Enter(__lock)
+   try:
+      __file_s = file_s
+      __series_refs = {}
+      __trigrams = {}
+      __trigram_counts = {}
+      __dirty_b = False
+      try:
+         if File.Exists(file_s):
+            with StreamReader(file_s, Encoding.UTF8, False) as sr:
+               line = sr.ReadLine()
+               while line is not None:
+                  series_ref = __parse_series_ref(line)
+                  if series_ref:
+                     __index(series_ref)
+                  line = sr.ReadLine()
+         log.debug("loaded ", len(__series_refs), " series from local index")
+      except:
+         log.debug_exc("problem loading local series index: " + sstr(file_s))
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def save():
+   '''
+   Saves the index to the file that it was loaded from, if it has changed
+   since then.  Does nothing if the index was never loaded.
+   '''
+
+   global __dirty_b
+   Monitor.Enter(__lock)
+   try:
+      if __file_s and __dirty_b:
+         try:
+            with StreamWriter(__file_s, False, Encoding.UTF8) as sw:
+               for series_ref in __series_refs.itervalues():
+                  sw.Write(__format_series_ref_s(series_ref) + "\n")
+            __dirty_b = False
+         except:
+            log.debug_exc("problem saving local series index: "+sstr(__file_s))
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def add(series_refs):
+   '''
+   Adds the given SeriesRefs to the index, replacing any older SeriesRefs for
+   the same series (their issue counts, etc. may have changed.)
+   '''
+
+   global __dirty_b
+   Monitor.Enter(__lock)
+   try:
+      for series_ref in series_refs:
+         old_ref = __series_refs.get(series_ref.series_key)
+         if not old_ref or __format_series_ref_s(old_ref) != \
+               __format_series_ref_s(series_ref):
+            __index(series_ref)
+            __dirty_b = True
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def search(search_terms_s):
+   '''
+   Returns a list of all the indexed SeriesRefs whose names match the given
+   search terms, with the closest matches first.  The list may be empty.
+   '''
+
+   search_trigrams = __get_trigrams(search_terms_s)
+   if not search_trigrams:
+      return []
+
+   Monitor.Enter(__lock)
+   try:
+      # 1. count how many of the search's trigrams each series name contains
+      counts = {}
+      for trigram in search_trigrams:
+         for key in __trigrams.get(trigram, ()):
+            counts[key] = counts.get(key, 0) + 1
+
+      # 2. keep the series that contain enough of them
+      min_count_n = __MIN_SIMILARITY * len(search_trigrams)
+      keys = [key for key, count_n in counts.iteritems()
+         if count_n >= min_count_n]
+
+      # 3. sort them by the similarity (dice coefficient) of their whole names
+      #    to the search terms, best matches (and then longest series) first
+      def rank(key):
+         similarity = 2.0 * counts[key] / \
+            (len(search_trigrams) + __trigram_counts[key])
+         return (similarity, __series_refs[key].issue_count_n)
+      keys.sort(key=rank, reverse=True)
+      return [__series_refs[key] for key in keys]
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def __index(series_ref):
+   ''' Adds (or replaces) the given SeriesRef in the index. Hold the lock! '''
+
+   key = series_ref.series_key
+   if key in __series_refs:
+      for trigram in __get_trigrams(__series_refs[key].series_name_s):
+         __trigrams[trigram].discard(key)
+   __series_refs[key] = series_ref
+   trigrams = __get_trigrams(series_ref.series_name_s)
+   __trigram_counts[key] = len(trigrams)
+   for trigram in trigrams:
+      __trigrams.setdefault(trigram, set()).add(key)
+
+
+#==============================================================================
+def __get_trigrams(name_s):
+   '''
+   Returns the set of trigrams in the given series name (or search terms.)
+   Each word is padded with spaces, so words that start and end the same way
+   share more trigrams, and so that even very short words have a trigram.
+   '''
+
+   name_s = re.sub(r"'", '', sstr(name_s).lower())
+   trigrams = set()
+   for word in re.split(r'\W+', name_s):
+      if word:
+         word = '  ' + word + ' '
+         for i in range(len(word) - 2):
+            trigrams.add(word[i:i+3])
+   return trigrams
+
+
+#==============================================================================
+def __format_series_ref_s(series_ref):
+   ''' Converts the given SeriesRef into a single (tab separated) line. '''
+
+   clean = lambda s: re.sub(r'\s', ' ', sstr(s)) if s else ''
+   return '\t'.join( [ clean(series_ref.series_key),
+      clean(series_ref.series_name_s), clean(series_ref.volume_year_n),
+      clean(series_ref.publisher_s), clean(series_ref.issue_count_n),
+      clean(series_ref.thumb_url_s) ] )
+
+
+#==============================================================================
+def __parse_series_ref(line_s):
+   '''
+   Converts a line that was created by __format_series_ref_s back into a
+   SeriesRef.  Returns None if the line can't be converted.
+   '''
+
+   fields = line_s.split('\t')
+   if len(fields) != 6 or not fields[0].strip():
+      return None
+   key = int(fields[0]) if fields[0].isdigit() else fields[0]
+   return SeriesRef(key, fields[1], fields[2], fields[3], fields[4],
+      fields[5] if fields[5] else None)
@@ -8,8 +8,9 @@ remotely loaded images using an asyncrhonous off-loading thread.
 import clr
 import utils
 import db
+import imagecache
 from resources import Resources
-from scheduler import Scheduler
+from scheduler import Scheduler, CancelToken
 
 clr.AddReference('System.Drawing')
 from System.Drawing import Graphics, Bitmap
@@ -37,9 +38,13 @@ class DBPictureBox(PictureBox):
    most of them will be ignored, and only the most recent one is guaranteed to 
    actually be performed (and update the displayed image.)
 
-   2) All image retrieval is short-term cached, so if you switch the image ref 
-   back to a previous one, it will automatically use the cached image instead of 
-   reloading.
+   2) All retrieved images are stored in the shared, memory-bounded imagecache,
+   so if you switch the image ref back to a previous one (or another picturebox
+   displays the same ref) the cached image is used instead of reloading.
+   
+   3) Images that are likely to be displayed soon can be loaded into the 
+   imagecache ahead of time (see prefetch_image_refs), at a lower priority 
+   than the image that is currently being displayed.
    
    '''
 
@@ -50,11 +55,17 @@ class DBPictureBox(PictureBox):
       # the ref of whatever image should currently be displayed, or None
       self.__current_image_ref = None
       
-      # a simple "last-in-and-ignore-everything-else" scheduler
-      self.__scheduler = Scheduler()
+      # a scheduler for loading images.  the image that we are displaying is
+      # always loaded with the "display" key, so it is last-in-and-ignore-
+      # everything-else, at the most urgent (visible) priority.  prefetched
+      # images are keyed by their refs, at the lower prefetch priority.  
+      self.__scheduler = Scheduler(2)
+      
+      # cancels all of the prefetch tasks from the last prefetch_image_refs
+      self.__prefetch_token = CancelToken()
       
-      # our cache of loaded image objects. {(imageref,issuehint)->Image}
-      self.__image_cache = {}
+      # the image (acquired from the imagecache) that we are displaying, or None
+      self.__cached_image = None
       
       # the image that gets displayed if we have nothing else to display
       self.__unknown_image = Resources.createComicVineLogo()
@@ -81,12 +92,13 @@ class DBPictureBox(PictureBox):
    #===========================================================================
    def free(self):
       ''' Explicitly frees all resources held by this object. '''
+      self.__prefetch_token.cancel()
       self.__scheduler.shutdown(True) # blocks; safer even if gui locks a little
+      self.Image = None
+      imagecache.release(self.__cached_image)
+      self.__cached_image = None
       self.__unknown_image.Dispose()
       self.__loading_image.Dispose()
-      for image in self.__image_cache.values():
-         image.Dispose()
-      self.__image_cache = {}
       PictureBox.Dispose(self, True)
       
 
@@ -103,6 +115,34 @@ class DBPictureBox(PictureBox):
          self.__update_image()
      
     
+   #===========================================================================
+   def prefetch_image_refs(self, refs, token=None):
+      '''
+      Loads the images for the given refs (SeriesRefs, IssueRefs or url 
+      strings) into the shared imagecache in the background, without displaying
+      them, so that they can be displayed instantly later on.  This method is 
+      threadsafe.
+      
+      If a CancelToken is given, cancelling it stops any of these images that
+      haven't been loaded yet from being loaded.  If not, any images that are 
+      still waiting to be loaded from the previous call to this method (without
+      a token) are forgotten instead. 
+      '''
+      
+      if not token:
+         self.__prefetch_token.cancel()
+         self.__prefetch_token = CancelToken()
+         token = self.__prefetch_token
+      
+      for ref in refs:
+         if ref and not imagecache.contains(ref):
+            def prefetch_task(ref=ref):
+               if not token.cancelled_b and not imagecache.contains(ref):
+                  imagecache.put(ref, db.query_image(ref))
+            self.__scheduler.submit(
+               prefetch_task, Scheduler.PREFETCH, ref, token)
+      
+    
    #===========================================================================
    def __copy_transparent(self, image):
       ''' Creates a semi-transparent copy of the given image ''' 
@@ -112,9 +152,13 @@ class DBPictureBox(PictureBox):
       cm = ColorMatrix()
       cm.Matrix33 = 0.3
       ia = ImageAttributes()
-      ia.SetColorMatrix(cm)
-      g.DrawImage(image, Rectangle(0,0, image.Width, image.Height), 0,0,\
-         image.Width, image.Height, GraphicsUnit.Pixel, ia)
+      try:
+         ia.SetColorMatrix(cm)
+         g.DrawImage(image, Rectangle(0,0, image.Width, image.Height), 0,0,\
+            image.Width, image.Height, GraphicsUnit.Pixel, ia)
+      finally:
+         ia.Dispose()
+         g.Dispose()
       return b
 
    #===========================================================================
@@ -127,53 +171,50 @@ class DBPictureBox(PictureBox):
       worker thread, so as not to lock up the UI.
       '''
        
-      # simple image setter that uses a blank image if 'image' is None 
+      # simple image setter that uses a blank image if 'image' is None.  
+      # 'image' must be acquired from the imagecache; we release it (and 
+      # whatever image we were displaying before) when it's no longer shown.
       def switchimage( image ):
+         old_image = self.__cached_image
+         self.__cached_image = image
          if image: self.Image = image
          else: self.Image = self.__unknown_image
+         imagecache.release(old_image)
              
       ref = self.__current_image_ref
+      cached_image = imagecache.acquire(ref) \
+         if ref or ref == 0 else None 
       
       # 1. if the ref is empty, switch to display an empty image
       if not ref and ref != 0:
          switchimage(None)
          
       # 2. if the ref is cached, switch to display the cached image
-      elif ref in self.__image_cache:
-         switchimage( self.__image_cache[ref] )
+      elif cached_image:
+         switchimage( cached_image )
          
       # 3. if the ref is unkown, the hard part begins.  create a download "task"
       #    that downloads, caches, and then switches display to the needed 
       #    image.  then invoke this task asyncrhonously on the off-thread.
       else:
+         switchimage(None)
          self.Image = self.__loading_image
          def download_task():
             
-            # 3a. load the image. 
-            new_image = db.query_image(ref) # disposed later
+            # 3a. load the image (unless it was prefetched in the meantime),
+            #     and hand it over to the shared cache
+            if not imagecache.contains(ref):
+               imagecache.put(ref, db.query_image(ref))
                
             # 3b. now that we've loaded a new image, the following method is
             #     passed back to the gui thread and run to update our gui 
             def update_image():
                
-               # if somehow the image we just loaded is already in the cache,
-               # take it out and dispose it.  this should be rare.    
-               if ref in self.__image_cache:
-                  old_image = self.__image_cache[ref]
-                  del self.__image_cache[ref]
-                  if old_image:
-                     old_image.Dispose()
-               
-               # cache the new image, so we never have to load it again
-               if new_image:
-                  self.__image_cache[ref] = new_image
-               
                # if the __current_image_ref hasn't changed, switch this 
                # PictureBox to display that image.  otherwise, we already 
                # loading a new one, so don't do a pointless visual update.
                if ref == self.__current_image_ref:
-                  switchimage(new_image)
+                  switchimage( imagecache.acquire(ref, False) )
                   
             utils.invoke(self, update_image, False) 
-         self.__scheduler.submit(download_task)
-         
\ No newline at end of file
+         self.__scheduler.submit(download_task, Scheduler.VISIBLE, "display")
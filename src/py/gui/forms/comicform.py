@@ -103,6 +103,8 @@ class ComicForm(CVForm):
       
       # 3. -- set up some listeners
       self.__scraper.start_scrape_listeners.append(self.__start_scrape)
+      self.__scraper.rescrape_listeners.append(self.__rescraped)
+      self.__scraper.estimate_listeners.append(self.__estimated)
       self.__scraper.cancel_listeners.append(self.close_threadsafe)
       self.FormClosing += self.__form_closing_fired
       self.FormClosed += self.__form_closed_fired
@@ -217,6 +219,69 @@ class ComicForm(CVForm):
             i18n.get("ComicFormCancelButton").format(sstr(num_remaining))
          self.Update()
       utils.invoke(self, delegate, False)
+      
+      
+   # ==========================================================================
+   def __rescraped(self, books, num_remaining, books_per_minute_n):
+      '''
+      This method gets called each time the ScrapeEngine finishes fast 
+      rescraping a batch of comics.  The method updates all necessary 
+      graphical components to show that batch, and how quickly books are 
+      being rescraped.
+      
+      'books' -> the comic book objects that were just rescraped
+      'num_remaining' -> the # of books left to scrape after these ones
+      'books_per_minute_n' -> the # of books rescraped per minute, so far
+      '''
+      
+      # 1. show the name and cover of the last book in the batch
+      book = books[-1]
+      book_name = Path.GetFileName(book.path_s.strip()) # path_s is never None
+      if not book_name:
+         book_name = book.series_s + \
+            ((' #' + book.issue_num_s) if book.issue_num_s else '')
+      page_image = book.create_image_of_page(0)
+      page_count = book.page_count_n
+      
+      # 2. install those values into the ComicForm.  the progressbar steps 
+      #    once for each book, exactly as if __start_scrape had been called.
+      def delegate():
+         # NOTE: now we're on the ComicForm Application Thread
+         self.__current_book = book
+         self.__current_page = 0
+         self.__current_page_count = page_count
+         self.__label.Text = i18n.get("ComicFormRescrapingLabel").format(
+            sstr(int(round(books_per_minute_n)))) + book_name
+         self.__pbox_panel.set_image(page_image) # cover image may be None
+         for i in range(len(books)):
+            self.__progbar.PerformStep()
+            self.__progbar.Maximum = \
+               self.__progbar.Value + num_remaining + len(books) - i
+         self.__cancel_button.Text=\
+            i18n.get("ComicFormCancelButton").format(sstr(num_remaining))
+         self.Update()
+      utils.invoke(self, delegate, False)
+      
+      
+   # ==========================================================================
+   def __estimated(self, remaining_ms, books_per_hour_n):
+      '''
+      This method gets called each time the ScrapeEngine has a new estimate of
+      how long the rest of the scrape operation will take.  The estimate (and
+      the current throughput) is shown in this form's title bar.
+      
+      'remaining_ms' -> the estimated # of milliseconds left to scrape
+      'books_per_hour_n' -> the # of books scraped per hour, so far
+      '''
+      
+      minutes_n = int(round(remaining_ms / 60000.0))
+      remaining_s = "{0}:{1:02d}".format(minutes_n / 60, minutes_n % 60)
+      def delegate():
+         # NOTE: now we're on the ComicForm Application Thread
+         self.Text = i18n.get("ComicFormEstimateTitle").format(
+            Resources.SCRIPT_FULLNAME, remaining_s, 
+            sstr(int(round(books_per_hour_n))))
+      utils.invoke(self, delegate, False)
  
    
    #===========================================================================
@@ -314,6 +379,8 @@ class ComicForm(CVForm):
       
       # deregister listers; prevents infinite loop! 
       self.__scraper.start_scrape_listeners.remove(self.__start_scrape)
+      self.__scraper.rescrape_listeners.remove(self.__rescraped)
+      self.__scraper.estimate_listeners.remove(self.__estimated)
       self.__scraper.cancel_listeners.remove(self.close_threadsafe)
       
       # in some cases, we should interpret the closing of this form as 
@@ -6,7 +6,7 @@ This module is home to the IssueCoverPanel class.
 import clr
 from dbmodels import IssueRef, SeriesRef
 from dbpicturebox import DBPictureBox
-from scheduler import Scheduler
+from scheduler import Scheduler, CancelToken
 import utils
 from utils import sstr
 import db
@@ -79,6 +79,10 @@ class IssueCoverPanel(Panel):
       # the IssueRef or SeriesRef whose cover we are currently displaying
       self.__ref = None
       
+      # the ref that was most recently passed to set_ref.  a background ref 
+      # change for any other ref is out of date, and gets thrown away.
+      self.__requested_ref = None
+      
       # a mapping of refs to _ButtonModels.  Basically caches the 
       # next/prev button state for each ref.
       self.__button_cache = {}
@@ -87,11 +91,13 @@ class IssueCoverPanel(Panel):
       # us avoid querying the database twice for the same SeriesRef.
       self.__series_cache = {}
       
-      # a scheduler (thread) for finding cover images...
-      self.__finder_scheduler = Scheduler()
+      # a scheduler (two threads) for setting new refs and finding cover 
+      # images.  each of those jobs has its own key, so neither one ever 
+      # has to wait behind the other.
+      self.__scheduler = Scheduler(2)
       
-      # a scheduler (thread) for setting new refs...
-      self.__setter_scheduler = Scheduler()
+      # cancels all of the tasks from the most recent call to prefetch_refs
+      self.__prefetch_token = CancelToken()
       
       # a tuple containing the user's alternate cover art choice (a url) for 
       # a specific IssueRef i.e. (IssuRef, url). none if no alt choice was made.
@@ -202,8 +208,8 @@ class IssueCoverPanel(Panel):
                if utils.is_string(image_ref):
                   self.__alt_cover_choice = (issue_ref, image_ref)
       
-      self.__finder_scheduler.shutdown(False)
-      self.__setter_scheduler.shutdown(False)
+      self.__prefetch_token.cancel()
+      self.__scheduler.shutdown(False)
       self.set_ref(None)
       self.__coverpanel.free()
       self.__prevbutton = None
@@ -219,6 +225,7 @@ class IssueCoverPanel(Panel):
       'ref'-> the IssueRef or SeriesRef that we are displaying, or None.
       '''
 
+      self.__requested_ref = ref
       run_in_background = type(ref) == SeriesRef and self.__issue_num_hint_s       
       if run_in_background:
          # 1a. our ref is a SeriesRef.  use our issue num hint to try to convert
@@ -230,13 +237,14 @@ class IssueCoverPanel(Panel):
                   
             # 1b. go back to the application thread to do the actual ref change
             def change_ref():  
-               self.__ref = self.__series_cache[ref]
-               self.__update()
+               if self.__requested_ref is ref:
+                  self.__ref = self.__series_cache[ref]
+                  self.__update()
             utils.invoke(self.__coverpanel, change_ref, True)
             
          def dummy(): # I don't know why this is needed 
             maybe_convert_seriesref_to_issue_ref(ref)
-         self.__setter_scheduler.submit(dummy)
+         self.__scheduler.submit(dummy, Scheduler.VISIBLE, "set_ref")
          
       else:
          # 2. our ref is an IssueRef
@@ -245,6 +253,44 @@ class IssueCoverPanel(Panel):
          self.__update()
             
 
+   # ==========================================================================
+   def prefetch_refs(self, refs):
+      '''
+      Starts loading the cover art for the given IssueRefs and/or SeriesRefs in
+      the background, at a lower priority than the ref that is currently being
+      displayed, so that it is ready to display instantly if set_ref is called 
+      with any of those refs later on.  Any refs that are still waiting to be 
+      prefetched from a previous call to this method are forgotten.
+      '''
+      
+      self.__prefetch_token.cancel()
+      self.__prefetch_token = CancelToken()
+      token = self.__prefetch_token
+      if not self.__config.show_covers_b:
+         return
+      
+      # refs that need no db query to find their cover art can be handed  
+      # straight to the DBPictureBox.   SeriesRefs that must be converted to 
+      # IssueRefs (see set_ref) get converted first, on our own scheduler.
+      image_refs = []
+      for ref in refs:
+         if type(ref) == SeriesRef and self.__issue_num_hint_s:
+            if ref in self.__series_cache:
+               image_refs.append(self.__series_cache[ref])
+            else:
+               def convert_task(ref=ref):
+                  if not ref in self.__series_cache:
+                     issue_ref = db.query_issue_ref(ref,self.__issue_num_hint_s)
+                     self.__series_cache[ref] = issue_ref if issue_ref else ref
+                  self.__coverpanel.prefetch_image_refs(
+                     [self.__series_cache[ref]], token )
+               self.__scheduler.submit(
+                  convert_task, Scheduler.PREFETCH, ref, token)
+         elif ref:
+            image_refs.append(ref)
+      self.__coverpanel.prefetch_image_refs(image_refs, token)
+      
+
    # ==========================================================================
    def get_alt_issue_cover_choice(self):
       '''
@@ -281,7 +327,7 @@ class IssueCoverPanel(Panel):
       nextbutton = self.__nextbutton
       prevbutton = self.__prevbutton
       label = self.__label
-      scheduler = self.__finder_scheduler
+      scheduler = self.__scheduler
       
       
       if ref is None or cache is None:
@@ -359,7 +405,7 @@ class IssueCoverPanel(Panel):
                   bmodel.set_status('searched')
                   self.__update() # recurse!
                utils.invoke(self, update_bmodel, True)
-            scheduler.submit(update_cache)
+            scheduler.submit(update_cache, Scheduler.VISIBLE, "find_covers")
        
          
    # ==========================================================================
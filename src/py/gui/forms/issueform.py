@@ -36,6 +36,9 @@ class IssueForm(CVForm):
    identified IssueRef.
    '''
    
+   # the number of rows above and below the selected row to prefetch covers for
+   __PREFETCH_ROWS_N = 3
+
    #===========================================================================
    def __init__(self, scraper, issue_ref_hint, issue_refs, series_ref):
       ''' 
@@ -353,6 +356,7 @@ class IssueForm(CVForm):
          self.__chosen_index = selected_rows[0].Cells[3].Value
          self.__coverpanel.set_ref(
             self.__issue_refs[self.__chosen_index] )
+         self.__prefetch_covers(selected_rows[0].Index)
       else:
          self.__chosen_index = None
          self.__coverpanel.set_ref( None ) 
@@ -360,6 +364,23 @@ class IssueForm(CVForm):
       # don't let the user click 'ok' if no row is selected!
       self.__ok_button.Enabled = selected_rows.Count == 1
       
+   # ==========================================================================
+   def __prefetch_covers(self, row_n):
+      ''' 
+      Prefetches cover art for the issues in the rows just above and below the
+      given (selected) table row, so that it can be displayed instantly if the
+      user navigates to any of those rows.
+      '''
+      
+      rows = self.__table.Rows
+      refs = []
+      for offset in range(1, IssueForm.__PREFETCH_ROWS_N + 1):
+         for i in (row_n + offset, row_n - offset):
+            if i >= 0 and i < rows.Count:
+               refs.append(self.__issue_refs[rows[i].Cells[3].Value])
+      self.__coverpanel.prefetch_refs(refs)
+      
+      
    # ==========================================================================
    def __sort_compare_fired(self, sender, args):
       ''' this method is called whenever the table is resorted '''
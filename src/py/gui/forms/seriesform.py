@@ -7,10 +7,13 @@ This module is home to the SeriesForm and SeriesFormResult classes.
 import clr
 from buttondgv import ButtonDataGridView
 from cvform import CVForm
+import log
+import utils
 from utils import sstr
 from matchscore import MatchScore
 import i18n
 from issuecoverpanel import IssueCoverPanel
+from scheduler import Scheduler, CancelToken
  
 clr.AddReference('System')
 from System.ComponentModel import ListSortDirection
@@ -22,7 +25,7 @@ clr.AddReference('System.Windows.Forms')
 from System.Windows.Forms import AutoScaleMode, Button, \
    DataGridViewAutoSizeColumnMode, DataGridViewContentAlignment, \
    DataGridViewSelectionMode, DataGridViewTriState, DialogResult, \
-   Keys, Label
+   Keys, Label, SortOrder
 
 #==============================================================================
 class SeriesForm(CVForm):
@@ -35,8 +38,15 @@ class SeriesForm(CVForm):
    this dialog and continue scraping her comic using the identified SeriesRef.
    '''
 
+   # the number of rows above and below the selected row to prefetch covers for
+   __PREFETCH_ROWS_N = 3
+   
+   # the number of best scoring rows to prefetch covers for
+   __PREFETCH_BEST_N = 3
+
    #===========================================================================
-   def __init__(self, scraper, book, series_refs, search_terms_s):
+   def __init__(self, scraper, book, series_refs, search_terms_s, 
+         series_search=None):
       ''' 
       Initializes this form.
       
@@ -44,6 +54,9 @@ class SeriesForm(CVForm):
       'book' -> the ComicBook being scraped
       'series_refs' -> set or list containing the SeriesRefs to display
       'search_terms_s' -> the user's search string that found the series models
+      'series_search' -> an optional SeriesSearch that found the given 
+          SeriesRefs.  if it isn't done yet, any further SeriesRefs that it 
+          finds will be added to this form (in the background) as they arrive.
       '''
       
       # the the shared global configuration
@@ -77,6 +90,28 @@ class SeriesForm(CVForm):
       # the index (in self.__series_refs) of the currently selected SeriesRef
       self.__chosen_index = None
       
+      # the indices (in self.__series_refs) of the best scoring SeriesRefs
+      self.__best_indices = []
+      
+      # the ComicBook being scraped; used to score newly added SeriesRefs
+      self.__book = book
+      
+      # the user's search string that was used to find the SeriesRefs
+      self.__search_terms_s = search_terms_s
+      
+      # the label that tells the user how many series were found
+      self.__label = None
+      
+      # the SeriesSearch that is finding more SeriesRefs for us, or None 
+      self.__series_search = series_search \
+         if series_search and not series_search.done_b else None
+      
+      # the background thread that fetches more SeriesRefs from __series_search
+      self.__scheduler = Scheduler(1)
+      
+      # cancelled when this form closes, to stop fetching more SeriesRefs
+      self.__fetch_token = CancelToken()
+      
       
       
       if len(series_refs) <= 0:
@@ -95,7 +130,7 @@ class SeriesForm(CVForm):
       self.__skip_button = self.__build_skipbutton()
       search_button = self.__build_searchbutton()
       self.__issues_button = self.__build_issuesbutton()
-      label = self.__build_label(search_terms_s, len(self.__series_refs)) 
+      self.__label = self.__build_label()
       self.__table = self.__build_table(
          self.__series_refs, book, self.__ok_button)
       self.__coverpanel = self.__build_coverpanel(book)
@@ -110,7 +145,7 @@ class SeriesForm(CVForm):
       self.KeyUp += self.__key_was_released
       self.Deactivate += self.__was_deactivated
       
-      self.Controls.Add (label)
+      self.Controls.Add (self.__label)
       self.Controls.Add(self.__table)
       self.Controls.Add (self.__ok_button)
       self.Controls.Add (self.__skip_button)
@@ -128,6 +163,7 @@ class SeriesForm(CVForm):
       
       # 4. --- make sure the UI goes into a good initial state
       self.Shown += self.__change_table_selection_fired
+      self.Shown += self.__form_shown_fired
 
 
 
@@ -211,23 +247,35 @@ class SeriesForm(CVForm):
 
       # 3. --- copy model data into the table, each series is a row
       for i in range(len(series_refs)):
-         table.Rows.Add()
-         ref = series_refs[i] 
-         table.Rows[i].Cells[0].Value = ref.series_name_s
-         if ref.volume_year_n >= 0:
-            table.Rows[i].Cells[1].Value = ref.volume_year_n
-         table.Rows[i].Cells[2].Value = ref.issue_count_n
-         table.Rows[i].Cells[3].Value = ref.publisher_s
-         table.Rows[i].Cells[4].Value = ref.series_key
-         table.Rows[i].Cells[5].Value = self.__matchscore.compute_n(book, ref)
-         table.Rows[i].Cells[6].Value = i
+         self.__add_row(table, book, series_refs[i], i)
 
       # 4. --- sort on the "match" colum
       table.Sort( table.Columns[5], ListSortDirection.Descending )
+      self.__best_indices = [ table.Rows[i].Cells[6].Value for i in 
+         range(min(SeriesForm.__PREFETCH_BEST_N, table.Rows.Count)) ]
       table.SelectionChanged += self.__change_table_selection_fired
       return table
 
 
+   # ==========================================================================
+   def __add_row(self, table, book, ref, index_n):
+      ''' 
+      Adds a new row to the given table, for the given SeriesRef.
+      'book' -> the ComicBook being scraped
+      'index_n' -> the index of the given SeriesRef in self.__series_refs
+      '''
+      
+      row = table.Rows[table.Rows.Add()]
+      row.Cells[0].Value = ref.series_name_s
+      if ref.volume_year_n >= 0:
+         row.Cells[1].Value = ref.volume_year_n
+      row.Cells[2].Value = ref.issue_count_n
+      row.Cells[3].Value = ref.publisher_s
+      row.Cells[4].Value = ref.series_key
+      row.Cells[5].Value = self.__matchscore.compute_n(book, ref)
+      row.Cells[6].Value = index_n
+
+
    # ==========================================================================
    def __build_okbutton(self):
       ''' builds and returns the ok button for this form '''
@@ -278,23 +326,31 @@ class SeriesForm(CVForm):
    
    
    # ==========================================================================
-   def __build_label(self, search_terms_s, num_matches_n):
-      ''' 
-      Builds and return the text label for this form.
-      'search_terms_s' -> user's search string that was used to find series
-      'num_matches_n' -> number of series (table rows) the user's search matched
-      '''
+   def __build_label(self):
+      ''' Builds and return the text label for this form. '''
       
       label = Label()
       label.UseMnemonic = False
       label.Location = Point(10, 20)
       label.Size = Size(480, 40)
+      self.__update_label_text(label)
+      return label
+   
+   
+   # ==========================================================================
+   def __update_label_text(self, label):
+      ''' 
+      Updates the text on the given label (this form's label) to describe the
+      number of series that the user's search has matched so far.
+      '''
+      
+      num_matches_n = len(self.__series_refs)
+      search_terms_s = self.__search_terms_s
       if num_matches_n > 1:
          label.Text = i18n.get("SeriesFormChooseText")\
             .format(search_terms_s, num_matches_n )
       else:
          label.Text = i18n.get("SeriesFormConfirmText").format(search_terms_s)
-      return label
    
 
    # ==========================================================================
@@ -357,11 +413,70 @@ class SeriesForm(CVForm):
    def __form_closed_fired(self, sender, args):
       ''' this method is called whenever this SeriesForm is closed. '''
       
+      # wait for the fetching thread to stop before closing our search
+      self.__fetch_token.cancel()
+      self.__scheduler.shutdown(True)
+      if self.__series_search:
+         self.__series_search.close()
       self.__table.Dispose()
       self.__coverpanel.free()      
       self.Closed -= self.__form_closed_fired
 
 
+   #===========================================================================
+   def __form_shown_fired(self, sender, args):
+      ''' 
+      This method is called when this SeriesForm is first shown.  If our
+      SeriesSearch still has results to find, it starts fetching them (in the
+      background), and adding them to this form as they arrive.
+      '''
+      
+      series_search = self.__series_search
+      token = self.__fetch_token
+      if series_search:
+         def fetch_more():
+            batch = series_search.next_batch()
+            while batch is not None and not token.cancelled_b:
+               if batch:
+                  utils.invoke(self, 
+                     lambda refs=batch: self.__add_series_refs(refs), False)
+               batch = series_search.next_batch()
+         self.__scheduler.submit(fetch_more, token=token)
+   
+   
+   #===========================================================================
+   def __add_series_refs(self, series_refs):
+      ''' 
+      Adds the given (newly found) SeriesRefs to this form's table, without
+      disturbing the user's current selection.  Must be called on the 
+      application thread. 
+      '''
+      
+      table = self.__table
+      if table.IsDisposed:
+         return
+      
+      # 1. --- add a new row for each new SeriesRef
+      for ref in series_refs:
+         self.__series_refs.append(ref)
+         self.__add_row(table, self.__book, ref, len(self.__series_refs) - 1)
+      log.debug("...added ", len(series_refs), " more results to the table")
+         
+      # 2. --- resort the table (the selected row stays selected), and update
+      #        everything that depends on the order of the table's rows
+      column = table.SortedColumn if table.SortedColumn else table.Columns[5]
+      table.Sort( column, ListSortDirection.Ascending \
+         if table.SortOrder == SortOrder.Ascending \
+         else ListSortDirection.Descending )
+      best_rows = sorted( table.Rows, reverse=True, 
+         key=lambda row: row.Cells[5].Value )
+      self.__best_indices = [ row.Cells[6].Value for row in 
+         best_rows[:SeriesForm.__PREFETCH_BEST_N] ]
+      self.__update_label_text(self.__label)
+      if table.SelectedRows.Count == 1:
+         self.__prefetch_covers(table.SelectedRows[0].Index)
+
+
    #===========================================================================         
    def __change_table_selection_fired(self, sender, args):
       ''' this method is called whenever the table's selected row changes. '''
@@ -373,6 +488,7 @@ class SeriesForm(CVForm):
          self.__chosen_index = selected_rows[0].Cells[6].Value
          self.__coverpanel.set_ref(
             self.__series_refs[self.__chosen_index])
+         self.__prefetch_covers(selected_rows[0].Index)
       else:
          self.__chosen_index = None
          self.__coverpanel.set_ref(None) 
@@ -382,6 +498,24 @@ class SeriesForm(CVForm):
       self.__issues_button.Enabled = selected_rows.Count == 1
       
                
+   #===========================================================================         
+   def __prefetch_covers(self, row_n):
+      ''' 
+      Prefetches cover art for the best scoring series, and for the series in
+      the rows just above and below the given (selected) table row, so that it
+      can be displayed instantly if the user navigates to any of those rows.
+      '''
+      
+      rows = self.__table.Rows
+      indices = list(self.__best_indices)
+      for offset in range(1, SeriesForm.__PREFETCH_ROWS_N + 1):
+         for i in (row_n + offset, row_n - offset):
+            if i >= 0 and i < rows.Count:
+               indices.append(rows[i].Cells[6].Value)
+      self.__coverpanel.prefetch_refs( 
+         [self.__series_refs[i] for i in indices if i != self.__chosen_index])
+      
+               
    #===========================================================================         
    def __key_was_pressed(self, sender, args):
       ''' Called whenever the user presses any key on this form. '''
@@ -0,0 +1,247 @@
+'''
+This module contains a single, process-wide cache of decoded .NET Images,
+keyed by the SeriesRef, IssueRef or url that was used to load each image from
+the database.   It is shared by every DBPictureBox, so that an image that is
+displayed in several places (or several times) is only ever loaded, decoded and
+stored once.
+
+The cache is bounded by the total number of bytes in the pixel data of the
+images that it holds.  When that bound is exceeded, the least recently used
+images are evicted (and Disposed.)
+
+Because a cached image may still be displayed by some control when it gets
+evicted, images are reference counted:  call acquire() to get an image that
+you intend to display, and call release() when you are no longer displaying
+it.  An image is never disposed while it is acquired; if it is evicted in the
+meantime, it is disposed as soon as the last reference to it is released.
+
+This module is threadsafe.
+
+@author: Cory Banack
+'''
+
+import clr
+import log
+
+clr.AddReference('System')
+from System.Threading import Monitor
+
+clr.AddReference('System.Drawing')
+from System.Drawing import Image
+
+# the maximum number of pixel bytes that can be held in the cache at once
+__MAX_BYTES_N = 64 * 1024 * 1024
+
+# a lock that guards all of the module state below
+__lock = object()
+
+# maps each cached ref -> the _Entry for that ref's image
+__entries = {}
+
+# maps the id() of each image in __entries -> the ref that it's cached under
+__refs_by_id = {}
+
+# images that were evicted while they were still acquired. {image->_Entry}
+__orphans = {}
+
+# the total number of pixel bytes held in the __entries map
+__bytes_n = 0
+
+# a counter that increases every time any entry is used. used for LRU ordering
+__clock_n = 0
+
+# the number of times acquire() did (and did not) find a cached image
+__hits_n = 0
+__misses_n = 0
+
+
+#==============================================================================
+def contains(ref):
+   ''' Returns whether an image for the given ref is currently cached. '''
+
+   Monitor.Enter(__lock)
+   try:
+      return ref in __entries
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def acquire(ref, record_b=True):
+   '''
+   Returns the cached image for the given ref, or None if no such image is
+   cached.  A returned image will never be disposed until you pass it back to
+   the release() function, which you MUST do once you are done with it.
+   
+   If 'record_b' is False, this lookup is not counted in the cache's hit rate.
+   '''
+
+   global __hits_n, __misses_n
+   Monitor.Enter(__lock)
+   try:
+      entry = __entries.get(ref)
+      if record_b:
+         if entry: __hits_n += 1
+         else: __misses_n += 1
+      if entry:
+         entry.refcount_n += 1
+         __touch(entry)
+         return entry.image
+      else:
+         return None
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def put(ref, image):
+   '''
+   Adds the given image to the cache, under the given ref.  The cache takes
+   ownership of the image, so you must not Dispose it yourself.  Use acquire()
+   to get the image back out again.
+
+   If there is already an image cached for the given ref, the given image is
+   disposed and the cached one is kept instead.  None images are ignored.
+   '''
+
+   global __bytes_n
+   if image is None:
+      return
+
+   Monitor.Enter(__lock)
+   try:
+      entry = __entries.get(ref)
+      if entry:
+         if entry.image is not image:
+            image.Dispose()
+      else:
+         entry = _Entry(image)
+         __entries[ref] = entry
+         __refs_by_id[id(image)] = ref
+         __bytes_n += entry.bytes_n
+      __touch(entry)
+      __evict()
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def release(image):
+   '''
+   Releases an image that was obtained from acquire().  Once an image
+   has been released as many times as it was acquired, the cache is free to
+   dispose of it.  Releasing None does nothing.
+   '''
+
+   if image is None:
+      return
+
+   Monitor.Enter(__lock)
+   try:
+      if image in __orphans:
+         entry = __orphans[image]
+         entry.refcount_n -= 1
+         if entry.refcount_n <= 0:
+            del __orphans[image]
+            image.Dispose()
+      else:
+         entry = __entries.get(__refs_by_id.get(id(image)))
+         if entry and entry.image is image:
+            entry.refcount_n = max(0, entry.refcount_n - 1)
+         __evict()
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def clear():
+   '''
+   Evicts every image from the cache.  Images that are still acquired will be
+   disposed when they are released;  all others are disposed immediately.
+   Also logs the cache's statistics (hit rate, etc.) since the last clear.
+   '''
+
+   global __entries, __refs_by_id, __bytes_n, __hits_n, __misses_n
+   Monitor.Enter(__lock)
+   try:
+      if __hits_n or __misses_n:
+         log.debug("image cache: ", get_stats_s())
+      for entry in __entries.values():
+         __dispose(entry)
+      __entries = {}
+      __refs_by_id = {}
+      __bytes_n = 0
+      __hits_n = 0
+      __misses_n = 0
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def get_stats_s():
+   ''' Returns a short, human readable description of this cache's state. '''
+
+   Monitor.Enter(__lock)
+   try:
+      requests_n = __hits_n + __misses_n
+      rate_n = 100.0 * __hits_n / requests_n if requests_n else 0.0
+      return "{0} images ({1:.1f} of {2:.0f} MB), {3} of {4} hits ({5:.0f}%)"\
+         .format(len(__entries), __bytes_n / 1048576.0,
+            __MAX_BYTES_N / 1048576.0, __hits_n, requests_n, rate_n)
+   finally:
+      Monitor.Exit(__lock)
+
+
+#==============================================================================
+def __touch(entry):
+   ''' Marks the given entry as the most recently used one. Hold the lock! '''
+
+   global __clock_n
+   __clock_n += 1
+   entry.used_n = __clock_n
+
+
+#==============================================================================
+def __evict():
+   '''
+   Evicts least recently used entries until the cache fits within its byte
+   budget, or until only acquired entries remain.  Hold the lock!
+   '''
+
+   global __bytes_n
+   if __bytes_n > __MAX_BYTES_N:
+      lru = sorted(__entries.items(), key=lambda item: item[1].used_n)
+      for ref, entry in lru:
+         if __bytes_n <= __MAX_BYTES_N:
+            break
+         if entry.refcount_n <= 0:
+            del __entries[ref]
+            del __refs_by_id[id(entry.image)]
+            __bytes_n -= entry.bytes_n
+            __dispose(entry)
+
+
+#==============================================================================
+def __dispose(entry):
+   '''
+   Disposes the image in the given (already removed) entry, or orphans it until
+   it is released if it is still acquired.  Hold the lock!
+   '''
+
+   if entry.refcount_n > 0:
+      __orphans[entry.image] = entry
+   else:
+      entry.image.Dispose()
+
+
+#==============================================================================
+class _Entry(object):
+   ''' A cached image, along with its bookkeeping details. '''
+
+   #===========================================================================
+   def __init__(self, image):
+      self.image = image
+      self.bytes_n = image.Width * image.Height * \
+         max(1, Image.GetPixelFormatSize(image.PixelFormat) // 8)
+      self.refcount_n = 0
+      self.used_n = 0
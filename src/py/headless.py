@@ -0,0 +1,310 @@
+'''
+This module is home to the HeadlessEngine class, which scrapes comic books
+without showing any dialogs or needing a user at all, along with the policies
+that it uses to decide which issue each book is.
+
+It can also be run as a standalone script, i.e. to scrape books unattended
+on a server, or to benchmark the scraper:
+
+     ipy headless.py <policy> <books> <report file>
+
+where <policy> is one of 'rescrape', 'autoscrape' or 'delay' (see POLICIES),
+<books> is either a file that contains a pickled list of ComicRack books
+(like tools/testdata/sample.pickled) or a directory of comic files, and
+<report file> is the file that the results are written to, as json.
+
+@author: Cory Banack
+'''
+
+import clr
+import cPickle
+import json
+import automatcher
+import db
+import log
+from comicbook import ComicBook, sort_books
+from configuration import Configuration
+from resources import Resources
+from utils import sstr
+
+clr.AddReference('System')
+from System import DateTime
+from System.IO import Directory, Path, SearchOption
+
+# the extensions of the files that load_books treats as comic books
+__COMIC_EXTENSIONS = ['.cbz', '.cbr', '.cb7', '.cbt', '.zip', '.rar', '.pdf']
+
+
+#==============================================================================
+class RescrapePolicy(object):
+   '''
+   A HeadlessEngine policy that only scrapes the books that already know their
+   IssueRefs from a previous scrape (i.e. "fast rescrapes"), and skips all of
+   the others.  A policy is what decides which issue each book is, instead of
+   the user.
+   '''
+
+   # the name of this policy (see POLICIES)
+   name_s = "rescrape"
+
+   # the status of the books that this policy can't decide about
+   undecided_s = "SKIPPED"
+
+   #===========================================================================
+   def choose_issue_ref(self, book, config):
+      '''
+      Returns the IssueRef for the given ComicBook, or None if this policy
+      can't decide which issue it is.  'config' is the current Configuration.
+      '''
+      return book.issue_ref
+
+
+
+#==============================================================================
+class AutoscrapePolicy(RescrapePolicy):
+   '''
+   A HeadlessEngine policy that fast rescrapes the books that it can, and
+   tries to autoscrape all of the others (see automatcher.)  Books that can't
+   be autoscraped are skipped.
+   '''
+
+   name_s = "autoscrape"
+
+   #===========================================================================
+   def choose_issue_ref(self, book, config):
+      ''' Overridden to autoscrape the books that can't be fast rescraped. '''
+
+      issue_ref = RescrapePolicy.choose_issue_ref(self, book, config)
+      if not issue_ref and book.issue_num_s:
+         series_ref = book.series_ref if config.fast_rescrape_b else None
+         series_ref = series_ref if series_ref else \
+            db.check_magic_file(book.path_s)
+         series_ref = series_ref if series_ref else \
+            automatcher.find_series_ref(book, config)
+         if series_ref:
+            issue_ref = db.query_issue_ref(series_ref, book.issue_num_s)
+      return issue_ref
+
+
+
+#==============================================================================
+class DelayPolicy(AutoscrapePolicy):
+   '''
+   A HeadlessEngine policy that is just like the AutoscrapePolicy, except that
+   books that can't be autoscraped (because the match is ambiguous) are
+   delayed, i.e. reported as needing to be scraped by the user, in the usual
+   interactive way, some other time.
+   '''
+
+   name_s = "delay"
+   undecided_s = "DELAYED"
+
+
+# maps the name of each policy -> the class for that policy
+POLICIES = dict([ (policy.name_s, policy)
+   for policy in [RescrapePolicy, AutoscrapePolicy, DelayPolicy] ])
+
+
+
+#==============================================================================
+class HeadlessEngine(object):
+   '''
+   A replacement for the ScrapeEngine that scrapes books without any dialogs,
+   windows or user interaction.  Wherever the ScrapeEngine would ask the user
+   something, a HeadlessEngine lets its policy decide instead (or gives up.)
+   It reports what happened to each book, and how quickly, when it's done.
+
+   A HeadlessEngine provides the same 'config' and 'comicrack' attributes that
+   the ScrapeEngine does, so ComicBooks can be scraped with either one.
+   '''
+
+   #===========================================================================
+   def __init__(self, comicrack, policy):
+      '''
+      Initializes this HeadlessEngine.
+      'comicrack' -> the ComicRack Application object (or a standin for it)
+      'policy' -> decides which issue each book is, i.e. a RescrapePolicy
+      '''
+
+      # the Configuration details for this HeadlessEngine; the user's settings
+      self.config = Configuration()
+      self.config.load_defaults()
+
+      # the ComicRack application object (or a standin for it)
+      self.comicrack = comicrack
+
+      # decides which issue each book is, instead of the user
+      self.__policy = policy
+
+      # becomes True when the 'cancel' method is called
+      self.__cancelled_b = False
+
+
+   #===========================================================================
+   def cancel(self):
+      ''' Stops this HeadlessEngine after the book that it's scraping now. '''
+      self.__cancelled_b = True
+
+
+   #===========================================================================
+   def scrape(self, books):
+      '''
+      Scrapes the given ComicRack books, and returns a report of the results
+      (see write_report) that contains the status of each book, along with
+      some overall throughput statistics.
+
+      This method initializes the db module, but it doesn't shut it down;
+      you must call db.shutdown() when you are done with this HeadlessEngine.
+      '''
+
+      if not self.config.api_key_s:
+         raise Exception("no API key; set one in the scraper's settings first")
+      db.initialize(**{'cv_apikey':self.config.api_key_s,
+         'cv_maxresults':self.config.max_search_results_n,
+         'local_series_search':self.config.local_series_search_b,
+         'mirror_database':Resources.MIRROR_DATABASE_FILE \
+            if self.config.mirror_database_b else None})
+
+      # 1. scrape the books in series order, so db's caches get reused
+      books = sort_books([ ComicBook(book, self) for book in books ], False)
+
+      log.debug("headless scraping ", len(books), " books with the '",
+         self.__policy.name_s, "' policy...")
+      start_ms = self.__now_ms()
+      results = []
+      for book in books:
+         if self.__cancelled_b:
+            break
+
+         # 2. scrape each book, and record what happened to it
+         book_start_ms = self.__now_ms()
+         status_s, issue_ref, error_s = self.__scrape_book(book)
+         results.append( { 'path' : book.path_s,
+            'series' : book.series_s, 'issue' : book.issue_num_s,
+            'status' : status_s, 'error' : error_s,
+            'issue_key' : sstr(issue_ref.issue_key) if issue_ref else None,
+            'seconds' : (self.__now_ms() - book_start_ms) / 1000.0 } )
+         log.debug("   ...", status_s, ": ",
+            Path.GetFileName(book.path_s) if book.path_s else book.series_s)
+
+      # 3. summarize the results
+      seconds_n = (self.__now_ms() - start_ms) / 1000.0
+      statuses = [result['status'] for result in results]
+      report = { 'policy' : self.__policy.name_s,
+         'books_n' : len(books),
+         'scraped_n' : statuses.count("SCRAPED"),
+         'skipped_n' : statuses.count("SKIPPED"),
+         'delayed_n' : statuses.count("DELAYED"),
+         'unfinished_n' : len(books) - len(results),
+         'seconds' : seconds_n,
+         'books_per_minute' : len(results) * 60.0 / max(seconds_n, 0.001),
+         'books' : results }
+      log.debug("...headless scrape done: ", report['scraped_n'],
+         " scraped, ", report['skipped_n'], " skipped, ", report['delayed_n'],
+         " delayed in ", int(seconds_n), " seconds (",
+         "{0:.1f}".format(report['books_per_minute']), " books per minute)")
+      return report
+
+
+   #===========================================================================
+   def __scrape_book(self, book):
+      '''
+      Scrapes the given ComicBook, if this HeadlessEngine's policy can decide
+      which issue it is.  Returns a tuple containing the book's status (one
+      of "SCRAPED", "SKIPPED" or "DELAYED"), the IssueRef that it was scraped
+      with (or None), and a description of the error that stopped it from
+      being scraped (or None.)
+      '''
+
+      if book.skip_b:
+         return "SKIPPED", None, None
+      try:
+         issue_ref = self.__policy.choose_issue_ref(book, self.config)
+         if not issue_ref:
+            return self.__policy.undecided_s, None, None
+         book.update( db.query_issue(issue_ref, self.config.update_rating_b) )
+         return "SCRAPED", issue_ref, None
+      except Exception as ex:
+         log.debug_exc("Error scraping book:")
+         return "DELAYED", None, sstr(ex)
+
+
+   #===========================================================================
+   def __now_ms(self):
+      ''' Returns the current time, in milliseconds. '''
+      return (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+
+
+
+#==============================================================================
+def load_books(source_s):
+   '''
+   Loads and returns a list of ComicRack books from the given source, which
+   is either a file that contains a pickled list of books (see tools/testdata),
+   or a directory.  For a directory, a new ComicRack book is created for each
+   comic file in it, or in any of its subdirectories.
+   '''
+
+   if Directory.Exists(source_s):
+      clr.AddReference('ComicRack.Engine')
+      from cYo.Projects.ComicRack.Engine import ComicBook as CRComicBook
+      books = []
+      for path_s in sorted(Directory.GetFiles(source_s, "*",
+            SearchOption.AllDirectories)):
+         if Path.GetExtension(path_s).lower() in __COMIC_EXTENSIONS:
+            book = CRComicBook()
+            book.FilePath = path_s
+            books.append(book)
+      return books
+   else:
+      with open(source_s, "r") as f:
+         return cPickle.load(f)
+
+
+#==============================================================================
+def write_report(report, file_s):
+   ''' Writes the given report (see HeadlessEngine.scrape) to the given file.'''
+   with open(file_s, "w") as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+
+
+
+#==============================================================================
+class _StandaloneComicRack(object):
+   '''
+   A standin for the ComicRack Application object, for when this module is
+   run as a standalone script (outside of ComicRack.)
+   '''
+
+   class AppImpl(object):
+      ProductVersion = '999.999.99999'
+      def GetComicPage(self, book, page_index):
+         return None
+      def SetCustomBookThumbnail(self, book, bitmap):
+         return True
+
+   @classmethod
+   def Localize(cls, resource, key, backuptext):
+      return backuptext
+
+   App = AppImpl()
+   MainWindow = None
+
+
+
+# =============================================================================
+if __name__ == '__main__':
+   # usage:  ipy headless.py <policy> <books> <report file>
+   import sys
+   Resources.initialize()
+   log.install()
+   try:
+      engine = HeadlessEngine(_StandaloneComicRack(), POLICIES[sys.argv[1]]())
+      report = engine.scrape(load_books(sys.argv[2]))
+      write_report(report, sys.argv[3])
+      print "{0} of {1} books scraped in {2:.0f}s ({3:.1f} books/minute)"\
+         .format(report['scraped_n'], report['books_n'], report['seconds'],
+            report['books_per_minute'])
+   finally:
+      db.shutdown()
+      log.uninstall()
@@ -6,7 +6,8 @@ import clr
 
 import log
 import utils
-from utils import sstr, natural_key
+from utils import sstr
+from dbutils import IssueNumberIndex
 from resources import Resources 
 from configuration import Configuration
 from comicform import ComicForm
@@ -19,10 +20,15 @@ from welcomeform import WelcomeForm
 from finishform import FinishForm
 import i18n
 from matchscore import MatchScore
-from comicbook import ComicBook
+from comicbook import ComicBook, sort_books
 import automatcher
-import dbutils
+from serieslookahead import SeriesLookahead
+from seriessearch import SeriesSearch
 from configform import ConfigForm
+from pipeline import concurrent_map, Stage
+from scrapejournal import ScrapeJournal
+from scrapeestimator import ScrapeEstimator
+from dryrunreport import DryRunReport
 
 clr.AddReference('System.Windows.Forms')
 from System.Windows.Forms import Application, MessageBox, \
@@ -30,8 +36,8 @@ from System.Windows.Forms import Application, MessageBox, \
 
 clr.AddReference('System')
 from System.IO import Path
-from System import GC, DateTime
-from System.Threading import Thread, ThreadStart
+from System import GC, DateTime, Environment
+from System.Threading import Monitor, ManualResetEvent
 
 clr.AddReference('System.Runtime')
 from System.Runtime.InteropServices import RuntimeInformation;
@@ -48,6 +54,34 @@ class ScrapeEngine(object):
    ComicForm window, which is present the during the entire scrape, always
    showing the user the current status of the ScrapeEngine.)
    '''
+   
+   # the longest series whose issues may be loaded in bulk before scraping 
+   __PRELOAD_MAX_ISSUES_N = 100
+   
+   # the number of books whose issue details are fast rescraped at once
+   __RESCRAPE_WORKERS_N = 4
+   
+   # the number of fast rescraped books that are updated together in a batch
+   __RESCRAPE_BATCH_N = 10
+   
+   # the number of issues whose details can be fetched in the background at 
+   # once, and the number that can be waiting or in progress at once
+   __FETCH_WORKERS_N = 2
+   __FETCH_CAPACITY_N = 4
+   
+   # marks the issues in __issue_results whose details are still being fetched
+   __FETCHING = object()
+   
+   # the number of scraped books whose details are written out together, when
+   # the user wants them written in batches (see __update_book)
+   __WRITE_BATCH_N = 50
+   
+   # the maximum number of fetched issues that __issue_results remembers
+   __ISSUE_RESULTS_SIZE = 500
+   
+   # the number of bytes that the managed heap can grow by (since the last time
+   # we checked it was smaller) before we force a garbage collection.  
+   __GC_GROWTH_BYTES = 128 * 1024 * 1024
 
    # ==========================================================================
    def __init__(self, comicrack):
@@ -71,6 +105,24 @@ class ScrapeEngine(object):
       # where 'book' is the new book being scraped and 'num_remaining' is the 
       # number of books left to scrape, including the one currently starting
       self.start_scrape_listeners = []
+      
+      # a list of methods that will each be fired whenever a batch of books 
+      # has been fast rescraped (see __fast_rescrape).  these methods should
+      # look like:
+      #             rescraped(books, num_remaining, books_per_minute_n)
+      #
+      # where 'books' is the batch of books that were just rescraped, and 
+      # 'num_remaining' is the number of books left to scrape after them.
+      self.rescrape_listeners = []
+      
+      # a list of methods that will each be fired whenever we have a new 
+      # estimate of how long the rest of the scrape operation will take.  
+      # these methods should look like:
+      #             estimated(remaining_ms, books_per_hour_n)
+      #
+      # where 'remaining_ms' is the estimated number of milliseconds left, and
+      # 'books_per_hour_n' is the number of books scraped per hour, so far.
+      self.estimate_listeners = []
 
       # a list of no-argument methods that will each be fired once 
       # when (and if) the scrape operation gets cancelled.
@@ -81,6 +133,10 @@ class ScrapeEngine(object):
       # soon as possible.
       self.__cancelled_b = False
       
+      # an event that is set at the same time as self.__cancelled_b, so that 
+      # anything that's waiting on it wakes up as soon as we're cancelled
+      self.__cancelled_event = ManualResetEvent(False)
+      
       # a list of two values, the first value tells how many books this 
       # scrape engine has scraped, the second tells how many it has skipped.
       # it becomes valid as soon as the main processing loop starts running.
@@ -90,6 +146,76 @@ class ScrapeEngine(object):
       # series' the user has chosen while scraping.  it can then be used to
       # help present better sorted choices to the user in the future.
       self.__matchscore = MatchScore()
+      
+      # maps each unique series key to the number of books with that key that
+      # are still waiting to be scraped in the current scrape operation. 
+      self.__pending_counts = {}
+      
+      # maps the issue key (a string) of each previously scraped book to the 
+      # date that the database last changed that issue.  only used when the
+      # user wants to rescrape just the issues that have changed.
+      self.__issue_updates = {}
+      
+      # maps each folder that we've looked in for a 'magic' file to the 
+      # SeriesRef in that file, or None if there wasn't one.
+      self.__magic_series_refs = {}
+      
+      # the pipeline stage that fetches the details of the issues that the 
+      # Main Processing Loop identifies in the background, so that the loop 
+      # can move on to the next book right away.  the details are copied into
+      # their books later, on the loop's thread; see __write_fetched_issues.
+      self.__fetch_stage = None
+      
+      # the total milliseconds spent copying fetched details into books
+      self.__write_ms = 0
+      
+      # the ScrapeJournal that records the outcome of each book as we go, so
+      # that this scrape can be resumed if it doesn't finish; see __scrape.
+      self.__journal = None
+      
+      # maps the issue key (a string) of every issue whose details we've 
+      # fetched in the current scrape operation to the fetched Issue, so that
+      # other books with the same issue (duplicates, variant scans, cbz and cbr
+      # copies, etc.) can reuse it.  an issue whose details are still being
+      # fetched maps to ScrapeEngine.__FETCHING.  see __query_issue.
+      self.__issue_results = {}
+      
+      # the keys of the fetched Issues in __issue_results, oldest first
+      self.__issue_results_order = []
+      
+      # the number of times that __query_issue reused a fetched Issue, i.e. 
+      # the number of database queries that self.__issue_results saved us
+      self.__reused_issues_n = 0
+      
+      # a lock that guards self.__issue_results and self.__reused_issues_n
+      self.__issue_lock = object()
+      
+      # the time (in ms) that the Main Processing Loop started the last book, 
+      # and the number of database requests that the loop's own thread had
+      # made at that time (see db.get_thread_query_count_n)
+      self.__book_start_ms = 0
+      self.__book_query_count_n = 0
+      
+      # the smallest size (in bytes) that the managed heap has been since we
+      # last forced a garbage collection, and the number of times we've forced
+      # one, and the largest working set (in bytes) we've seen.  see 
+      # __check_memory.
+      self.__gc_heap_n = 0
+      self.__gc_forced_n = 0
+      self.__peak_working_set_n = 0
+      
+      # the ScrapeEstimator that measures how long each kind of book takes to
+      # scrape, and estimates how long the rest of the scrape will take.
+      self.__estimator = None
+      
+      # the DryRunReport that records what each book WOULD have changed, if
+      # the user wants a dry run (instead of changing books), otherwise None
+      self.__dry_run = None
+      
+      # the scraped books whose details haven't been written out yet, when the
+      # user wants them written in batches.  each is a (ComicBook, IssueRef, 
+      # SeriesRef) tuple; see __update_book and __write_unwritten_books.
+      self.__unwritten_books = []
 
 
 
@@ -105,6 +231,7 @@ class ScrapeEngine(object):
          # do this on calling thread, even if its not the mainwindow UI
          # thread, cause that thread could be blocked by SCRAPE_DELAY
          self.__cancelled_b = True 
+         self.__cancelled_event.Set()
          def delegate(): 
             for cancel_listener in self.cancel_listeners:
                cancel_listener()
@@ -205,7 +332,10 @@ class ScrapeEngine(object):
       
       # 4. fire up our database connection
       db.initialize(**{'cv_apikey':self.config.api_key_s,
-                       'cv_maxresults':self.config.max_search_results_n}) 
+         'cv_maxresults':self.config.max_search_results_n,
+         'local_series_search':self.config.local_series_search_b,
+         'mirror_database':Resources.MIRROR_DATABASE_FILE \
+            if self.config.mirror_database_b else None}) 
       
       # 5. sort the ComicBooks in the order that we're gonna loop them in
       #    (sort AFTER config is loaded cause config affects the sort!)
@@ -216,29 +346,86 @@ class ScrapeEngine(object):
       #    around for the entire time that the this scrape operation is running.
       comic_form = ComicForm.show_threadsafe(self)
       
+      # this searches for the series of upcoming books in the background
+      lookahead = SeriesLookahead(self.config)
+      self.cancel_listeners.append(lookahead.cancel)
+      
+      # this fetches issue details in the background, while we keep looping
+      self.__fetch_stage = Stage(self.__fetch_issue, 
+         ScrapeEngine.__FETCH_WORKERS_N, ScrapeEngine.__FETCH_CAPACITY_N)
+      self.cancel_listeners.append(self.__fetch_stage.cancel)
+      
+      finished_b = False
       try:
-         # this caches the scraped data we've accumulated as we loop
-         scrape_cache = {}
+         # this records what happens to each book, so that we can pick up
+         # where we left off if this scrape doesn't finish.  if the last
+         # scrape didn't finish, skip the books that it already finished.
+         self.__journal = ScrapeJournal( None if self.config.dry_run_b 
+            else Resources.JOURNAL_FILE, self.config.resume_scrape_b )
+         if self.config.dry_run_b:
+            log.debug("DRY RUN: no books will be changed by this scrape")
+            self.__dry_run = DryRunReport(Resources.DRY_RUN_FILE)
+         unfinished = [b for b in books if not self.__journal.finished_b(b)]
+         if len(unfinished) < len(books):
+            log.debug("skipping ", len(books) - len(unfinished), 
+               " books that the last (unfinished) scrape already finished")
+            self.__status[1] -= len(books) - len(unfinished)
+            books = unfinished
+         
+         # this caches the scraped data we've accumulated as we loop.  it
+         # starts with the series that the last unfinished scrape chose.
+         scrape_cache = dict([ (key, ScrapedSeries(series_ref)) for key, 
+            series_ref in self.__journal.series_refs.iteritems() ])
+         
+         # this estimates how long the rest of the scrape will take
+         self.__estimator = ScrapeEstimator()
+         for book in books:
+            self.__estimator.add_books(self.__predict_kind_s(book, False))
+         
+         # this helps us decide how to look up the issues in each series
+         self.__pending_counts = self.__count_pending_books(books)
+         
+         # this tells us which of the books' issues have changed online
+         if self.config.fast_rescrape_b and self.config.incremental_rescrape_b:
+            self.__issue_updates = self.__query_issue_updates(books)
+            
+         # this loads the issues of all the short series that we already know
+         # some books belong to, so we don't have to look them up one by one
+         self.__preload_issue_refs(books)
+         
+         # 7. rescrape all the books that already know their issues, in bulk.
+         #    the rest of the books go through the Main Processing Loop.
+         if self.config.fast_rescrape_b:
+            books = self.__fast_rescrape(books)
          
-         # 7. start the "Main Processing Loop". 
+         # 8. start the "Main Processing Loop". 
          #    notice the list of books can get longer while we're looping,
          #    if we choose to delay processing a book until the end.
          i = 0
          orig_length = len(books)
-         while i < len(books):
-            if self.__cancelled_b: break
+         while True:
+            # 8a. copy the details that were fetched in the background into 
+            #     their books.  once we run out of books, wait for the rest of
+            #     the details (books whose details fail will be delayed.)
+            self.__write_fetched_issues(books, orig_length, i >= len(books))
+            if self.__cancelled_b or i >= len(books): break
             book = books[i]
             
-            # 7a. wait for the scrape delay to pass after scraping each book.  
-            #     don't do this for books that have been delayed or for the 
-            #     first book that the user scrapes.
+            # 8b. wait for the scrape delay to pass after scraping each book
+            #     that made database requests.  don't do this for books that
+            #     have been delayed, or for the first book that we scrape.
             delayed_b = i >= orig_length # book was delayed until the end
+            kind_s = self.__predict_kind_s(book, delayed_b)
+            self.__estimator.start(kind_s)
             if i != 0 and not delayed_b:
                self.__wait_until_ready()
                if self.__cancelled_b: break  # user cancelled while we waited
+            self.__book_start_ms = \
+               (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+            self.__book_query_count_n = db.get_thread_query_count_n()
                
 
-            # 7b. notify 'start_scrape_listeners' that we're scraping a new book
+            # 8c. notify 'start_scrape_listeners' that we're scraping a new book
             
             log.debug("======> scraping next comic book: '",
                'FILELESS ("' + book.series_s +" #"+ book.issue_num_s+ ''")"
@@ -246,8 +433,13 @@ class ScrapeEngine(object):
             num_remaining = len(books) - i
             for start_scrape in self.start_scrape_listeners:
                start_scrape(book, num_remaining)
+               
+            # 8d. while we work on this book, get a head start on searching  
+            #     for the series of the next few books.
+            if not delayed_b:
+               lookahead.look_ahead(books[i+1:orig_length], scrape_cache)
 
-            # 7c. ...keep trying to scrape that book until either it is scraped,
+            # 8e. ...keep trying to scrape that book until either it is scraped,
             #     the user chooses to skip it, or the user cancels altogether.
             manual_search_b = False
             fast_rescrape_b = self.config.fast_rescrape_b and not delayed_b
@@ -271,9 +463,18 @@ class ScrapeEngine(object):
                   # book was scraped normally, all is good, update status
                   self.__status[0] += 1
                   self.__status[1] -= 1
+                  self.__finish_pending_book(book)
+                  break
+               elif bookstatus.equals("FETCHING"):
+                  # book's issue was found, and its details are being fetched
+                  # in the background.  status is updated when they arrive.
+                  self.__finish_pending_book(book)
                   break
                elif bookstatus.equals("SKIPPED"):
                   # book was skipped, status is already correct for that book
+                  self.__finish_pending_book(book)
+                  if not self.__cancelled_b:
+                     self.__journal.record(book, "SKIPPED")
                   break
                elif bookstatus.equals("DELAYED"):
                   # put this book into the end of the list, where we can try
@@ -281,17 +482,49 @@ class ScrapeEngine(object):
                   # automatically.  ignore it if it's already been delayed.
                   if not delayed_b: 
                      books.append(book)
+                     self.__estimator.add_books(
+                        self.__predict_kind_s(book, True))
+                  self.__journal.record(book, "DELAYED")
                   break
             
+            # update our estimate of how long the rest of the books will take
+            self.__estimator.finish()
+            self.__fire_estimate_listeners()
+            
             # keep memory usage from getting out of control!
-            GC.Collect()
-            GC.WaitForPendingFinalizers()
+            self.__check_memory()
             
             log.debug()
             log.debug()
             i = i + 1
+         finished_b = not self.__cancelled_b
             
       finally:
+         # copy the details that are already being fetched into their books,
+         # even if we've been cancelled, and drop the rest
+         dropped = self.__fetch_stage.cancel()
+         if dropped:
+            log.debug("cancelled fetching details for ",len(dropped)," books")
+         self.__write_fetched_issues(books, len(books), True)
+         self.__fetch_stage.shutdown(False)
+         self.__log_fetch_timing()
+         self.__write_unwritten_books()
+         if self.__dry_run:
+            self.__dry_run.close()
+         if self.__journal:
+            self.__journal.close(finished_b)
+         if self.__estimator:
+            self.__estimator.log_summary()
+         if self.__reused_issues_n:
+            log.debug("reused fetched issue details for ", 
+               self.__reused_issues_n, " books (saved ", 
+               self.__reused_issues_n, " database queries)")
+         self.__issue_results = {}
+         self.__issue_results_order = []
+         log.debug("memory: peak working set was ", 
+            self.__peak_working_set_n / (1024*1024), "MB;  forced ",
+            self.__gc_forced_n, " garbage collections")
+         lookahead.shutdown()
          self.comicrack.MainWindow.Activate() # fixes issue 159
          if comic_form: comic_form.close_threadsafe()
          
@@ -357,6 +590,9 @@ class ScrapeEngine(object):
        BookStatus("DELAYED"): if we attempted to automatically scrape the book,
           but failed.  the book has not been scraped successfully.
           
+       BookStatus("FETCHING"): if we found the book's issue, and its details 
+          are being fetched in the background (see __write_fetched_issues.)
+          
        
       '''
 
@@ -380,11 +616,16 @@ class ScrapeEngine(object):
       #    if an error occurs, retry a manual scrape later on.
       issue_ref = book.issue_ref
       if issue_ref and fast_rescrape_b:
+         if book.updated_s and book.updated_s == \
+               self.__issue_updates.get(sstr(issue_ref.issue_key)):
+            log.debug("issue '", sstr(issue_ref), "' hasn't changed since ",
+               "this book was scraped, so skipping it.")
+            return BookStatus("SKIPPED")
          log.debug("rescraping details in book identified its issue as: '",
             sstr(issue_ref), "'")
          try:
-            issue = db.query_issue(issue_ref, self.config.update_rating_b)
-            book.update(issue)
+            issue = self.__query_issue(issue_ref)
+            self.__update_book(book, issue, issue_ref)
             return BookStatus("SCRAPED")
          except:
             log.debug_exc("Error rescraping details:")
@@ -413,7 +654,7 @@ class ScrapeEngine(object):
       #     what series the book belongs to.  if so, add that map that book
       #     to that series in the scrape_cache.
       if key not in scrape_cache and not manual_search_b:
-         magic_series_ref = db.check_magic_file(book.path_s)
+         magic_series_ref = self.__check_magic_file(book)
          if magic_series_ref:        
             log.debug("a 'magic' file identified this book's series as: '",
               magic_series_ref, "'")
@@ -442,7 +683,7 @@ class ScrapeEngine(object):
       #     goal is to get some potential SeriesRefs to show the user. 
       #     METHOD EXIT: if the user cancels or skips from the search dialog.          
       search_terms_s = None
-      series_refs = None
+      series_search = None
       if key not in scrape_cache: 
          # get search terms for the book that we're scraping
          search_terms_s = book.series_s
@@ -463,13 +704,15 @@ class ScrapeEngine(object):
             elif search_form_result.equals("SKIP"):
                return BookStatus("SKIPPED")
             elif search_form_result.equals("PERMSKIP"):
-               book.skip_forever()
+               self.__skip_forever(book)
                return BookStatus("SKIPPED")
-         # query the database for series_refs that match the search terms
-         series_refs = self.__query_series_refs(search_terms_s)
+         # query the database for series_refs that match the search terms.
+         # if the user typed in the search terms, always search online.
+         series_search = self.__query_series_refs(
+            search_terms_s, not manual_search_b)
          if self.__cancelled_b: 
             return BookStatus("SKIPPED")
-         if not series_refs:
+         if not series_search.series_refs:
             # include failed search terms here, so search dialog mentions them
             return BookStatus("UNSCRAPED", search_terms_s)
 
@@ -482,10 +725,10 @@ class ScrapeEngine(object):
       while True:
          force_issue_dialog_b = self.config.confirm_issue_b 
          if key not in scrape_cache: 
-            if not series_refs or not search_terms_s:
+            if not series_search or not search_terms_s:
                return BookStatus("UNSCRAPED") # rare but possible, bug 77
             series_form_result =\
-               self.__choose_series_ref(book, search_terms_s, series_refs)
+               self.__choose_series_ref(book, search_terms_s, series_search)
             
             if series_form_result.equals("CANCEL") or self.__cancelled_b:
                self.__cancelled_b = True
@@ -493,7 +736,7 @@ class ScrapeEngine(object):
             elif series_form_result.equals("SKIP"):
                return BookStatus("SKIPPED") # user says 'skip this book'
             elif series_form_result.equals("PERMSKIP"):
-               book.skip_forever()
+               self.__skip_forever(book)
                return BookStatus("SKIPPED") # user says 'skip book always'
             elif series_form_result.equals("SEARCH"): 
                return BookStatus("UNSCRAPED") # user says 'search again'
@@ -536,7 +779,8 @@ class ScrapeEngine(object):
                   refs = self.__query_issue_refs(series_ref)
                   if len(refs) == 1: issue_ref = list(refs)[0]
             else:
-               issue_ref = db.query_issue_ref( series_ref, book.issue_num_s )
+               issue_ref = self.__query_issue_ref( 
+                  book, series_ref, scraped_series.issue_refs )
                
             if issue_ref == None:
                log.debug("couldn't find issue number.  leaving until the end.")
@@ -561,7 +805,7 @@ class ScrapeEngine(object):
                   # ignore his previous series selection.
                   del scrape_cache[key]
                if issue_form_result.equals("PERMSKIP"):
-                  book.skip_forever()
+                  self.__skip_forever(book)
                return BookStatus("SKIPPED")
             elif issue_form_result.equals("BACK"):
                # ignore user's previous series selection
@@ -570,16 +814,18 @@ class ScrapeEngine(object):
                issue_ref = issue_form_result.get_ref() # not None!
          
          if issue_ref != None:      
-            # we've found the right issue!  copy it's data into the book.
-            log.debug("querying comicvine for issue details...")
-            issue = db.query_issue( issue_ref, self.config.update_rating_b )
-            book.update(issue)
+            # we've found the right issue!  fetch its details in the background,
+            # so we can move on.  they're copied into the book later on.
+            log.debug("fetching issue details in the background...")
+            if not self.__fetch_stage.put( 
+                  (book, issue_ref, scraped_series.series_ref) ):
+               return BookStatus("SKIPPED") # the scrape was cancelled
             
             # record the users choice.  this allows the SeriesForm to give this
             # choice a higher priority (sort order) in the future
             self.__matchscore.record_choice(scraped_series.series_ref)
             
-            return BookStatus("SCRAPED")
+            return BookStatus("FETCHING")
 
       raise Exception("should never get here")
 
@@ -595,65 +841,41 @@ class ScrapeEngine(object):
       the beginning of the list.
       '''
       
-      # this is the comparator we'll use for sorting this list
-      def __compare_books(book1, book2):
-         result = book1.unique_series_s.CompareTo(book2.unique_series_s)
-         if result == 0:
-            num1 = '' if not book1.issue_num_s else book1.issue_num_s
-            num2 = '' if not book2.issue_num_s else book2.issue_num_s
-            def pad(num):
-               try:
-                  f = float(num.lower().strip('abcdefgh'))
-                  if f < 10: return "000" + num
-                  elif f < 100: return "00" + num
-                  elif f < 1000: return "0" + num
-                  else: return num
-               except:
-                  return num
-            result = pad(num1).CompareTo(pad(num2))
-         return result
-
-      # divide the books up into the ones that will scrape quickly ('cause they
-      # are rescrapes) and ones that have never been scraped before.  sort each
-      # group separately, and append the sorted lists together so the fast ones 
-      # will come first.   (the idea is to save the user interaction until
+      # the books that will scrape quickly ('cause they are rescrapes) are 
+      # sorted separately from the ones that have never been scraped before, 
+      # and come first.   (the idea is to save the user interaction until
       # the end of the scrape operation.  see issue 161.)
-      slow_scrape_books = []
-      fast_scrape_books = []
-      if self.config.fast_rescrape_b:
-         for book in books:
-            if book.skip_b or book.issue_ref:
-               fast_scrape_books.append(book)
-            else:
-               slow_scrape_books.append(book)
-      else:
-         slow_scrape_books = list(books)
-      
-      slow_scrape_books.sort(cmp=__compare_books)     
-      fast_scrape_books.sort(cmp=__compare_books)     
-      
-      return fast_scrape_books+slow_scrape_books
+      start_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+      books = sort_books(books, self.config.fast_rescrape_b)
+      log.debug("sorted ", len(books), " books in ", 
+         int((DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds - start_ms),
+         "ms")
+      return books
 
 
 
    # ==========================================================================   
-   def __choose_series_ref(self, book, search_terms_s, series_refs):
+   def __choose_series_ref(self, book, search_terms_s, series_search):
       '''
       This method displays the SeriesForm, a dialog that shows all of the
       SeriesRefs from a database query and asks the user to choose one.
       
       'book' -> the book that we are currently scraping
       'search_terms_s' -> the search terms we used to find the SeriesRefs
-      'series_refs' -> a set of SeriesRefs; the results of the search
+      'series_search' -> the SeriesSearch that is finding the SeriesRefs; 
+           results that it hasn't found yet will be added to the SeriesForm
+           as they arrive.
       
       This method returns a SeriesFormResult object (from the SeriesForm). 
       '''
       
       
       result = SeriesFormResult("SEARCH") # default
+      series_refs = series_search.series_refs
       if series_refs:
          log.debug('displaying the series selection dialog...')
-         with  SeriesForm(self, book, series_refs, search_terms_s) as sform:
+         with  SeriesForm(self, book, series_refs, search_terms_s, 
+               series_search) as sform:
             result = sform.show_form() 
          log.debug('   ...user chose to ', result.get_debug_string())
       return result
@@ -690,7 +912,7 @@ class ScrapeEngine(object):
       #    if that fails, get all the issue refs for this series (so we can
       #    search for the issue the long way.)  
       if len(issue_refs) == 0 and issue_num_s and not force_b:
-         issue_ref = db.query_issue_ref(series_ref, book.issue_num_s)
+         issue_ref = self.__query_issue_ref(book, series_ref, issue_refs)
          if issue_ref:
             result = IssueFormResult("OK", issue_ref) # found it!
             log.debug("   ...identified issue number ", issue_num_s )
@@ -712,19 +934,14 @@ class ScrapeEngine(object):
 
       # 3. try to find the issue number directly in the given issue_refs.  
       if not result and len(issue_refs) > 0 and issue_num_s:
-         counts = {}
-         for ref in issue_refs:
-            counts[ref.issue_num_s] = counts.get(ref.issue_num_s, 0) + 1
-         if issue_num_s in counts and counts[issue_num_s] > 1:
+         # use natural keys for issue comparison
+         matches = IssueNumberIndex(issue_refs).find(issue_num_s)
+         if len(matches) > 1:
             # the same issue number appears more than once! user must pick.
             log.debug("   ...found more than one issue number ", issue_num_s, )
-         else:
-            for ref in issue_refs:
-               # use natural keys for issue comparison
-               if natural_key(ref.issue_num_s) == natural_key(issue_num_s):
-                  result = IssueFormResult("OK", ref) # found it!
-                  log.debug("   ...identified issue number ", issue_num_s, )
-                  break
+         elif len(matches) == 1:
+            result = IssueFormResult("OK", matches[0]) # found it!
+            log.debug("   ...identified issue number ", issue_num_s, )
 
       # 4. if we don't know the issue number, and there is only one issue in 
       # the series, then it is very likely that the database simply has no issue
@@ -753,51 +970,546 @@ class ScrapeEngine(object):
 
 
    # ==========================================================================   
-   def __query_series_refs(self, search_terms_s):
+   def __query_series_refs(self, search_terms_s, local_b):
       '''
-      This method queries the online database for a set of SeriesRef objects
-      that match the given (non-empty) search terms.   It will return a set 
-      of SeriesRefs, which may be empty if no matches could be found.
+      This method starts querying the online database for the SeriesRef 
+      objects that match the given (non-empty) search terms.   It returns a 
+      SeriesSearch that has already found the first page (or so) of those 
+      SeriesRefs; the rest can be fetched later, while the user is looking at 
+      the first ones.  The returned search may have found no SeriesRefs at all, 
+      if no matches could be found. 
+      
+      If 'local_b' is True, the search may be answered from the local series
+      index instead of online (see db.query_series_refs). 
       '''
       if not search_terms_s:
          raise Exception("cannot query for empty search terms")
       
-      # 1. query the database for series
-      with ProgressBarForm(self.comicrack.MainWindow, self) as progbar:
-         # this function gets called each time an series_ref is obtained
-         def callback(num_matches_n, expected_callbacks_n):
-            if not self.__cancelled_b:
-               if not progbar.Visible:
-                  progbar.pb.Maximum = expected_callbacks_n
-                  progbar.show_form()
-               if progbar.Visible and not self.__cancelled_b:
-                  progbar.pb.PerformStep()
-                  progbar.Text = \
-                     i18n.get("SearchProgbarText").format(sstr(num_matches_n))
-            Application.DoEvents()
-            return self.__cancelled_b
-         log.debug("searching for series that match '", search_terms_s, "'...")
+      # 1. query the database for series, stopping as soon as we've found some
+      #    that the user's filters don't remove (usually on the first page)
+      log.debug("searching for series that match '", search_terms_s, "'...")
+      series_search = SeriesSearch(self.config, search_terms_s, local_b)
+      while not series_search.series_refs and not self.__cancelled_b:
+         if series_search.next_batch() is None:
+            break
+         Application.DoEvents() # so the user can cancel between pages
          
-         series_refs = db.query_series_refs( search_terms_s,
-            self.config.ignored_searchterms_sl, callback )
+      # 2. some userful debug output
+      if not series_search.done_b:
+         log.debug("...found {0} results so far".format(
+            len(series_search.series_refs)))
+      return series_search
+
+
+
+   # ==========================================================================   
+   def __query_issue_ref(self, book, series_ref, issue_refs):
+      '''
+      This method finds the IssueRef for the given book's issue number in the 
+      given SeriesRef, or returns None if there is no such IssueRef.  
+      
+      'issue_refs' -> the set of all IssueRefs in the given series, if we have 
+           them already, or else an empty set.  If this method decides to get 
+           all of the series' IssueRefs, it adds them to this set. 
+      
+      Looking up one issue number takes at least one request to the database,
+      but getting all of a series' IssueRefs takes one request per 100 issues.
+      So if enough of the books that we are scraping are in the same series, 
+      it is cheaper to get all of its IssueRefs once, and then look up each 
+      book's issue number in them without making any more requests at all.
+      '''
+      
+      # 1. decide whether to get all the IssueRefs in the series
+      pending_n = self.__pending_counts.get(book.unique_series_s, 1)
+      pages_n = max(1, (series_ref.issue_count_n + 99) // 100)
+      if len(issue_refs) == 0 and pending_n > pages_n:
+         log.debug("   ...", pending_n, " books to scrape in this series, so",
+            " getting all of its issues (", pages_n, " requests)")
+         for ref in self.__query_issue_refs(series_ref):
+            issue_refs.add(ref) # do NOT make a new set here!
+      
+      # 2. look up the issue number.  if we just got all the IssueRefs in the
+      #    series, the db looks it up in them without making any requests. 
+      return db.query_issue_ref(series_ref, book.issue_num_s)
+
+
+
+   # ==========================================================================   
+   def __count_pending_books(self, books):
+      '''
+      Returns a map of unique series keys to the number of the given books 
+      with that key that may need their issue numbers looked up when they are
+      scraped (see __query_issue_ref.)
+      '''
+      
+      pending_counts = {}
+      for book in books:
+         if book.skip_b or not book.issue_num_s:
+            continue
+         if self.config.fast_rescrape_b and book.issue_ref:
+            continue # this book won't need to have its issue looked up
+         key = book.unique_series_s
+         pending_counts[key] = pending_counts.get(key, 0) + 1
+      return pending_counts
+   
+   
+   
+   # ==========================================================================   
+   def __preload_issue_refs(self, books):
+      '''
+      Finds every short series that some of the given ComicBooks are already
+      known to belong to (see steps 3a and 3b in __scrape_book), and loads all 
+      of the IssueRefs in those series in bulk, many series per query (see 
+      db.preload_issue_refs.)  Afterwards, the issues of those books can be 
+      looked up without querying the database again.
+      
+      Series whose length isn't known (like the sparse SeriesRefs that books 
+      rebuild from their key tags) are left out, since they may be long.
+      '''
+      
+      series_refs = set()
+      for book in books:
+         if book.skip_b or not book.issue_num_s:
+            continue
+         if self.config.fast_rescrape_b and book.issue_ref:
+            continue # this book won't need to have its issue looked up
+         series_ref = book.series_ref if self.config.fast_rescrape_b else None
+         series_ref = series_ref if series_ref else \
+            self.__check_magic_file(book)
+         if series_ref and 0 < series_ref.issue_count_n \
+               <= ScrapeEngine.__PRELOAD_MAX_ISSUES_N:
+            series_refs.add(series_ref)
+      if len(series_refs) < 2:
+         return # no faster than looking up the issues the usual way
+      
+      log.debug("loading the issues in ", len(series_refs), " known series...")
+      try:
+         db.preload_issue_refs(series_refs)
+         log.debug("...done loading")
+      except:
+         log.debug_exc("...couldn't load them, so looking them up as we go:")
+      log.debug()
+   
+   
+   
+   # ==========================================================================   
+   def __fast_rescrape(self, books):
+      '''
+      Rescrapes (see step 2 of __scrape_book) all of the given ComicBooks that
+      already know their IssueRefs from a previous scrape, without the per-book
+      overhead of the Main Processing Loop.  The issue details for several 
+      books are requested at once (see pipeline.concurrent_map), but all the 
+      requests still share the database's global throttle.  The books are 
+      updated here, on this thread, in small batches.
+      
+      Returns a list of the given books that still need to go through the 
+      Main Processing Loop, in the same order.  That includes any books that 
+      couldn't be rescraped here because of an error.
+      '''
+      
+      # 1. find the books that can be rescraped, and skip the ones whose 
+      #    issues haven't changed since they were last scraped
+      items = []
+      done_ids = set()
+      for book in books:
+         issue_ref = None if book.skip_b else book.issue_ref
+         if issue_ref:
+            if book.updated_s and book.updated_s == \
+                  self.__issue_updates.get(sstr(issue_ref.issue_key)):
+               done_ids.add(id(book))
+               self.__finish_pending_book(book)
+               self.__journal.record(book, "SKIPPED", issue_ref)
+            else:
+               items.append((book, issue_ref))
+      self.__estimator.add_books("rescrape", -len(done_ids))
+      if not items:
+         return [book for book in books if id(book) not in done_ids]
+      
+      log.debug("fast rescraping ", len(items), " books (skipping ", 
+         len(done_ids), " unchanged books)...")
+      def query_issue(item):
+         try:
+            return self.__query_issue(item[1])
+         except:
+            log.debug_exc("Error rescraping details for '"+sstr(item[1])+"':")
+            return None
          
-      # 2. filter out any series that the user has specified
-      filtered_refs = dbutils.filter_series_refs(series_refs,
-         self.config.ignored_publishers_sl, 
-         self.config.ignored_before_year_n,
-         self.config.ignored_after_year_n,
-         self.config.never_ignore_threshold_n)
-      
-      # 3. some userful debug output
-      filtered_n = len(series_refs) - len(filtered_refs) 
-      if filtered_n > 0:
-         log.debug("...filtered out ", filtered_n, " (of ", 
-            len(series_refs), ") results.")
-      if len(filtered_refs) == 0:
-         log.debug("...no results found for this search")
+      # 2. get the issue details for the books, several at a time, and update
+      #    each batch of books as soon as all of their details arrive.
+      start_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+      remaining_n = len(books) - len(done_ids)
+      scraped_n = 0
+      batch = []
+      issues = concurrent_map(query_issue, items, 
+         ScrapeEngine.__RESCRAPE_WORKERS_N, 2*ScrapeEngine.__RESCRAPE_BATCH_N)
+      try:
+         self.__estimator.start("rescrape")
+         for i, issue in enumerate(issues):
+            if self.__cancelled_b:
+               break
+            if issue:
+               batch.append((items[i][0], items[i][1], issue))
+            if len(batch) >= ScrapeEngine.__RESCRAPE_BATCH_N or \
+                  i == len(items) - 1:
+               
+               # 3. update this batch of books (on this thread) and report it
+               rescraped = []
+               for book, issue_ref, issue in batch:
+                  try:
+                     self.__update_book(book, issue, issue_ref)
+                     rescraped.append(book)
+                     done_ids.add(id(book))
+                     self.__finish_pending_book(book)
+                     self.__status[0] += 1
+                     self.__status[1] -= 1
+                  except:
+                     log.debug_exc("Error updating '" + sstr(issue) + "':")
+               batch = []
+               
+               if rescraped:
+                  scraped_n += len(rescraped)
+                  remaining_n -= len(rescraped)
+                  now_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+                  books_per_minute_n = scraped_n * 60000.0 / \
+                     max(1.0, now_ms - start_ms)
+                  for rescraped_listener in self.rescrape_listeners:
+                     rescraped_listener(rescraped, remaining_n, 
+                        books_per_minute_n)
+                  self.__estimator.finish(len(rescraped))
+                  self.__fire_estimate_listeners()
+                  self.__estimator.start("rescrape")
+               Application.DoEvents()
+               self.__check_memory()
+      finally:
+         self.__estimator.finish(0)
+         issues.close()
+         
+      elapsed_s = sstr(int(((DateTime.Now-DateTime(1970,1,1)).\
+         TotalMilliseconds - start_ms) / 1000))
+      log.debug("...rescraped ", scraped_n, " of ", len(items), 
+         " books in ", elapsed_s, " seconds")
+      log.debug()
+      return [book for book in books if id(book) not in done_ids]
+   
+   
+   
+   # ==========================================================================   
+   def __fetch_issue(self, fetch_item):
+      '''
+      The function for self.__fetch_stage (runs on a background thread!)  
+      Queries the database for the details of the IssueRef in the given 
+      (ComicBook, IssueRef, SeriesRef) tuple, and returns them as an Issue,
+      or returns None if that can't be done.
+      '''
+      
+      issue_ref = fetch_item[1]
+      try:
+         return self.__query_issue(issue_ref)
+      except:
+         log.debug_exc("Error fetching details for '" + sstr(issue_ref) + "':")
+         return None
+   
+   
+   
+   # ==========================================================================   
+   def __write_fetched_issues(self, books, first_pass_n, block_b):
+      '''
+      Takes the Issues that have been fetched out of self.__fetch_stage, and
+      copies each one into the ComicBook that it was fetched for.  That always
+      happens on this thread, since books can't be changed in the background.
+      If 'block_b' is True, this method waits for all of the Issues that are 
+      still being fetched; otherwise, it only takes the ones that are done.
+      
+      When an Issue can't be fetched, its book is delayed (appended to the 
+      given list of books) unless it's one of the books after the first 
+      'first_pass_n' books in that list, i.e. it has already been delayed once.
+      Either way, the book is journalled as "DELAYED", just like a book that
+      is delayed by the Main Processing Loop.
+      '''
+      
+      fetched = self.__fetch_stage.take(block_b)
+      while fetched:
+         (book, issue_ref, series_ref), issue = fetched
+         start_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+         written_b = False
+         if issue:
+            log.debug("copying the fetched details for '", sstr(issue_ref),
+               "' into its book...")
+            try:
+               self.__update_book(book, issue, issue_ref, series_ref)
+               written_b = True
+            except:
+               log.debug_exc("Error copying details into book:")
+         
+         if written_b:
+            self.__status[0] += 1
+            self.__status[1] -= 1
+         else:
+            if not self.__cancelled_b and \
+                  not [b for b in books[first_pass_n:] if b is book]:
+               log.debug("we'll retry scraping '", sstr(issue_ref), 
+                  "' again at the end.")
+               books.append(book)
+               self.__estimator.add_books(self.__predict_kind_s(book, True))
+            self.__journal.record(book, "DELAYED")
+         self.__write_ms += \
+            (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds - start_ms
+         fetched = self.__fetch_stage.take(block_b)
+   
+   
+   
+   # ==========================================================================   
+   def __log_fetch_timing(self):
+      ''' 
+      Logs how long self.__fetch_stage spent fetching issue details, how long
+      this thread spent waiting for it, and how long this thread spent 
+      copying the fetched details into books.
+      '''
+      
+      stage = self.__fetch_stage
+      if stage.busy_ms > 0:
+         seconds = lambda ms: "{0:.1f}s".format(ms / 1000.0)
+         log.debug("fetching details: ", seconds(stage.busy_ms), 
+            " busy;  waited ", seconds(stage.full_ms), " for room and ", 
+            seconds(stage.empty_ms), " for details;  copying details: ",
+            seconds(self.__write_ms), " busy")
+   
+   
+   
+   # ==========================================================================   
+   def __query_issue(self, issue_ref):
+      '''
+      Queries the database for the details of the given IssueRef, and returns
+      them as an Issue (see db.query_issue), unless the details of that issue 
+      were already fetched for some other book during this scrape operation, 
+      in which case the Issue from that time is returned instead.
+      
+      This method is threadsafe.  If another thread is already fetching the 
+      same issue, this one waits for it rather than fetching it again.  Issues
+      that can't be fetched (i.e. raise an exception) are never remembered.
+      '''
+      
+      key_s = sstr(issue_ref.issue_key)
+      Monitor.Enter(self.__issue_lock)
+      try:
+         while self.__issue_results.get(key_s) is ScrapeEngine.__FETCHING:
+            Monitor.Wait(self.__issue_lock)
+         if key_s in self.__issue_results:
+            self.__reused_issues_n += 1
+            log.debug("reusing the details that were already fetched for '",
+               sstr(issue_ref), "'")
+            return self.__issue_results[key_s]
+         self.__issue_results[key_s] = ScrapeEngine.__FETCHING
+      finally:
+         Monitor.Exit(self.__issue_lock)
+      
+      issue = None
+      try:
+         issue = db.query_issue(issue_ref, self.config.update_rating_b)
+         return issue
+      finally:
+         Monitor.Enter(self.__issue_lock)
+         try:
+            if issue:
+               self.__issue_results[key_s] = issue
+               self.__issue_results_order.append(key_s)
+               if len(self.__issue_results_order) > \
+                     ScrapeEngine.__ISSUE_RESULTS_SIZE:
+                  del self.__issue_results[self.__issue_results_order.pop(0)]
+            else:
+               del self.__issue_results[key_s]
+            Monitor.PulseAll(self.__issue_lock)
+         finally:
+            Monitor.Exit(self.__issue_lock)
+   
+   
+   
+   # ==========================================================================   
+   def __update_book(self, book, issue, issue_ref, series_ref=None):
+      '''
+      Copies the details in the given Issue into the given ComicBook (see 
+      ComicBook.update), and records that in our journal.  'issue_ref' is the
+      IssueRef that the book is being scraped with, and 'series_ref' is the
+      SeriesRef that was chosen for it, if any.
+      
+      If the user wants a dry run, the book is left as it is and the changes
+      that WOULD have been made are added to our dry run report instead.  If 
+      the user wants books written in batches, the book's details are written
+      out (and journalled) later on, along with a batch of other books.
+      '''
+      
+      if self.__dry_run:
+         self.__dry_run.record(book, issue_ref, book.diff(issue))
+      elif self.config.batch_writes_b:
+         book.update(issue, False)
+         self.__unwritten_books.append( (book, issue_ref, series_ref) )
+         if len(self.__unwritten_books) >= ScrapeEngine.__WRITE_BATCH_N:
+            self.__write_unwritten_books()
+      else:
+         book.update(issue)
+         self.__journal.record(book, "SCRAPED", issue_ref, series_ref)
+   
+   
+   
+   # ==========================================================================   
+   def __write_unwritten_books(self):
+      '''
+      Writes out the details of all the books that __update_book has copied
+      details into without writing them out, all together in one pass, and 
+      records them in our journal.  
+      
+      Those books were already counted as scraped, so any book that can't be
+      written out is counted as skipped instead, and is journalled as delayed
+      (so that resuming this scrape will try it again.)
+      '''
+      
+      if self.__unwritten_books:
+         log.debug("writing the details of ", len(self.__unwritten_books), 
+            " scraped books...")
+         for book, issue_ref, series_ref in self.__unwritten_books:
+            try:
+               book.write()
+               self.__journal.record(book, "SCRAPED", issue_ref, series_ref)
+            except:
+               log.debug_exc("Error writing details into book:")
+               self.__status[0] -= 1
+               self.__status[1] += 1
+               self.__journal.record(book, "DELAYED")
+         self.__unwritten_books = []
+   
+   
+   
+   # ==========================================================================   
+   def __skip_forever(self, book):
+      ''' 
+      Marks the given ComicBook to be skipped forever (see 
+      ComicBook.skip_forever), unless the user wants a dry run.
+      '''
+      if self.__dry_run:
+         self.__dry_run.record_skip_forever(book)
+      else:
+         book.skip_forever()
+   
+   
+   
+   # ==========================================================================   
+   def __predict_kind_s(self, book, delayed_b):
+      '''
+      Returns the kind of scrape (one of ScrapeEstimator.KINDS) that we expect
+      the given ComicBook to need, based on what we know about it and the 
+      user's settings.  'delayed_b' says whether the book has been delayed 
+      until the end of the scrape, in which case the user will choose its 
+      series and issue.
+      '''
+      
+      if delayed_b:
+         return "interactive"
+      elif self.config.fast_rescrape_b and not book.skip_b and book.issue_ref:
+         return "rescrape"
+      elif self.config.autochoose_series_b and not self.config.confirm_issue_b:
+         return "autoscrape"
+      else:
+         return "interactive"
+   
+   
+   
+   # ==========================================================================   
+   def __fire_estimate_listeners(self):
+      ''' Sends our latest estimate to all of our 'estimate_listeners'. '''
+      
+      remaining_ms, books_per_hour_n = self.__estimator.estimate()
+      for estimated in self.estimate_listeners:
+         estimated(remaining_ms, books_per_hour_n)
+   
+   
+   
+   # ==========================================================================   
+   def __check_memory(self):
+      '''
+      Logs how much memory we're using (so that long scrapes can be checked
+      for leaks), and forces a full garbage collection, but only if the managed
+      heap has grown by more than __GC_GROWTH_BYTES since it was last smaller.
+      Call this after scraping each book (or batch of books.)
+      '''
+      
+      heap_n = GC.GetTotalMemory(False)
+      if not self.__gc_heap_n or heap_n < self.__gc_heap_n:
+         self.__gc_heap_n = heap_n
+      elif heap_n - self.__gc_heap_n > ScrapeEngine.__GC_GROWTH_BYTES:
+         log.debug("memory: the heap grew to ", heap_n / (1024*1024), 
+            "MB, so collecting garbage...")
+         GC.Collect()
+         GC.WaitForPendingFinalizers()
+         heap_n = GC.GetTotalMemory(False)
+         self.__gc_heap_n = heap_n
+         self.__gc_forced_n += 1
+         
+      working_set_n = Environment.WorkingSet
+      self.__peak_working_set_n = max(self.__peak_working_set_n, working_set_n)
+      log.debug("memory: ", heap_n / (1024*1024), "MB managed heap, ", 
+         working_set_n / (1024*1024), "MB working set")
+   
+   
+   
+   # ==========================================================================   
+   def __check_magic_file(self, book):
+      '''
+      Returns the SeriesRef from the 'magic' file in the given ComicBook's 
+      folder (see db.check_magic_file), or None if there isn't one.  Each 
+      folder is only checked once per scrape operation.
+      '''
+      
+      folder_s = Path.GetDirectoryName(book.path_s) if book.path_s else None
+      if not folder_s:
+         return None
+      if folder_s not in self.__magic_series_refs:
+         self.__magic_series_refs[folder_s] = db.check_magic_file(folder_s)
+      return self.__magic_series_refs[folder_s]
+   
+   
+   
+   # ==========================================================================   
+   def __query_issue_updates(self, books):
+      '''
+      Asks the database (in bulk) when it last changed the issue of each of the
+      given ComicBooks that can be fast rescraped, and that recorded when their
+      issue was last changed the last time they were scraped.  Returns a map 
+      of issue keys (strings) to those dates; see self.__issue_updates.
+      '''
+      
+      issue_keys = set()
+      for book in books:
+         issue_ref = None if book.skip_b else book.issue_ref
+         if issue_ref and book.updated_s:
+            issue_keys.add(sstr(issue_ref.issue_key))
+      if not issue_keys:
+         return {}
+      
+      log.debug("checking which of ", len(issue_keys), 
+         " previously scraped issues have changed...")
+      try:
+         issue_updates = db.query_issue_updates(list(issue_keys))
+         log.debug("...done checking")
+         log.debug()
+         return issue_updates
+      except:
+         log.debug_exc("...couldn't check, so rescraping all of them:")
+         return {}
+   
+   
+   
+   # ==========================================================================   
+   def __finish_pending_book(self, book):
+      ''' 
+      Records that the given book is no longer waiting to be scraped, so that
+      it is no longer included in self.__pending_counts.
+      '''
+      
+      key = book.unique_series_s
+      if self.__pending_counts.get(key, 0) > 1:
+         self.__pending_counts[key] -= 1
       else:
-         log.debug("...found {0} results".format(len(filtered_refs)))
-      return filtered_refs
+         self.__pending_counts.pop(key, None)
 
 
 
@@ -832,18 +1544,27 @@ class ScrapeEngine(object):
    # =============================================================================
    def __wait_until_ready(self):
       '''
-      Waits until a fixed amount of time has passed since this function was 
-      last called.  Returns immediately if that much time has already passed.
+      Waits until we're allowed to start scraping the next book.  If this 
+      thread made no database requests since the last book started (i.e. it 
+      was scraped entirely from caches) there's no need to wait at all.  The
+      requests that our background threads make (i.e. the SeriesLookahead) 
+      don't count; they're paced by the database's rate limit.  Otherwise,
+      waits until the scrape delay has passed since the last book started (the
+      time spent scraping it counts), and until the database's rate limit 
+      would let us make a request right away.  
+      
+      Returns immediately if that much time has already passed, and as soon 
+      as this ScrapeEngine is cancelled.
       '''
-      done_time_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds \
-         + self.config.scrape_delay_n*1000
-      now_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
       
-      while now_ms < done_time_ms and not self.__cancelled_b: 
-         t = Thread(ThreadStart(lambda x=0: Thread.CurrentThread.Sleep(500)))
-         t.Start()
-         t.Join()         
-         now_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds         
+      if db.get_thread_query_count_n() == self.__book_query_count_n:
+         return
+      now_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+      wait_ms = max( db.time_until_ready_ms(), self.__book_start_ms + 
+         self.config.scrape_delay_n*1000 - now_ms )
+      if wait_ms > 0:
+         log.debug("waiting ", int(wait_ms), "ms for the scrape delay...")
+         self.__cancelled_event.WaitOne(int(wait_ms))
          
 
 # ==========================================================================
@@ -872,15 +1593,15 @@ class BookStatus(object):
       
       id -> the status ID.  Must be one of "SCRAPED" (book was successfully 
             scraped), "SKIPPED" (user chose to skip this book), "UNSCRAPED" 
-            (hasn't been scraped yet) or "DELAYED" (hasn't been scraped, try
-            again later).
+            (hasn't been scraped yet), "DELAYED" (hasn't been scraped, try
+            again later) or "FETCHING" (book's details are being fetched).
       failed_search_terms_s -> (optional) the series search terms that couldn't 
             be found, if there are any.  This only makes sense in certain cases
             where the id is "UNSCRAPED". 
       '''  
             
       if id != "SCRAPED" and id != "SKIPPED" and \
-            id != "UNSCRAPED" and id != "DELAYED":
+            id != "UNSCRAPED" and id != "DELAYED" and id != "FETCHING":
          raise Exception()
       
       self.__id = id
@@ -895,7 +1616,7 @@ class BookStatus(object):
    def equals(self, id):
       ''' 
       Returns True iff this BookStatus has the given ID (i.e. one of "SCRAPED",
-      "UNSCRAPED", "SKIPPED", or "DELAYED").
+      "UNSCRAPED", "SKIPPED", "DELAYED", or "FETCHING").
       '''
       return self.__id == id
 
@@ -10,6 +10,11 @@ import sys
 import test_fnameparser 
 import test_bookdata
 import test_utils
+import test_scheduler
+import test_dbutils
+import test_pipeline
+import test_comicbook
+import test_seriesindex
 
 #==============================================================================
 class AllTests(unittest.TestSuite):
@@ -24,6 +29,11 @@ class AllTests(unittest.TestSuite):
          loader.loadTestsFromModule(test_bookdata),
          loader.loadTestsFromModule(test_fnameparser),
          loader.loadTestsFromModule(test_utils), 
+         loader.loadTestsFromModule(test_scheduler),
+         loader.loadTestsFromModule(test_dbutils),
+         loader.loadTestsFromModule(test_pipeline),
+         loader.loadTestsFromModule(test_comicbook),
+         loader.loadTestsFromModule(test_seriesindex),
          # corylow: can we make a test_cleanupsearchterms?
          ] 
       )
@@ -8,11 +8,14 @@ Created on Jan 5, 2012
 from unittest import TestCase
 from unittest.loader import TestLoader
 from bookdata import BookData
+from pluginbookdata import PluginBookData
 
 #==============================================================================
 def load_tests(loader, tests, pattern): #pylint: disable=W0613
    ''' Returns all of the testcases in this module as a testsuite '''
-   return TestLoader().loadTestsFromTestCase(TestBookData)
+   suite = TestLoader().loadTestsFromTestCase(TestBookData)
+   suite.addTests(TestLoader().loadTestsFromTestCase(TestPluginBookData))
+   return suite
 
 #==============================================================================
 class TestBookData(TestCase):
@@ -396,3 +399,86 @@ class TestBookData(TestCase):
       self.assertEquals(book.series_key_s, "9393")
       del book.series_key_s
       self.assertEquals(book.series_key_s, BookData.blank("series_key_s"))
+      
+      
+   # --------------------------------------------------------------------------
+   def test_updated_s(self):
+      ''' Checks to see if the BookData's updated_s property works. '''
+      book = BookData()
+      self.assertEquals(book.updated_s, BookData.blank("updated_s"))
+      book.updated_s = " 2015-03-01 12:34:56 "
+      self.assertEquals(book.updated_s, "2015-03-01 12:34:56")
+      del book.updated_s
+      self.assertEquals(book.updated_s, BookData.blank("updated_s"))
+
+
+
+#==============================================================================
+class _FakeComicBook(object):
+   '''
+   A standin for a ComicRack ComicBook, with just a few fields.  It records 
+   which of its fields are read and written.
+   '''
+   def __init__(self, **fields):
+      self.__dict__['fields'] = fields
+      self.__dict__['read'] = []
+      self.__dict__['written'] = []
+      
+   def __getattr__(self, name):
+      self.read.append(name)
+      return self.fields.get(name)
+   
+   def __setattr__(self, name, value):
+      self.written.append(name)
+      self.fields[name] = value
+      
+   def GetCustomValue(self, key):
+      self.read.append(key)
+      return self.fields.get(key)
+      
+      
+#==============================================================================
+class TestPluginBookData(TestCase):
+
+   # --------------------------------------------------------------------------
+   def test_lazy_load(self):
+      ''' Checks that properties are read from ComicRack only when needed. '''
+      crbook = _FakeComicBook(Series=" Batman ", Tags="a, b,,c")
+      book = PluginBookData(crbook, None)
+      self.assertEquals(crbook.read, [])
+      self.assertEquals(book.series_s, "Batman")
+      self.assertEquals(book.series_s, "Batman")
+      self.assertEquals(book.tags_sl, ["a", "b", "c"])
+      self.assertEquals(crbook.read, ["Series", "Tags"])
+      
+   # --------------------------------------------------------------------------
+   def test_update_changed_only(self):
+      ''' Checks that only changed properties are written to ComicRack. '''
+      crbook = _FakeComicBook(Series="Batman", Summary="old", Title="Hush")
+      book = PluginBookData(crbook, None)
+      book.dont_update("volume_year_n") # always written; see next test
+      book.dont_update("format_s")
+      book.series_s = "Batman"
+      book.summary_s = "new"
+      book.update()
+      self.assertEquals(crbook.written, ["Summary"])
+      self.assertEquals(crbook.fields["Summary"], "new")
+      book.update()
+      self.assertEquals(crbook.written, ["Summary"])
+      
+   # --------------------------------------------------------------------------
+   def test_update_shadowed(self):
+      '''
+      Checks that the volume and format are written to ComicRack even when 
+      they match the (different) shadow values that they were read in from.
+      '''
+      crbook = _FakeComicBook(Volume=-1, ShadowVolume=2011, Format="",
+         ShadowFormat="Annual", Summary="old")
+      book = PluginBookData(crbook, None)
+      book.volume_year_n = 2011
+      book.format_s = "Annual"
+      book.summary_s = "x"
+      book.update()
+      self.assertEquals(crbook.written, ["Volume", "Format", "Summary"])
+      self.assertEquals(crbook.fields["Volume"], 2011)
+      self.assertEquals(crbook.fields["Format"], "Annual")
@@ -0,0 +1,46 @@
+#coding: utf-8
+'''
+This module contains all unittests for the dbutils module.
+
+@author: cbanack
+'''
+
+from unittest import TestCase
+from unittest.loader import TestLoader
+from dbmodels import IssueRef
+from dbutils import IssueNumberIndex
+
+#==============================================================================
+def load_tests(loader, tests, pattern): #pylint: disable=W0613
+   ''' Returns all of the testcases in this module as a testsuite '''
+   return TestLoader().loadTestsFromTestCase(TestDBUtils)
+
+#==============================================================================
+class TestDBUtils(TestCase):
+
+   # --------------------------------------------------------------------------
+   def __index(self, *issue_nums):
+      ''' Returns an IssueNumberIndex for IssueRefs with the given numbers. '''
+      return IssueNumberIndex( [ IssueRef(issue_nums[i], i+1, "", None) 
+         for i in range(len(issue_nums)) ] )
+
+   # --------------------------------------------------------------------------
+   def test_index_variants(self):
+      ''' Checks that IssueNumberIndex finds equivalent issue numbers. '''
+      index = self.__index("1", "5.5", "5A", "12", "")
+      self.assertEquals("5.5", index.find_unique("5½").issue_num_s)
+      self.assertEquals("5.5", index.find_unique("05.50").issue_num_s)
+      self.assertEquals("5A", index.find_unique("5 a").issue_num_s)
+      self.assertEquals("12", index.find_unique("012").issue_num_s)
+      self.assertEquals("1", index.find_unique("1.0").issue_num_s)
+      self.assertEquals("", index.find_unique("").issue_num_s)
+      self.assertEquals(None, index.find_unique("5"))
+      self.assertEquals([], index.find("13"))
+
+   # --------------------------------------------------------------------------
+   def test_index_duplicates(self):
+      ''' Checks that IssueNumberIndex detects duplicate issue numbers. '''
+      index = self.__index("1", "2", "02", "3")
+      self.assertEquals(2, len(index.find("2")))
+      self.assertEquals(None, index.find_unique("2"))
+      self.assertEquals("3", index.find_unique("3").issue_num_s)
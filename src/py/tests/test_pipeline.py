@@ -0,0 +1,114 @@
+'''
+This module contains all unittests for the pipeline module.
+
+@author: cbanack
+'''
+
+import clr
+from unittest import TestCase
+from unittest.loader import TestLoader
+from pipeline import concurrent_map, Stage
+
+clr.AddReference('System')
+from System.Threading import ManualResetEvent
+
+#==============================================================================
+def load_tests(loader, tests, pattern): #pylint: disable=W0613
+   ''' Returns all of the testcases in this module as a testsuite '''
+   return TestLoader().loadTestsFromTestCase(TestPipeline)
+
+#==============================================================================
+class TestPipeline(TestCase):
+
+   # --------------------------------------------------------------------------
+   def test_concurrent_map_order(self):
+      ''' Checks that results are yielded in order, even if they finish out
+          of order. '''
+      finished = []
+      gate = ManualResetEvent(False)
+      def square(n):
+         if n == 0:
+            gate.WaitOne(10000) # item 0 can't finish until item 2 has
+         finished.append(n)
+         if n == 2:
+            gate.Set()
+         return n * n
+      self.assertEquals([0, 1, 4, 9, 16],
+         list(concurrent_map(square, range(5), 3)))
+      self.assertTrue(finished.index(2) < finished.index(0))
+
+   # --------------------------------------------------------------------------
+   def test_concurrent_map_empty(self):
+      ''' Checks that mapping no items yields no results. '''
+      self.assertEquals([], list(concurrent_map(lambda n: n, [], 3)))
+
+   # --------------------------------------------------------------------------
+   def test_concurrent_map_exception(self):
+      ''' Checks that an item's exception is raised in place of its result. '''
+      def check(n):
+         if n == 2:
+            raise ValueError("bad item")
+         return n
+      results = concurrent_map(check, range(5), 2)
+      self.assertEquals(0, next(results))
+      self.assertEquals(1, next(results))
+      self.assertRaises(ValueError, lambda: next(results))
+
+   # --------------------------------------------------------------------------
+   def test_concurrent_map_window(self):
+      ''' Checks that items aren't started too far ahead of the results. '''
+      started = []
+      last_allowed = ManualResetEvent(False)
+      def record(n):
+         started.append(n)
+         if n == 4:
+            last_allowed.Set()
+         return n
+      results = concurrent_map(record, range(20), 2, 4)
+      self.assertEquals(0, next(results))
+      # once 0 is taken, items up to 4 may start, but no further
+      self.assertTrue(last_allowed.WaitOne(10000))
+      results.close()
+      self.assertEquals([0, 1, 2, 3, 4], sorted(started))
+
+   # --------------------------------------------------------------------------
+   def test_stage_order(self):
+      ''' Checks that a Stage's items come out in the order they went in. '''
+      gate = ManualResetEvent(False)
+      def square(n):
+         if n == 0:
+            gate.WaitOne(10000) # item 0 can't finish until item 2 has
+         if n == 2:
+            gate.Set()
+         return n * n
+      stage = Stage(square, 3, 5)
+      try:
+         for n in range(5):
+            self.assertTrue(stage.put(n))
+         results = [stage.take(True) for n in range(5)] #@UnusedVariable
+         self.assertEquals([(n, n*n) for n in range(5)], results)
+         self.assertEquals(None, stage.take(True))
+      finally:
+         stage.shutdown()
+
+   # --------------------------------------------------------------------------
+   def test_stage_cancel(self):
+      ''' Checks that cancelling a Stage drops the items it hasn't started. '''
+      gate = ManualResetEvent(False)
+      started = ManualResetEvent(False)
+      def work(n): #@UnusedVariable
+         started.Set()
+         gate.WaitOne()
+      stage = Stage(work, 1, 3)
+      try:
+         for n in range(3):
+            stage.put(n)
+         self.assertTrue(started.WaitOne(10000)) # item 0 is in progress
+         self.assertEquals([1, 2], stage.cancel())
+         self.assertFalse(stage.put(3))
+         gate.Set()
+         self.assertEquals(0, stage.take(True)[0])
+         self.assertEquals(None, stage.take(True))
+         self.assertEquals(0, stage.pending_n)
+      finally:
+         stage.shutdown()
@@ -0,0 +1,141 @@
+'''
+This module contains all unittests for the scheduler module.
+
+@author: cbanack
+'''
+
+import clr
+from unittest import TestCase
+from unittest.loader import TestLoader
+from scheduler import Scheduler, CancelToken
+
+clr.AddReference('System')
+from System.Threading import ManualResetEvent
+
+#==============================================================================
+def load_tests(loader, tests, pattern): #pylint: disable=W0613
+   ''' Returns all of the testcases in this module as a testsuite '''
+   return TestLoader().loadTestsFromTestCase(TestScheduler)
+
+#==============================================================================
+class TestScheduler(TestCase):
+
+   # --------------------------------------------------------------------------
+   def setUp(self):
+      '''
+      Creates a single-threaded scheduler whose thread is blocked until
+      __finish() is called, so that tasks submitted in a test pile up and then
+      run in a deterministic order.
+      '''
+      self.ran = []
+      self.gate = ManualResetEvent(False)
+      self.scheduler = Scheduler(1)
+      self.scheduler.submit(lambda: self.gate.WaitOne(),
+         Scheduler.VISIBLE, "gate")
+
+   # --------------------------------------------------------------------------
+   def tearDown(self):
+      self.gate.Set()
+      self.scheduler.shutdown(True)
+
+   # --------------------------------------------------------------------------
+   def __task(self, name_s):
+      ''' Returns a task that records the given name when it is run. '''
+      return lambda: self.ran.append(name_s)
+
+   # --------------------------------------------------------------------------
+   def __finish(self):
+      ''' Unblocks the scheduler and waits for all waiting tasks to finish. '''
+      done = ManualResetEvent(False)
+      self.scheduler.submit(lambda: done.Set(), Scheduler.BACKGROUND, "done")
+      self.gate.Set()
+      self.assertTrue(done.WaitOne(10000))
+      return self.ran
+
+   # --------------------------------------------------------------------------
+   def test_priority_order(self):
+      ''' Checks that tasks run by priority, then in submission order. '''
+      submit = self.scheduler.submit
+      submit(self.__task("bg1"), Scheduler.BACKGROUND, 1)
+      submit(self.__task("pre1"), Scheduler.PREFETCH, 2)
+      submit(self.__task("vis1"), Scheduler.VISIBLE, 3)
+      submit(self.__task("pre2"), Scheduler.PREFETCH, 4)
+      submit(self.__task("vis2"), Scheduler.VISIBLE, 5)
+      self.assertEquals(["vis1", "vis2", "pre1", "pre2", "bg1"],
+         self.__finish())
+
+   # --------------------------------------------------------------------------
+   def test_coalescing(self):
+      ''' Checks that a task replaces the waiting task with the same key. '''
+      submit = self.scheduler.submit
+      submit(self.__task("a1"), Scheduler.PREFETCH, "a")
+      submit(self.__task("b1"), Scheduler.PREFETCH, "b")
+      submit(self.__task("a2"), Scheduler.PREFETCH, "a")
+      self.assertEquals(["a2", "b1"], self.__finish())
+
+   # --------------------------------------------------------------------------
+   def test_coalescing_changes_priority(self):
+      ''' Checks that a replacing task moves into its own priority lane. '''
+      submit = self.scheduler.submit
+      submit(self.__task("a1"), Scheduler.BACKGROUND, "a")
+      submit(self.__task("b1"), Scheduler.PREFETCH, "b")
+      submit(self.__task("a2"), Scheduler.VISIBLE, "a")
+      self.assertEquals(["a2", "b1"], self.__finish())
+
+   # --------------------------------------------------------------------------
+   def test_running_key_waits(self):
+      '''
+      Checks that a task isn't started while another task with the same key is
+      still running, even when there is a free thread to run it on.
+      '''
+      scheduler = Scheduler(2)
+      started = ManualResetEvent(False)
+      release = ManualResetEvent(False)
+      b_done = ManualResetEvent(False)
+      a_done = ManualResetEvent(False)
+      def a1():
+         started.Set()
+         release.WaitOne()
+         self.ran.append("a1")
+      def a2():
+         self.ran.append("a2")
+         a_done.Set()
+      def b():
+         self.ran.append("b")
+         b_done.Set()
+      try:
+         scheduler.submit(a1, Scheduler.VISIBLE, "a")
+         self.assertTrue(started.WaitOne(10000))
+         scheduler.submit(a2, Scheduler.VISIBLE, "a")
+         scheduler.submit(b, Scheduler.PREFETCH, "b")
+         self.assertTrue(b_done.WaitOne(10000))
+         self.assertEquals(["b"], self.ran)
+         release.Set()
+         self.assertTrue(a_done.WaitOne(10000))
+         self.assertEquals(["b", "a1", "a2"], self.ran)
+      finally:
+         release.Set()
+         scheduler.shutdown(True)
+
+   # --------------------------------------------------------------------------
+   def test_default_key(self):
+      ''' Checks the last-in-ignore-everything-else default behaviour. '''
+      submit = self.scheduler.submit
+      submit(self.__task("1"))
+      submit(self.__task("2"))
+      submit(self.__task("3"))
+      self.assertEquals(["3"], self.__finish())
+
+   # --------------------------------------------------------------------------
+   def test_cancellation(self):
+      ''' Checks that cancelled tasks are never run. '''
+      submit = self.scheduler.submit
+      token = CancelToken()
+      submit(self.__task("a"), Scheduler.PREFETCH, "a", token)
+      submit(self.__task("b"), Scheduler.PREFETCH, "b")
+      submit(self.__task("c"), Scheduler.PREFETCH, "c", token)
+      submit(self.__task("d"), Scheduler.PREFETCH, "d").cancel()
+      submit(self.__task("e"), Scheduler.PREFETCH, "e")
+      token.cancel()
+      self.scheduler.cancel("e")
+      self.assertEquals(["b"], self.__finish())
@@ -0,0 +1,83 @@
+'''
+This module contains all unittests for the seriesindex module.
+
+@author: cbanack
+'''
+
+import os
+import tempfile
+import seriesindex
+from unittest import TestCase
+from unittest.loader import TestLoader
+from dbmodels import SeriesRef
+
+#==============================================================================
+def load_tests(loader, tests, pattern): #pylint: disable=W0613
+   ''' Returns all of the testcases in this module as a testsuite '''
+   return TestLoader().loadTestsFromTestCase(TestSeriesIndex)
+
+#==============================================================================
+class TestSeriesIndex(TestCase):
+
+   # --------------------------------------------------------------------------
+   def setUp(self):
+      ''' Starts each test with an empty index, backed by a temporary file. '''
+      self.file_s = os.path.join(tempfile.gettempdir(), "test_seriesindex.txt")
+      self.tearDown()
+      seriesindex.load(self.file_s)
+
+   # --------------------------------------------------------------------------
+   def tearDown(self):
+      if os.path.exists(self.file_s):
+         os.remove(self.file_s)
+
+   # --------------------------------------------------------------------------
+   def __search(self, search_terms_s):
+      ''' Returns the keys of the series that match the given search terms. '''
+      return [ref.series_key for ref in seriesindex.search(search_terms_s)]
+
+   # --------------------------------------------------------------------------
+   def test_exact_name_first(self):
+      ''' Checks that an exact name beats many longer names that contain it. '''
+      seriesindex.add([SeriesRef(i, "Batman " + str(i), 1990, "DC", 500, None)
+         for i in range(1, 301)])
+      seriesindex.add([SeriesRef(999, "Batman", 1940, "DC", 10, None)])
+      self.assertEquals(999, self.__search("batman")[0])
+
+   # --------------------------------------------------------------------------
+   def test_ties_by_issue_count(self):
+      ''' Checks that equally similar series are ranked by issue count. '''
+      seriesindex.add([SeriesRef(1, "Batman", 1940, "DC", 10, None),
+         SeriesRef(2, "Batman", 2011, "DC", 52, None),
+         SeriesRef(3, "Batman", 2016, "DC", 30, None)])
+      self.assertEquals([2, 3, 1], self.__search("Batman"))
+
+   # --------------------------------------------------------------------------
+   def test_fuzzy_match(self):
+      ''' Checks that typos and word order don't prevent a match. '''
+      seriesindex.add([SeriesRef(1, "The Amazing Spider-Man", 1963, "Marvel",
+         700, None), SeriesRef(2, "Superman", 1939, "DC", 700, None)])
+      self.assertEquals([1], self.__search("amazing spiderman"))
+      self.assertEquals([1], self.__search("spider-man, the amazing"))
+      self.assertEquals([], self.__search("fantastic four"))
+      self.assertEquals([], self.__search(""))
+
+   # --------------------------------------------------------------------------
+   def test_add_replaces(self):
+      ''' Checks that adding a series again replaces its old SeriesRef. '''
+      seriesindex.add([SeriesRef(1, "Batman", 1940, "DC", 10, None)])
+      seriesindex.add([SeriesRef(1, "Detective Comics", 1937, "DC", 900, None)])
+      self.assertEquals([], self.__search("Batman"))
+      self.assertEquals([1], self.__search("Detective Comics"))
+
+   # --------------------------------------------------------------------------
+   def test_save_and_load(self):
+      ''' Checks that the index is the same after saving and loading it. '''
+      seriesindex.add([SeriesRef(1, "Batman", 1940, "DC", 10, None)])
+      seriesindex.save()
+      seriesindex.load(self.file_s)
+      series_refs = seriesindex.search("Batman")
+      self.assertEquals(1, len(series_refs))
+      self.assertEquals("Batman", series_refs[0].series_name_s)
+      self.assertEquals(1940, series_refs[0].volume_year_n)
+      self.assertEquals(10, series_refs[0].issue_count_n)
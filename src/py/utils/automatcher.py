@@ -73,7 +73,8 @@ def __find_best_series(book, config):
    
    # 1. obtain SeriesRefs for this book, removing some as dictated by prefs
    series_refs = db.query_series_refs( book.series_s, 
-      config.ignored_searchterms_sl )
+      config.ignored_searchterms_sl, 
+      series_filter=dbutils.create_series_filter(config) )
    series_refs = dbutils.filter_series_refs( 
          series_refs,
          config.ignored_publishers_sl, 
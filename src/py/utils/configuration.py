@@ -68,6 +68,13 @@ class Configuration(object):
    __DEFAULT_NOTE_SCRAPE_DATE = False
    __DEFAULT_SCRAPE_DELAY = 1
    __DEFAULT_MAX_SEARCH_RESULTS = 100
+   __DEFAULT_LOOKAHEAD_SERIES = 2
+   __DEFAULT_LOCAL_SERIES_SEARCH = False
+   __DEFAULT_MIRROR_DATABASE = False
+   __DEFAULT_INCREMENTAL_RESCRAPE = False
+   __DEFAULT_RESUME_SCRAPE = False
+   __DEFAULT_DRY_RUN = False
+   __DEFAULT_BATCH_WRITES = False
 
   
    #=========================================================================== 
@@ -136,6 +143,13 @@ class Configuration(object):
       self.__note_scrape_date_b = None # put date when scraping the Notes field?
       self.__scrape_delay_n = None # num of seconds to wait between each scrape
       self.__max_search_results_n = None # max # of series to return on search
+      self.__lookahead_series_n = None # num of upcoming series to search early
+      self.__local_series_search_b = None # search local series index first?
+      self.__mirror_database_b = None # use the local mirror database?
+      self.__incremental_rescrape_b = None # only rescrape issues that changed?
+      self.__resume_scrape_b = None # resume unfinished scrapes?
+      self.__dry_run_b = None # only report what a scrape would change?
+      self.__batch_writes_b = None # write scraped books out in batches?
       self.__set_advanced_settings_s("")
       
       return self
@@ -169,6 +183,13 @@ class Configuration(object):
       self.__note_scrape_date_b = c.__DEFAULT_NOTE_SCRAPE_DATE
       self.__scrape_delay_n = c.__DEFAULT_SCRAPE_DELAY
       self.__max_search_results_n = c.__DEFAULT_MAX_SEARCH_RESULTS
+      self.__lookahead_series_n = c.__DEFAULT_LOOKAHEAD_SERIES
+      self.__local_series_search_b = c.__DEFAULT_LOCAL_SERIES_SEARCH
+      self.__mirror_database_b = c.__DEFAULT_MIRROR_DATABASE
+      self.__incremental_rescrape_b = c.__DEFAULT_INCREMENTAL_RESCRAPE
+      self.__resume_scrape_b = c.__DEFAULT_RESUME_SCRAPE
+      self.__dry_run_b = c.__DEFAULT_DRY_RUN
+      self.__batch_writes_b = c.__DEFAULT_BATCH_WRITES
 
       
       # 2. scan through the string looking at each line for advanced settings
@@ -275,6 +296,44 @@ class Configuration(object):
             self.__max_search_results_n = \
                min(5000, max( 10, int(float(match.group(1))) ) )
 
+         # 2q. parse the "LOOKAHEAD_SERIES=XXXX" line
+         match = re.match(pattern_s.format("LOOKAHEAD_SERIES"), line_s)
+         if match and utils.is_number(match.group(1)):
+            self.__lookahead_series_n = \
+               min(10, max(0, int(float(match.group(1)))))
+
+         # 2r. parse the "LOCAL_SERIES_SEARCH=XXXX" line
+         match = re.match(pattern_s.format("LOCAL_SERIES_SEARCH"), line_s)
+         if match:
+            self.__local_series_search_b = \
+               match.group(1).strip().lower()=="true"
+
+         # 2s. parse the "MIRROR_DATABASE=XXXX" line
+         match = re.match(pattern_s.format("MIRROR_DATABASE"), line_s)
+         if match:
+            self.__mirror_database_b = match.group(1).strip().lower()=="true"
+
+         # 2t. parse the "INCREMENTAL_RESCRAPE=XXXX" line
+         match = re.match(pattern_s.format("INCREMENTAL_RESCRAPE"), line_s)
+         if match:
+            self.__incremental_rescrape_b = \
+               match.group(1).strip().lower()=="true"
+
+         # 2u. parse the "RESUME_SCRAPE=XXXX" line
+         match = re.match(pattern_s.format("RESUME_SCRAPE"), line_s)
+         if match:
+            self.__resume_scrape_b = match.group(1).strip().lower()=="true"
+
+         # 2v. parse the "DRY_RUN=XXXX" line
+         match = re.match(pattern_s.format("DRY_RUN"), line_s)
+         if match:
+            self.__dry_run_b = match.group(1).strip().lower()=="true"
+
+         # 2w. parse the "BATCH_WRITES=XXXX" line
+         match = re.match(pattern_s.format("BATCH_WRITES"), line_s)
+         if match:
+            self.__batch_writes_b = match.group(1).strip().lower()=="true"
+
    advanced_settings_s = property( lambda self : self.__advanced_settings_s, 
       __set_advanced_settings_s, __set_advanced_settings_s,
       "The advanced settings string for this Configuration. Not None." )
@@ -342,6 +401,34 @@ class Configuration(object):
    max_search_results_n = property( 
       lambda self : self.__max_search_results_n, None, None,
       "Maximum # of series search results to return for a query. Not None.")
+
+   lookahead_series_n = property( 
+      lambda self : self.__lookahead_series_n, None, None,
+      "Number of upcoming books to search for series in advance. Not None.")
+
+   local_series_search_b = property( 
+      lambda self : self.__local_series_search_b, None, None,
+      "Whether to search the local series index before searching online.")
+
+   mirror_database_b = property( 
+      lambda self : self.__mirror_database_b, None, None,
+      "Whether to use (and top up) the local mirror database.")
+
+   incremental_rescrape_b = property( 
+      lambda self : self.__incremental_rescrape_b, None, None,
+      "Whether to skip rescraping books whose issues haven't changed.")
+
+   resume_scrape_b = property( 
+      lambda self : self.__resume_scrape_b, None, None,
+      "Whether to skip the books that an unfinished scrape already finished.")
+
+   dry_run_b = property( 
+      lambda self : self.__dry_run_b, None, None,
+      "Whether to report what scraping would change, instead of changing it.")
+
+   batch_writes_b = property( 
+      lambda self : self.__batch_writes_b, None, None,
+      "Whether to write scraped details into books in batches, not one by one.")
    
    
    #===========================================================================
@@ -661,6 +748,28 @@ class Configuration(object):
       if self.max_search_results_n != c.__DEFAULT_MAX_SEARCH_RESULTS:
          lines_sl.append("Series search will return first {0} results.\n"\
             .format(self.max_search_results_n))
+
+      if self.lookahead_series_n != c.__DEFAULT_LOOKAHEAD_SERIES:
+         lines_sl.append("Search ahead for the next {0} series.\n"\
+            .format(self.lookahead_series_n))
+
+      if self.local_series_search_b != c.__DEFAULT_LOCAL_SERIES_SEARCH:
+         lines_sl.append("Search the local series index before going online.\n")
+
+      if self.mirror_database_b != c.__DEFAULT_MIRROR_DATABASE:
+         lines_sl.append("Use the local mirror database before going online.\n")
+
+      if self.incremental_rescrape_b != c.__DEFAULT_INCREMENTAL_RESCRAPE:
+         lines_sl.append("Only rescrape issues that have changed online.\n")
+
+      if self.resume_scrape_b != c.__DEFAULT_RESUME_SCRAPE:
+         lines_sl.append("Resume the last scrape, if it did not finish.\n")
+
+      if self.dry_run_b != c.__DEFAULT_DRY_RUN:
+         lines_sl.append("Report what would change, but don't change books.\n")
+
+      if self.batch_writes_b != c.__DEFAULT_BATCH_WRITES:
+         lines_sl.append("Write scraped details into books in batches.\n")
        
       for publisher_s in self.ignored_publishers_sl:
          lines_sl.append("Ignore all series published by '{0}'\n"\
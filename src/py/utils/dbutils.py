@@ -1,3 +1,4 @@
+#coding: utf-8
 '''
 This module contains a variety of useful utility methods for working with
 the database (db.py and dbmodels.py) modules.  In particular, this module
@@ -6,6 +7,8 @@ is for dealing with IssueRefs and SeriesRefs.
 @author: Cory Banack
 '''
 
+from utils import natural_key
+
 #==============================================================================
 def filter_series_refs(series_refs, ignored_publishers_sl, 
       ignore_before_year_n, ignore_after_year_n, never_ignore_threshold_n):
@@ -23,16 +26,89 @@ def filter_series_refs(series_refs, ignored_publishers_sl,
    '''
    filtered_refs = set() 
    for series_ref in series_refs:
-      if series_ref.issue_count_n >= never_ignore_threshold_n:
-         year_passes_filter = True
-         pub_passes_filter = True
-      else:
-         publisher_s = series_ref.publisher_s.lower().strip()
-         year_passes_filter = series_ref.volume_year_n == -1 \
-            or (series_ref.volume_year_n >= ignore_before_year_n \
-            and series_ref.volume_year_n <= ignore_after_year_n) 
-         pub_passes_filter = publisher_s not in ignored_publishers_sl
-      if year_passes_filter and pub_passes_filter:    
+      if __passes_filter_b(series_ref, ignored_publishers_sl, 
+            ignore_before_year_n, ignore_after_year_n, never_ignore_threshold_n):
          filtered_refs.add(series_ref)
    return filtered_refs
 
+
+#==============================================================================
+def create_series_filter(config):
+   '''
+   Returns a function that takes a single SeriesRef, and returns whether or not
+   that SeriesRef passes the filtering criteria (see filter_series_refs) that
+   are specified in the given Configuration.  
+   
+   Such a function can be passed to the db module's series queries, so that
+   they can stop searching once they've found enough series that pass it.
+   '''
+   return lambda series_ref : __passes_filter_b(series_ref, 
+      config.ignored_publishers_sl, 
+      config.ignored_before_year_n,
+      config.ignored_after_year_n, 
+      config.never_ignore_threshold_n)
+
+
+#==============================================================================
+def __passes_filter_b(series_ref, ignored_publishers_sl, 
+      ignore_before_year_n, ignore_after_year_n, never_ignore_threshold_n):
+   ''' 
+   Returns whether the given SeriesRef passes the given filtering criteria, 
+   which are described in filter_series_refs.
+   '''
+   if series_ref.issue_count_n >= never_ignore_threshold_n:
+      year_passes_filter = True
+      pub_passes_filter = True
+   else:
+      publisher_s = series_ref.publisher_s.lower().strip()
+      year_passes_filter = series_ref.volume_year_n == -1 \
+         or (series_ref.volume_year_n >= ignore_before_year_n \
+         and series_ref.volume_year_n <= ignore_after_year_n) 
+      pub_passes_filter = publisher_s not in ignored_publishers_sl
+   return year_passes_filter and pub_passes_filter
+
+
+#==============================================================================
+class IssueNumberIndex(object):
+   '''
+   An index of all the IssueRefs in a single series, by issue number.  Issue
+   numbers are compared by their natural keys (see utils.natural_key), so that
+   '5.5', '5½' and '05.50' are all the same issue number, as are '5A' and 
+   '5 a'.   Once built, looking up an issue number in the index takes the
+   same (small) amount of time, no matter how many issues the series has.
+   '''
+
+   #===========================================================================
+   def __init__(self, issue_refs):
+      ''' Builds a new index for the given collection of IssueRefs. '''
+      
+      # maps issue number natural keys -> list of IssueRefs with that key
+      self.__index = {}
+      for issue_ref in issue_refs:
+         key = IssueNumberIndex.__key(issue_ref.issue_num_s)
+         self.__index.setdefault(key, []).append(issue_ref)
+
+   #===========================================================================
+   def find(self, issue_num_s):
+      ''' 
+      Returns a list of every IssueRef in this index that has the given issue
+      number.  The list usually contains one IssueRef, but it may be empty, 
+      or (if the database lists the same issue number more than once) it may
+      contain several IssueRefs.
+      '''
+      return list(self.__index.get(IssueNumberIndex.__key(issue_num_s), []))
+
+   #===========================================================================
+   def find_unique(self, issue_num_s):
+      '''
+      Returns the IssueRef in this index that has the given issue number, or
+      None if there is no such IssueRef, or if there is more than one.
+      '''
+      issue_refs = self.__index.get(IssueNumberIndex.__key(issue_num_s), [])
+      return issue_refs[0] if len(issue_refs) == 1 else None
+
+   #===========================================================================
+   @staticmethod
+   def __key(issue_num_s):
+      ''' Returns the (hashable) key for the given issue number string. '''
+      return tuple(natural_key(issue_num_s if issue_num_s else ''))
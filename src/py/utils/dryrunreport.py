@@ -0,0 +1,105 @@
+'''
+This module is home to the DryRunReport class.
+
+@author: Cory Banack
+'''
+
+import clr
+import log
+from utils import sstr
+
+clr.AddReference('System')
+from System.IO import StreamWriter
+from System.Text import Encoding
+
+#==============================================================================
+class DryRunReport(object):
+   '''
+   A report (in a text file) of everything that a "dry run" scrape operation
+   would have changed in each book, if it weren't a dry run.  Each book gets
+   its own section in the report, which lists the old and new value of every
+   property that scraping it would have changed (see ComicBook.diff).
+   '''
+
+   #===========================================================================
+   def __init__(self, file_s):
+      ''' Starts a new (empty) report in the given file. '''
+
+      # the file that this report is written to
+      self.__file_s = file_s
+
+      # the number of books that this report says would be changed
+      self.__changed_n = 0
+
+      # the number of books that this report says would be left as they are
+      self.__unchanged_n = 0
+
+      self.__writer = StreamWriter(file_s, False, Encoding.UTF8)
+
+
+   #===========================================================================
+   def record(self, book, issue_ref, changes):
+      '''
+      Adds the given ComicBook to this report.  'issue_ref' is the IssueRef
+      that the book would have been scraped with, and 'changes' is the list
+      of (property, old value, new value) tuples that doing so would change.
+      '''
+
+      if changes:
+         self.__changed_n += 1
+      else:
+         self.__unchanged_n += 1
+      try:
+         self.__writer.Write(
+            self.__name_s(book) + "\n   -> " + sstr(issue_ref) + "\n")
+         if not changes:
+            self.__writer.Write("   (no changes)\n")
+         for property_s, old_value, new_value in changes:
+            self.__writer.Write("   {0}: {1} -> {2}\n".format(property_s,
+               self.__format_s(old_value), self.__format_s(new_value)))
+         self.__writer.Write("\n")
+      except:
+         log.debug_exc("problem writing dry run report: " + self.__file_s)
+
+
+   #===========================================================================
+   def record_skip_forever(self, book):
+      '''
+      Adds the given ComicBook to this report, as a book that would have
+      been marked to be skipped forever (see ComicBook.skip_forever).
+      '''
+      try:
+         self.__writer.Write(self.__name_s(book) + "\n   -> (skip forever)\n\n")
+      except:
+         log.debug_exc("problem writing dry run report: " + self.__file_s)
+
+
+   #===========================================================================
+   def close(self):
+      ''' Finishes and closes this report. '''
+
+      try:
+         self.__writer.Write("{0} books would be changed, {1} would not.\n"
+            .format(self.__changed_n, self.__unchanged_n))
+         self.__writer.Close()
+         log.debug("wrote dry run report for ", self.__changed_n +
+            self.__unchanged_n, " books: ", self.__file_s)
+      except:
+         log.debug_exc("problem closing dry run report: " + self.__file_s)
+
+
+   #===========================================================================
+   def __name_s(self, book):
+      ''' Returns the name of the given ComicBook, for display. '''
+      return book.path_s if book.path_s else \
+         "FILELESS: " + book.series_s + " #" + book.issue_num_s
+
+
+   #===========================================================================
+   def __format_s(self, value):
+      ''' Formats the given property value (or list of values) for display. '''
+
+      if type(value) == list:
+         value = ', '.join([sstr(x) for x in value])
+      value = sstr(value).replace('\r', ' ').replace('\n', ' ')
+      return "'" + (value if len(value) <= 70 else value[:70] + " ...") + "'"
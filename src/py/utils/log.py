@@ -5,7 +5,9 @@ handle_error methods will get printed to stdout.
 
 Once installed, this module also logs all text that is written to stderr or 
 stdout (by this module, or any other mechanism).  This text can be written out 
-to a file in its entirety at any time by the save() method.
+to a file at any time by the save() method.  To keep the log from growing 
+without limit during very long runs, only the start of the log and its most 
+recent lines are kept; the lines in between are dropped.
 
 USAGE
 
@@ -25,6 +27,7 @@ module while either of those two methods are running.
 
 import sys
 import clr
+from collections import deque
 import utils
 import i18n
 from dberrors import DatabaseConnectionError
@@ -229,6 +232,12 @@ def save(show_error_message=False):
 #==============================================================================
 class __Logger(object):
    """ A hidden class that implements the public api of this module. """ 
+   
+   # the number of lines at the start of the log that are always kept
+   _HEAD_LINES_N = 2000
+   
+   # the number of the most recent lines (after those) that are kept
+   _TAIL_LINES_N = 50000
 
 
    #==========================================================================
@@ -240,8 +249,12 @@ class __Logger(object):
       if ( sys.stdout != sys.__stdout__ or sys.stderr != sys.__stderr__):
          raise "do not instantiate two instances of this class!!"
       
-      # the log of all debugged output that this class creates
+      # the log of all debugged output that this class creates.  the first
+      # lines go in 'loglines', the rest go in 'logtail', which only keeps the
+      # most recent ones.  'dropped_n' counts the lines that it didn't keep.
       self._loglines = []
+      self._logtail = deque(maxlen=self._TAIL_LINES_N)
+      self._dropped_n = 0
       
       # a mutex that protects all access to the logLines (above)
       self._mutex = Mutex()
@@ -261,6 +274,7 @@ class __Logger(object):
       self._mutex.WaitOne(-1)
       try:
          self._loglines = None
+         self._logtail = None
          self.__app_window = None
       
          # return stdout and stderr to their original state
@@ -324,7 +338,12 @@ class __Logger(object):
             # shouldn't happen!
             output_line = "***** LOGGING ERROR *****"
              
-         self._loglines.append( output_line )
+         if len(self._loglines) < self._HEAD_LINES_N:
+            self._loglines.append( output_line )
+         else:
+            if len(self._logtail) == self._TAIL_LINES_N:
+               self._dropped_n += 1
+            self._logtail.append( output_line )
          sys.__stdout__.write(output_line)
       finally:
          self._mutex.ReleaseMutex()
@@ -374,6 +393,10 @@ class __Logger(object):
          if self._loglines == None:
             raise Exception("you must install the __Logger before using it")
          loglines_copy = list(self._loglines)
+         if self._dropped_n:
+            loglines_copy.append("\n... {0} log lines dropped ...\n\n"
+               .format(self._dropped_n))
+         loglines_copy.extend(self._logtail)
       finally:
          self._mutex.ReleaseMutex()
          
@@ -0,0 +1,372 @@
+'''
+This module contains tools for running slow work (usually database queries)
+concurrently on background threads, without losing track of the order that
+the work was asked for in.
+
+@author: Cory Banack
+'''
+
+import sys
+import clr
+import log
+
+clr.AddReference('System')
+from System import Environment
+from System.Threading import Monitor, Thread, ThreadStart
+
+#==============================================================================
+def concurrent_map(function, items, workers_n=2, window_n=0):
+   '''
+   A generator that calls the given function on each of the given items, on 
+   up to 'workers_n' background threads at once, and yields the results in the
+   same order as the items.  Each result is yielded as soon as it (and every
+   result before it) is ready.  If the function raises an exception for an 
+   item, that exception is raised here, at the point where the item's result 
+   would have been yielded.
+   
+   The background threads never start an item more than 'window_n' items 
+   (at least 'workers_n') ahead of the last result that was yielded, so if you
+   stop iterating early, only a few unneeded calls will have been made.  But
+   if you do stop early, you MUST close() this generator, or the background 
+   threads may keep waiting (idly) until it is garbage collected.
+   
+   The given function must be threadsafe.  Database queries all share the 
+   same global throttle, so running them with this generator never makes more
+   requests per second; it just lets each request start without waiting for
+   the previous one's response.
+   '''
+   
+   items = list(items)
+   workers_n = max(1, min(workers_n, len(items)))
+   state = _MapState(function, items, max(workers_n, window_n))
+   for i in range(workers_n): #@UnusedVariable
+      thread = Thread(ThreadStart(state.work))
+      thread.IsBackground = True
+      thread.Start()
+   try:
+      for index_n in range(len(items)):
+         yield state.take(index_n)
+   finally:
+      state.stop()
+      
+      
+      
+#==============================================================================
+class _MapState(object):
+   ''' The state that is shared by a concurrent_map and its threads. '''
+   
+   #===========================================================================
+   def __init__(self, function, items, window_n):
+      self.__function = function
+      self.__items = items
+      self.__window_n = window_n
+      
+      # maps the index of each item that is done -> a (result, exc_info) tuple 
+      self.__results = {}
+      
+      # the index of the next item to start working on
+      self.__next_n = 0
+      
+      # the number of results that have been taken so far
+      self.__taken_n = 0
+      
+      # becomes True when no more items should be started
+      self.__stopped_b = False
+      
+      
+   #===========================================================================
+   def work(self):
+      ''' The loop that each background thread runs until there's no work. '''
+      
+      while True:
+         Monitor.Enter(self)
+         try:
+            while not self.__stopped_b and \
+                  self.__next_n < len(self.__items) and \
+                  self.__next_n >= self.__taken_n + self.__window_n:
+               Monitor.Wait(self)
+            if self.__stopped_b or self.__next_n >= len(self.__items):
+               return
+            index_n = self.__next_n
+            self.__next_n += 1
+         finally:
+            Monitor.Exit(self)
+         
+         try:
+            result = (self.__function(self.__items[index_n]), None)
+         except:
+            result = (None, sys.exc_info())
+            
+         Monitor.Enter(self)
+         try:
+            self.__results[index_n] = result
+            Monitor.PulseAll(self)
+         finally:
+            Monitor.Exit(self)
+            
+   
+   #===========================================================================
+   def take(self, index_n):
+      '''
+      Blocks until the item with the given index is done, and then returns its
+      result (or raises its exception.)  Items must be taken in order.
+      '''
+      
+      Monitor.Enter(self)
+      try:
+         while index_n not in self.__results:
+            Monitor.Wait(self)
+         result, exc_info = self.__results.pop(index_n)
+         self.__taken_n = index_n + 1
+         Monitor.PulseAll(self)
+      finally:
+         Monitor.Exit(self)
+      
+      if exc_info:
+         raise exc_info[0], exc_info[1], exc_info[2]
+      return result
+   
+   
+   #===========================================================================
+   def stop(self):
+      ''' Stops the background threads from starting any more items. '''
+      
+      Monitor.Enter(self)
+      try:
+         self.__stopped_b = True
+         Monitor.PulseAll(self)
+      finally:
+         Monitor.Exit(self)
+
+
+
+#==============================================================================
+class Stage(object):
+   '''
+   One stage of a producer/consumer pipeline.  Items that are put() into a 
+   Stage are passed to its function on a few background threads, and then 
+   each item comes back out of the Stage (along with the function's result) 
+   via take(), in the same order that the items went in.  The thread that 
+   takes items out of a Stage is usually the next stage of the pipeline.  
+   
+   A Stage will only work on 'capacity_n' items at once (waiting or in 
+   progress); put() blocks while a Stage is full, so a fast producer can't get
+   too far ahead of a slow function.  Items that are done but not yet taken
+   don't count, so the producer and consumer can safely be the same thread.
+   
+   The given function should handle its own exceptions.  If one escapes, it
+   is logged, and the result for that item is None.
+   
+   A Stage also keeps track of how much time its function spent working, and
+   how much time its producers and consumers spent waiting for it (see 
+   busy_ms, full_ms and empty_ms.)   You MUST call shutdown() on a Stage once 
+   you are done with it, so that its background threads can be disposed of.
+   '''
+   
+   #===========================================================================
+   def __init__(self, function, workers_n=1, capacity_n=2):
+      '''
+      Creates a new Stage that passes items to the given function on the given
+      number of background threads, and that holds at most 'capacity_n' 
+      unfinished items at once.
+      '''
+      
+      # the function that does this Stage's work on each item
+      self.__function = function
+      
+      # the maximum number of items that can be waiting or in progress
+      self.__capacity_n = max(1, capacity_n)
+      
+      # the items that are waiting to be worked on, as (number, item) tuples
+      self.__waiting = []
+      
+      # the number of items that are being worked on right now
+      self.__working_n = 0
+      
+      # maps the number of each item that is done -> an (item, result) tuple 
+      self.__done = {}
+      
+      # the numbers of the items that were cancelled before they were started
+      self.__dropped = set()
+      
+      # the number to give the next item that is put in, and the number of the
+      # next item to take out.  items are numbered in the order they go in.
+      self.__next_put_n = 0
+      self.__next_take_n = 0
+      
+      # the number of milliseconds that this Stage's function spent working,
+      # that put() spent waiting for room, and that take() spent waiting
+      self.__busy_ms = 0
+      self.__full_ms = 0
+      self.__empty_ms = 0
+      
+      # become True when this Stage is cancelled, or shut down
+      self.__cancelled_b = False
+      self.__shutdown_b = False
+      
+      self.__threads = [ self.__start_thread() 
+         for i in range(max(1, workers_n)) ] #@UnusedVariable
+      
+      
+   #===========================================================================
+   def put(self, item):
+      '''
+      Puts the given item into this Stage, to be worked on in the background.
+      Blocks until this Stage has room for the item.  Returns True if the item
+      was put in, or False if this Stage has been cancelled.
+      '''
+      
+      Monitor.Enter(self)
+      try:
+         start_ms = Environment.TickCount
+         while not self.__cancelled_b and \
+               len(self.__waiting) + self.__working_n >= self.__capacity_n:
+            Monitor.Wait(self)
+         self.__full_ms += Environment.TickCount - start_ms
+         
+         if self.__cancelled_b:
+            return False
+         self.__waiting.append( (self.__next_put_n, item) )
+         self.__next_put_n += 1
+         Monitor.PulseAll(self)
+         return True
+      finally:
+         Monitor.Exit(self)
+   
+   
+   #===========================================================================
+   def take(self, block_b=False):
+      '''
+      Takes the next item out of this Stage, and returns it (as an (item, 
+      result) tuple) if it is done.  If it isn't done, this method either
+      blocks until it is, or (if 'block_b' is False) returns None.  This method
+      also returns None if there are no more items to take.
+      '''
+      
+      Monitor.Enter(self)
+      try:
+         start_ms = Environment.TickCount
+         try:
+            while True:
+               while self.__next_take_n in self.__dropped:
+                  self.__dropped.remove(self.__next_take_n)
+                  self.__next_take_n += 1
+               if self.__next_take_n in self.__done:
+                  self.__next_take_n += 1
+                  return self.__done.pop(self.__next_take_n - 1)
+               if not block_b or self.__next_take_n >= self.__next_put_n:
+                  return None
+               Monitor.Wait(self)
+         finally:
+            self.__empty_ms += Environment.TickCount - start_ms
+      finally:
+         Monitor.Exit(self)
+         
+         
+   #===========================================================================
+   def cancel(self):
+      '''
+      Cancels this Stage.  Items that are waiting to be worked on are dropped 
+      (they'll never be taken), and no more items can be put in.  Items that 
+      are already in progress or done can still be taken.  Returns a list of 
+      the dropped items.
+      '''
+      
+      Monitor.Enter(self)
+      try:
+         self.__cancelled_b = True
+         self.__dropped.update([number_n for number_n, i in self.__waiting])
+         dropped = [item for n, item in self.__waiting] #@UnusedVariable
+         self.__waiting = []
+         Monitor.PulseAll(self)
+         return dropped
+      finally:
+         Monitor.Exit(self)
+   
+   
+   #===========================================================================
+   def shutdown(self, block_b=True):
+      '''
+      Cancels this Stage, and stops its background threads once they've 
+      finished any items that are in progress.  If 'block_b' is True, this 
+      method blocks until those threads have stopped.
+      '''
+      
+      self.cancel()
+      Monitor.Enter(self)
+      try:
+         self.__shutdown_b = True
+         Monitor.PulseAll(self)
+      finally:
+         Monitor.Exit(self)
+      if block_b:
+         for thread in self.__threads:
+            if thread != Thread.CurrentThread:
+               thread.Join()
+               
+               
+   #===========================================================================
+   def __start_thread(self):
+      '''
+      Starts (and returns) a background thread that works on the items in 
+      this Stage, one at a time, until this Stage is shut down.
+      '''
+      
+      def threadloop():
+         while True:
+            Monitor.Enter(self)
+            try:
+               while not self.__shutdown_b and not self.__waiting:
+                  Monitor.Wait(self)
+               if self.__shutdown_b:
+                  return
+               number_n, item = self.__waiting.pop(0)
+               self.__working_n += 1
+            finally:
+               Monitor.Exit(self)
+            
+            start_ms = Environment.TickCount
+            result = None
+            try:
+               result = self.__function(item)
+            except:
+               # this thread should NEVER die as the result of an exception!
+               try: log.debug_exc("Error in pipeline stage:")
+               except: pass
+               
+            Monitor.Enter(self)
+            try:
+               self.__working_n -= 1
+               self.__busy_ms += Environment.TickCount - start_ms
+               self.__done[number_n] = (item, result)
+               Monitor.PulseAll(self)
+            finally:
+               Monitor.Exit(self)
+      
+      thread = Thread(ThreadStart(threadloop))
+      thread.IsBackground = True
+      thread.Start()
+      return thread
+   
+   
+   #===========================================================================
+   def __get_pending_n(self):
+      ''' Implements the 'pending_n' property. '''
+      Monitor.Enter(self)
+      try:
+         return self.__next_put_n - self.__next_take_n - len(self.__dropped)
+      finally:
+         Monitor.Exit(self)
+   
+   
+   pending_n = property( __get_pending_n, None, None,
+      "The number of items that have been put in, but not yet taken out." )
+   
+   busy_ms = property( lambda self: self.__busy_ms, None, None,
+      "The total milliseconds that this Stage's function has spent working.")
+   
+   full_ms = property( lambda self: self.__full_ms, None, None,
+      "The total milliseconds that put() has spent waiting for room.")
+   
+   empty_ms = property( lambda self: self.__empty_ms, None, None,
+      "The total milliseconds that take() has spent waiting for items.")
@@ -1,5 +1,5 @@
-''' 
-This module is home to the Scheduler class. 
+'''
+This module is home to the Scheduler and CancelToken classes.
 
 @author: Cory Banack
 '''
@@ -10,107 +10,265 @@ import log
 clr.AddReference('System')
 from System.Threading import Monitor, Thread, ThreadStart
 
-# =============================================================================     
+# =============================================================================
 class Scheduler(object):
    '''
-   A class that maintains its own thread, which can be used to invoke "tasks"
-   (methods) in serial, last-in-ignore-everything-else order.  That means 
-   that, in addition to the currently running task, if any, there can be at 
-   most one other task (the most recently submitted one) queue up to run next.
-   Queueing a large number of tasks in a short period of time will lead to the
-   first, last, and an indeterminate number of the rest actually getting run.
-   
-   Do not forget to call the 'shutdown' method on any instance of this class 
-   once it will no longer be used, so that its background thread can be safely
-   disposed of.
+   A class that maintains a small pool of worker threads, which can be used to
+   invoke "tasks" (no-argument methods) in the background.
+
+   Every task is submitted with a priority (VISIBLE, PREFETCH or BACKGROUND).
+   Waiting tasks are always started in priority order, and in the order that
+   they were submitted within each priority.
+
+   Every task is also submitted with a key.  Submitting a task replaces any
+   task with the same key that is still waiting to run, so for each key there
+   is at most one task waiting to run at any time.  A waiting task is also 
+   never started while another task with the same key is still running, so 
+   tasks with the same key never run at the same time, and always finish in 
+   the order that they were started.  Tasks that are submitted
+   without a key all share the same key, which means that a Scheduler used
+   only that way runs tasks in last-in-ignore-everything-else order:  queueing
+   a large number of tasks in a short period of time will lead to the first,
+   last, and an indeterminate number of the rest actually getting run.
+
+   Finally, a task can be submitted with a CancelToken.  Once that token is
+   cancelled, the task will not be started (though if it is already running,
+   it will be allowed to finish.)
+
+   Do not forget to call the 'shutdown' method on any instance of this class
+   once it will no longer be used, so that its background threads can be
+   safely disposed of.
    '''
-   
+
+   # the task priorities, from most to least urgent
+   VISIBLE = 0     # results that the user is looking at right now
+   PREFETCH = 1    # results that the user is likely to look at soon
+   BACKGROUND = 2  # speculative warm-up work
+
+   # the key that is used for tasks that are submitted without one
+   __DEFAULT_KEY = object()
+
    # ==========================================================================
-   def __init__(self):
-      
-      # the next scheduled task.  if this is "self", it means that the next
-      # scheduled task is to shut down the __scheduler's background thread.
-      self.task = None;
-      
-      # the background thread that tasks get run on
-      self.loop_thread = self.__start_thread_loop()
-      
+   def __init__(self, workers_n=1):
+      '''
+      Creates a new Scheduler that runs tasks on the given number of
+      background threads (at least 1.)
+      '''
+
+      # one list of waiting _Tasks for each priority, each in submission order
+      self.__lanes = [ [], [], [] ]
+
+      # maps each key to the _Task for that key that is waiting to run
+      self.__waiting = {}
+
+      # the keys of the tasks that are running right now
+      self.__running = set()
+
+      # becomes True when this Scheduler is shut down
+      self.__shutdown_b = False
+
+      # the background threads that tasks get run on
+      self.__threads = [ self.__start_thread_loop()
+         for i in range(max(1, workers_n)) ] #@UnusedVariable
+
+
    # ==========================================================================
-   def submit(self, task):
+   def submit(self, task, priority=VISIBLE, key=__DEFAULT_KEY, token=None):
       '''
-      Submits the given task (a method handle) to this Scheduler, to be run on 
-      the background thread. if the Scheduler is idle, the given task will be 
-      run almost immediately.  If the Scheduler is busy, the given task will be 
-      run as soon as the Scheduler finishes its current task, UNLESS a new task 
-      is added before the given task has a chance to start.  In that case, the 
-      new task will take the given task's place in line, and the given task will
-      never be executed. 
-      
-      If this Scheduler has been shutdown, the given task will never be run.
+      Submits the given task (a method handle) to this Scheduler, to be run on
+      a background thread.  If the Scheduler has an idle thread, the given task
+      will be run almost immediately.  Otherwise, it will be run as soon as a
+      thread is free and no more urgent task is waiting, UNLESS another task
+      with the same key is submitted before the given task has a chance to
+      start.  In that case, the new task will take the given task's place in
+      line, and the given task will never be executed.
+
+      'priority' -> one of VISIBLE, PREFETCH, or BACKGROUND.
+      'key' -> tasks with equal keys replace each other; see class comment
+      'token' -> an optional CancelToken that can be used to cancel the task
+
+      Returns the CancelToken for the given task (a new one, if none was
+      given.)  If this Scheduler has been shutdown, the task will never be run.
       '''
-       
+
+      token = token if token else CancelToken()
       if task:
          Monitor.Enter(self)
          try:
-            if self.task != self:
-               # notice this replace any task that is waiting to be run
-               self.task = task
-            Monitor.Pulse(self)
+            if not self.__shutdown_b:
+               lane = self.__lanes[priority]
+               new_task = _Task(task, priority, key, token)
+               old_task = self.__waiting.get(key)
+               if old_task and old_task.priority == priority:
+                  lane[lane.index(old_task)] = new_task
+               else:
+                  if old_task:
+                     self.__lanes[old_task.priority].remove(old_task)
+                  lane.append(new_task)
+               self.__waiting[key] = new_task
+               Monitor.Pulse(self)
          finally:
             Monitor.Exit(self)
-            
-            
-   # ==========================================================================            
+      return token
+
+
+   # ==========================================================================
+   def cancel(self, key=__DEFAULT_KEY):
+      '''
+      Removes the waiting task with the given key (if any) from this Scheduler,
+      so that it will never be run.  A task that is already running for that
+      key is not affected.
+      '''
+
+      Monitor.Enter(self)
+      try:
+         task = self.__waiting.pop(key, None)
+         if task:
+            self.__lanes[task.priority].remove(task)
+      finally:
+         Monitor.Exit(self)
+
+
+   # ==========================================================================
    def shutdown(self, block):
       '''
-      Shuts down this Scheduler, after it has finished any task that it may 
-      currently be running.  After this method is called, no further submitted 
+      Shuts down this Scheduler, after it has finished any tasks that it may
+      currently be running.  After this method is called, no further submitted
       tasks will be run by this Scheduler, ever.  You MUST call this method in
       order to clean up this Scheduler properly.
-      
-      The 'block' boolean parameter indicates whether this method should block 
-      until the Scheduler thread has finished running any last task
-      and shutting down (true), or should return immediately (false).  
+
+      The 'block' boolean parameter indicates whether this method should block
+      until the Scheduler threads have finished running any last tasks
+      and shutting down (true), or should return immediately (false).
       '''
-      
-      self.submit(self) # submitting "self" is a magic trick that shuts down
+
+      Monitor.Enter(self)
+      try:
+         self.__shutdown_b = True
+         self.__lanes = [ [], [], [] ]
+         self.__waiting = {}
+         Monitor.PulseAll(self)
+      finally:
+         Monitor.Exit(self)
+
       if block:
-         self.loop_thread.Join()
-      
-      
-   # ==========================================================================               
+         for thread in self.__threads:
+            if thread != Thread.CurrentThread:
+               thread.Join()
+
+
+   # ==========================================================================
+   def __next_task(self):
+      '''
+      Blocks until there is a task that should be run, and then removes that
+      task from this Scheduler and returns it.  Returns None if this Scheduler
+      has been shutdown.  Tasks whose keys are already running are skipped 
+      (they stay in line) until __finish_task is called for those keys.
+      '''
+
+      Monitor.Enter(self)
+      try:
+         while not self.__shutdown_b:
+            for lane in self.__lanes:
+               i = 0
+               while i < len(lane):
+                  task = lane[i]
+                  if task.key in self.__running and \
+                        not task.token.cancelled_b:
+                     i += 1
+                  else:
+                     del lane[i]
+                     del self.__waiting[task.key]
+                     if not task.token.cancelled_b:
+                        self.__running.add(task.key)
+                        return task
+            Monitor.Wait(self)
+         return None
+      finally:
+         Monitor.Exit(self)
+
+
+   # ==========================================================================
+   def __finish_task(self, task):
+      '''
+      Records that the given task (from __next_task) has finished running, so 
+      that the next task with the same key (if any) can be started.
+      '''
+
+      Monitor.Enter(self)
+      try:
+         self.__running.discard(task.key)
+         Monitor.PulseAll(self)
+      finally:
+         Monitor.Exit(self)
+
+
+   # ==========================================================================
    def __start_thread_loop(self):
       '''
-      Starts (and returns) the background thread, which will wait-loop forever,
-      running tasks that are submitted via the 'submit' method, until it is 
-      flagged by the 'shutdown' method to terminate.   
+      Starts (and returns) a background thread, which will wait-loop forever,
+      running tasks that are submitted via the 'submit' method, until it is
+      flagged by the 'shutdown' method to terminate.
       '''
-      
+
       def threadloop():
-         task = None
-         while task != self:
+         task = self.__next_task()
+         while task:
             try:
-               Monitor.Enter(self)
-               try:
-                  task = self.task
-                  if task != self:
-                     self.task = None
-                  if task is None:
-                     Monitor.Wait(self)
-               finally:
-                  Monitor.Exit(self)
-                  
-               if task != self and task is not None:
-                  task()
-                        
+               task.run()
             except Exception as ex:
                # slightly odd error handling, cause this thread should NEVER
                # die as the result of an exception!
-               try: log.handle_error(ex) 
+               try: log.handle_error(ex)
                except: pass
-               task = None
-               
+            finally:
+               self.__finish_task(task)
+            task = self.__next_task()
+
       thread = Thread(ThreadStart(threadloop))
       thread.IsBackground = True
       thread.Start()
       return thread
+
+
+
+# =============================================================================
+class CancelToken(object):
+   '''
+   A simple, threadsafe flag that can be used to cancel one or more tasks that
+   were submitted to a Scheduler.  Long running tasks may also check the token
+   themselves, so that they can stop early.
+   '''
+
+   # ==========================================================================
+   def __init__(self):
+      ''' Creates a new, uncancelled CancelToken. '''
+      self.__cancelled_b = False
+
+   # ==========================================================================
+   def cancel(self):
+      ''' Cancels this token.  This cannot be undone. '''
+      self.__cancelled_b = True
+
+   # ==========================================================================
+   # True if this token has been cancelled, False otherwise
+   cancelled_b = property( lambda self : self.__cancelled_b )
+
+
+
+# =============================================================================
+class _Task(object):
+   ''' A task (method) that has been submitted to a Scheduler. '''
+
+   # ==========================================================================
+   def __init__(self, method, priority, key, token):
+      self.method = method
+      self.priority = priority
+      self.key = key
+      self.token = token
+
+   # ==========================================================================
+   def run(self):
+      ''' Runs this task, unless its token has been cancelled. '''
+      if not self.token.cancelled_b:
+         self.method()
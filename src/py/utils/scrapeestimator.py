@@ -0,0 +1,173 @@
+'''
+This module is home to the ScrapeEstimator class.
+
+@author: Cory Banack
+'''
+
+import clr
+import db
+import log
+
+clr.AddReference('System')
+from System import DateTime
+from System.Threading import Monitor
+
+#==============================================================================
+class ScrapeEstimator(object):
+   '''
+   Measures how long it takes to scrape each kind of book (see KINDS), along
+   with how many database requests each kind makes, how often those books are
+   scraped entirely from caches, and how long they spend waiting for the
+   database's rate limit.  Those measurements are used to estimate how much
+   longer the current scrape operation will take, and how many books it is
+   scraping per hour.
+
+   This class is threadsafe.
+   '''
+
+   # the kinds of books that are measured (and estimated) separately:
+   #   "rescrape" -> books whose issue is already known (fast rescrape)
+   #   "autoscrape" -> books whose series and issue are chosen automatically
+   #   "interactive" -> books whose series and issue are chosen by the user
+   KINDS = ("rescrape", "autoscrape", "interactive")
+
+   # our guess of how long (in ms) each kind of book takes to scrape, for
+   # when we haven't measured any books of that kind yet
+   __GUESSED_MS = {"rescrape":2000, "autoscrape":6000, "interactive":30000}
+
+   #===========================================================================
+   def __init__(self):
+      ''' Initializes this ScrapeEstimator, and starts its clock. '''
+
+      # the time (in ms) that this estimator was created
+      self.__start_ms = self.__now_ms()
+
+      # maps each kind -> the number of books of that kind left to scrape
+      self.__remaining = dict([(kind_s, 0) for kind_s in self.KINDS])
+
+      # maps each kind -> a list containing the number of books of that kind
+      # that were measured, the total ms they took, the total number of
+      # requests they made, the number of them that made no requests at all,
+      # and the total ms that was spent waiting for the rate limit meanwhile.
+      self.__measured = dict([(kind_s, [0, 0, 0, 0, 0])
+         for kind_s in self.KINDS])
+
+      # the kind, start time (in ms), db query count and db wait time (in ms)
+      # of the book (or books) that are being measured now, or None
+      self.__current = None
+
+      # a lock that guards all of the state above
+      self.__lock = object()
+
+
+   #===========================================================================
+   def add_books(self, kind_s, books_n=1):
+      '''
+      Adds the given number of books of the given kind to the books that are
+      left to scrape.  A negative number removes books, i.e. books that turned
+      out not to need scraping at all.
+      '''
+      Monitor.Enter(self.__lock)
+      try:
+         self.__remaining[kind_s] = max(0, self.__remaining[kind_s] + books_n)
+      finally:
+         Monitor.Exit(self.__lock)
+
+
+   #===========================================================================
+   def start(self, kind_s):
+      '''
+      Starts measuring a book (or a batch of books) of the given kind.  The
+      measurement ends (and is recorded) when finish() is called.
+      '''
+      Monitor.Enter(self.__lock)
+      try:
+         self.__current = (kind_s, self.__now_ms(),
+            db.get_query_count_n(), db.get_throttle_wait_ms())
+      finally:
+         Monitor.Exit(self.__lock)
+
+
+   #===========================================================================
+   def finish(self, books_n=1):
+      '''
+      Finishes measuring the given number of books (i.e. the ones that were
+      started with the last call to start()), and removes them from the books
+      that are left to scrape.  Does nothing if start() wasn't called.
+      '''
+      Monitor.Enter(self.__lock)
+      try:
+         if self.__current and books_n > 0:
+            kind_s, start_ms, count_n, wait_ms = self.__current
+            queries_n = db.get_query_count_n() - count_n
+            measured = self.__measured[kind_s]
+            measured[0] += books_n
+            measured[1] += self.__now_ms() - start_ms
+            measured[2] += queries_n
+            measured[3] += books_n if queries_n == 0 else 0
+            measured[4] += db.get_throttle_wait_ms() - wait_ms
+            self.__remaining[kind_s] = \
+               max(0, self.__remaining[kind_s] - books_n)
+         self.__current = None
+      finally:
+         Monitor.Exit(self.__lock)
+
+
+   #===========================================================================
+   def estimate(self):
+      '''
+      Returns a tuple containing our estimate of the number of milliseconds
+      left in the scrape operation, and the number of books that it has been
+      scraping per hour (so far.)
+      '''
+      Monitor.Enter(self.__lock)
+      try:
+         remaining_ms = 0
+         for kind_s in self.KINDS:
+            remaining_ms += self.__remaining[kind_s] * self.__average_ms(kind_s)
+         books_n = sum([measured[0] for measured in self.__measured.values()])
+         elapsed_ms = max(1.0, self.__now_ms() - self.__start_ms)
+         return int(remaining_ms), books_n * 3600000.0 / elapsed_ms
+      finally:
+         Monitor.Exit(self.__lock)
+
+
+   #===========================================================================
+   def log_summary(self):
+      ''' Writes a summary of everything this estimator measured to the log. '''
+
+      Monitor.Enter(self.__lock)
+      try:
+         remaining_ms, books_per_hour_n = self.estimate()
+         log.debug("scraped {0:.0f} books per hour, for {1:.0f}s".format(
+            books_per_hour_n, (self.__now_ms() - self.__start_ms) / 1000.0))
+         for kind_s in self.KINDS:
+            books_n, ms, queries_n, offline_n, wait_ms = self.__measured[kind_s]
+            if books_n:
+               log.debug("   {0} books: {1}, {2:.1f}s per book, {3:.1f} "
+                  "requests per book, {4:.0f}% from caches, {5:.0f}s waiting "
+                  "for the rate limit".format(kind_s, books_n,
+                  ms / 1000.0 / books_n, float(queries_n) / books_n,
+                  offline_n * 100.0 / books_n, wait_ms / 1000.0) )
+         if remaining_ms:
+            log.debug("   (the remaining books would have taken about ",
+               int(remaining_ms / 60000), " more minutes)")
+      finally:
+         Monitor.Exit(self.__lock)
+
+
+   #===========================================================================
+   def __average_ms(self, kind_s):
+      '''
+      Returns the average time (in ms) that books of the given kind take to
+      scrape, or our guess if we haven't measured any of them yet.
+      '''
+      books_n, ms = self.__measured[kind_s][:2]
+      return float(ms) / books_n if books_n \
+         else ScrapeEstimator.__GUESSED_MS[kind_s]
+
+
+   #===========================================================================
+   def __now_ms(self):
+      ''' Returns the current time, in milliseconds. '''
+      return (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
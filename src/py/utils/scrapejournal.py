@@ -0,0 +1,170 @@
+'''
+This module is home to the ScrapeJournal class.
+
+@author: Cory Banack
+'''
+
+import re
+import clr
+import log
+from dbmodels import SeriesRef
+from utils import sstr
+
+clr.AddReference('System')
+from System.IO import File, FileMode, FileStream, FileAccess, FileShare, \
+   StreamReader, StreamWriter
+from System.Text import Encoding
+
+#==============================================================================
+class ScrapeJournal(object):
+   '''
+   An append-only record (in a file) of what happened to each book during a
+   scrape operation, so that a scrape that dies partway through (a crash, a
+   network failure, etc.) can be resumed later without redoing the books that
+   it already finished.
+
+   Each line in the journal records the outcome (i.e. "SCRAPED", "SKIPPED" or
+   "DELAYED") of one book, along with the issue that the book was scraped
+   with and the series that was chosen for it, if any.  Lines are written to
+   disk (and synced) in small batches, so a crash can only lose the last few
+   of them.  The books on those lines will simply be scraped again.
+   '''
+
+   # the number of outcomes to record before syncing them to disk
+   __SYNC_N = 10
+
+   #===========================================================================
+   def __init__(self, file_s, resume_b):
+      '''
+      Opens the journal in the given file.  If 'resume_b' is True, then the
+      outcomes that are already in that file (from a previous scrape that
+      didn't finish) are loaded and kept.  Otherwise the file is started over.
+      If the file is None, this journal doesn't record anything at all.
+      '''
+
+      # the file that this journal is written to
+      self.__file_s = file_s
+
+      # the keys (see __book_key) of the books that the journal says were
+      # scraped or skipped, i.e. that don't need to be scraped again
+      self.__finished_keys = set()
+
+      # maps unique series keys -> the SeriesRef that was chosen for them
+      self.__series_refs = {}
+
+      # the number of outcomes that have been recorded but not synced to disk
+      self.__unsynced_n = 0
+
+      # the writer for the file, or None if this journal doesn't record
+      self.__writer = None
+      
+      if file_s:
+         if resume_b and File.Exists(file_s):
+            self.__load()
+         mode = FileMode.Append if resume_b else FileMode.Create
+         self.__writer = StreamWriter( FileStream(file_s, mode, 
+            FileAccess.Write, FileShare.Read), Encoding.UTF8 )
+
+
+   #===========================================================================
+   def finished_b(self, book):
+      '''
+      Returns whether the journal says that the given ComicBook was already
+      scraped (or skipped), so that it doesn't have to be scraped again.
+      '''
+      return self.__book_key(book) in self.__finished_keys
+
+
+   #===========================================================================
+   def record(self, book, status_s, issue_ref=None, series_ref=None):
+      '''
+      Records the outcome of scraping the given ComicBook (one of "SCRAPED",
+      "SKIPPED" or "DELAYED"), along with the IssueRef that it was scraped
+      with, and the SeriesRef that was chosen for it (either may be None.)
+      '''
+
+      if not self.__writer:
+         return
+      clean = lambda s: re.sub(r'\s', ' ', sstr(s)) if s else ''
+      fields = [ status_s, self.__book_key(book),
+         clean(issue_ref.issue_key) if issue_ref else '',
+         clean(book.unique_series_s) if series_ref else '' ]
+      if series_ref:
+         fields += [ clean(series_ref.series_key),
+            clean(series_ref.series_name_s), clean(series_ref.volume_year_n),
+            clean(series_ref.publisher_s), clean(series_ref.issue_count_n),
+            clean(series_ref.thumb_url_s) ]
+      try:
+         self.__writer.Write('\t'.join(fields) + '\n')
+         self.__unsynced_n += 1
+         if self.__unsynced_n >= ScrapeJournal.__SYNC_N:
+            self.__sync()
+      except:
+         log.debug_exc("problem writing scrape journal: " + self.__file_s)
+
+
+   #===========================================================================
+   def close(self, delete_b):
+      '''
+      Syncs and closes this journal.  If 'delete_b' is True, the journal's file
+      is deleted too, since the scrape finished and won't need to be resumed.
+      '''
+
+      if not self.__writer:
+         return
+      try:
+         self.__sync()
+         self.__writer.Close()
+         if delete_b:
+            File.Delete(self.__file_s)
+      except:
+         log.debug_exc("problem closing scrape journal: " + self.__file_s)
+
+
+   #===========================================================================
+   def __sync(self):
+      ''' Writes all of the recorded outcomes through to the disk. '''
+      self.__writer.Flush()
+      self.__writer.BaseStream.Flush(True)
+      self.__unsynced_n = 0
+
+
+   #===========================================================================
+   def __load(self):
+      ''' Loads the outcomes in this journal's file (from a previous scrape.)'''
+
+      try:
+         with StreamReader(self.__file_s, Encoding.UTF8, False) as sr:
+            line = sr.ReadLine()
+            while line is not None:
+               fields = line.split('\t')
+               if len(fields) >= 2 and fields[0] in ("SCRAPED", "SKIPPED"):
+                  self.__finished_keys.add(fields[1])
+               if len(fields) == 10 and fields[3] and fields[4]:
+                  key = int(fields[4]) if fields[4].isdigit() else fields[4]
+                  self.__series_refs[fields[3]] = SeriesRef(key, fields[5],
+                     fields[6], fields[7], fields[8],
+                     fields[9] if fields[9] else None)
+               line = sr.ReadLine()
+         log.debug("resuming a scrape that already finished ",
+            len(self.__finished_keys), " books")
+      except:
+         log.debug_exc("problem loading scrape journal: " + self.__file_s)
+
+
+   #===========================================================================
+   def __book_key(self, book):
+      '''
+      Returns a string that identifies the given ComicBook in this journal;
+      its path, or for fileless books, its series and issue number.
+      '''
+      key_s = book.path_s if book.path_s else \
+         "FILELESS:" + book.series_s + " #" + book.issue_num_s + \
+         " (" + sstr(book.volume_year_n) + ")"
+      return re.sub(r'\s', ' ', key_s)
+
+
+   #===========================================================================
+   # maps unique series keys -> the SeriesRefs that the journal says were
+   # chosen for them (i.e. to rebuild the ScrapeEngine's scrape_cache.)
+   series_refs = property( lambda self : dict(self.__series_refs) )
@@ -0,0 +1,147 @@
+'''
+This module is home to the SeriesLookahead class.
+
+@author: Cory Banack
+'''
+
+import db
+import dbutils
+import imagecache
+import log
+from matchscore import MatchScore
+from scheduler import Scheduler, CancelToken
+from utils import sstr
+
+#==============================================================================
+class SeriesLookahead(object):
+   '''
+   Searches the database for the series of upcoming books in the background,
+   while the ScrapeEngine is busy with the current book (which usually means
+   that the user is busy looking at the SeriesForm.)
+
+   The results are not returned; they simply land in the db module's caches,
+   along with the cover art for the best matching series in the imagecache, so
+   that when the ScrapeEngine gets to those books, it can show them instantly.
+
+   All database access goes through the same global throttle as the rest of
+   the scraper, so looking ahead never makes more requests per second than
+   scraping normally would.  Looking ahead stops as soon as this object is
+   cancelled (see cancel) or shutdown.
+   '''
+
+   # the number of best matching series (per book) to load cover art for
+   __COVERS_N = 2
+
+   #===========================================================================
+   def __init__(self, config):
+      '''
+      Initializes this SeriesLookahead.
+      'config' -> the shared global Configuration object
+      '''
+
+      # the shared global configuration
+      self.__config = config
+
+      # a single background thread to do our searching on
+      self.__scheduler = Scheduler(1)
+
+      # cancelled when this SeriesLookahead is cancelled or shutdown
+      self.__token = CancelToken()
+
+      # the unique series keys of every book we've looked ahead for
+      self.__seen_keys = set()
+
+      # used to choose which series' cover art to load
+      self.__matchscore = MatchScore()
+
+
+   #===========================================================================
+   def look_ahead(self, books, scrape_cache):
+      '''
+      Starts searching in the background for the series of the first few of the
+      given (upcoming) ComicBooks that are not already in the given
+      scrape_cache, and that will need a series search when they are scraped.
+      At most config.lookahead_series_n distinct series are searched for.
+      '''
+
+      lookahead_n = self.__config.lookahead_series_n
+      keys = set()
+      for book in books:
+         if self.__token.cancelled_b or len(keys) >= lookahead_n:
+            break
+         key = book.unique_series_s
+         if key in keys or key in scrape_cache or book.skip_b:
+            continue
+         if self.__config.fast_rescrape_b and \
+               (book.issue_ref or book.series_ref):
+            continue # this book won't need a series search
+         if not book.series_s:
+            continue # the user will have to pick the search terms
+
+         keys.add(key)
+         if key not in self.__seen_keys:
+            self.__seen_keys.add(key)
+            self.__scheduler.submit( self.__create_task(book),
+               Scheduler.BACKGROUND, key, self.__token )
+
+
+   #===========================================================================
+   def cancel(self):
+      ''' Stops all searching that is waiting to happen or in progress. '''
+      self.__token.cancel()
+
+
+   #===========================================================================
+   def shutdown(self):
+      '''
+      Cancels this SeriesLookahead, and then blocks until its background thread
+      has stopped.  You MUST call this method when you are done with it.
+      '''
+      self.cancel()
+      self.__scheduler.shutdown(True)
+
+
+   #===========================================================================
+   def __create_task(self, book):
+      '''
+      Returns a task that searches for the series of the given book, and then
+      loads the cover art for the best matching series that it found.
+      '''
+
+      config = self.__config
+      token = self.__token
+      search_terms_s = book.series_s
+      issue_num_s = '' if config.force_series_art_b or not book.issue_num_s \
+         else book.issue_num_s
+      cancelled = lambda x=0, y=0: token.cancelled_b
+
+      def task():
+         # 1. search for the series; the results end up cached in db
+         log.debug("looking ahead for series that match '",search_terms_s,"'")
+         series_refs = db.query_series_refs( search_terms_s,
+            config.ignored_searchterms_sl, cancelled, 
+            dbutils.create_series_filter(config) )
+         series_refs = dbutils.filter_series_refs(series_refs,
+            config.ignored_publishers_sl,
+            config.ignored_before_year_n,
+            config.ignored_after_year_n,
+            config.never_ignore_threshold_n)
+         if token.cancelled_b:
+            return
+
+         # 2. load the cover art (the same art the SeriesForm will display)
+         #    for the best matching series
+         if config.show_covers_b:
+            series_refs = sorted( series_refs, reverse=True,
+               key=lambda ref: self.__matchscore.compute_n(book, ref) )
+            for series_ref in series_refs[:SeriesLookahead.__COVERS_N]:
+               if token.cancelled_b:
+                  break
+               ref = db.query_issue_ref(series_ref, issue_num_s) \
+                  if issue_num_s else None
+               ref = ref if ref else series_ref
+               if not imagecache.contains(ref):
+                  imagecache.put(ref, db.query_image(ref))
+         log.debug("...looked ahead for '", search_terms_s, "' (",
+            sstr(len(series_refs)), " results)")
+      return task
@@ -0,0 +1,154 @@
+'''
+This module is home to the SeriesSearch class.
+
+@author: Cory Banack
+'''
+
+import clr
+import db
+import dbutils
+import log
+
+clr.AddReference('System')
+from System.Threading import Monitor
+
+#==============================================================================
+class SeriesSearch(object):
+   '''
+   A search of the database for all of the SeriesRefs that match some search
+   terms, where the results arrive in batches (one page of results at a time)
+   instead of all at once.   Every batch of results is filtered according to
+   the user's preferences (see dbutils.filter_series_refs) as it arrives.
+
+   This lets the SeriesForm show the first page of results right away, and
+   then add more results as they come in, rather than making the user wait for
+   the whole search to finish.
+
+   This class is threadsafe.
+   '''
+
+   #===========================================================================
+   def __init__(self, config, search_terms_s, local_b=True):
+      '''
+      Initializes this SeriesSearch.  No searching is done until the first
+      time that next_batch() is called.
+      'config' -> the shared global Configuration object
+      'search_terms_s' -> the (non-empty) search terms to search for
+      'local_b' -> whether the local series index may be searched first
+      '''
+
+      # a function that returns whether the user wants a given SeriesRef
+      self.__series_filter = dbutils.create_series_filter(config)
+
+      # the generator that yields batches of (mostly filtered) SeriesRefs
+      self.__batches = db.query_series_refs_iter( search_terms_s,
+         config.ignored_searchterms_sl, self.__series_filter, local_b )
+
+      # every filtered SeriesRef that this search has found so far
+      self.__series_refs = []
+
+      # the number of SeriesRefs that this search has found, before filtering
+      self.__found_n = 0
+
+      # becomes True when this search has found everything it is going to find
+      self.__done_b = False
+
+      # a lock that guards all of the state above
+      self.__lock = object()
+
+
+   #===========================================================================
+   def next_batch(self):
+      '''
+      Gets the next batch of results for this search from the database,
+      blocking until it arrives.  Returns a list of the new (filtered)
+      SeriesRefs in that batch, which may be empty, or None if the search
+      has already found all of its results.
+      '''
+
+      # only one thread at a time can advance our generator
+      Monitor.Enter(self.__batches)
+      try:
+         if self.done_b:
+            return None
+         batch = next(self.__batches, None)
+         found_n = len(batch) if batch else 0
+         if batch is not None:
+            batch = [ref for ref in batch if self.__series_filter(ref)]
+
+         Monitor.Enter(self.__lock)
+         try:
+            if batch is None:
+               self.__done_b = True
+               self.__log_results()
+            else:
+               self.__found_n += found_n
+               self.__series_refs.extend(batch)
+            return batch
+         finally:
+            Monitor.Exit(self.__lock)
+      finally:
+         Monitor.Exit(self.__batches)
+
+
+   #===========================================================================
+   def close(self):
+      '''
+      Stops this search for good, and frees up any database requests that it
+      may still be waiting on.  After this, next_batch() always returns None.
+      Call this if you stop calling next_batch() before it returns None.
+      Blocks until any call to next_batch() on another thread has finished.
+      '''
+
+      Monitor.Enter(self.__batches)
+      try:
+         self.__batches.close()
+         Monitor.Enter(self.__lock)
+         try:
+            self.__done_b = True
+         finally:
+            Monitor.Exit(self.__lock)
+      finally:
+         Monitor.Exit(self.__batches)
+
+
+   #===========================================================================
+   def __log_results(self):
+      ''' Logs some useful debug output about the finished search. '''
+
+      found_n = len(self.__series_refs)
+      filtered_n = self.__found_n - found_n
+      if filtered_n > 0:
+         log.debug("...filtered out ", filtered_n, " (of ",
+            self.__found_n, ") results.")
+      if found_n == 0:
+         log.debug("...no results found for this search")
+      else:
+         log.debug("...found {0} results".format(found_n))
+
+
+   #===========================================================================
+   def __get_series_refs(self):
+      ''' Implements the 'series_refs' property. '''
+      Monitor.Enter(self.__lock)
+      try:
+         return list(self.__series_refs)
+      finally:
+         Monitor.Exit(self.__lock)
+
+
+   #===========================================================================
+   def __get_done_b(self):
+      ''' Implements the 'done_b' property. '''
+      Monitor.Enter(self.__lock)
+      try:
+         return self.__done_b
+      finally:
+         Monitor.Exit(self.__lock)
+
+
+   series_refs = property( __get_series_refs, None, None,
+      "A list of all the (filtered) SeriesRefs that have been found so far" )
+
+   done_b = property( __get_done_b, None, None,
+      "Whether this search has found all the results it is going to find" )
@@ -348,12 +348,20 @@ def strip_back_cover(image):
    if image:
       pixel_ratio = float(image.Width)/float(image.Height)
       if pixel_ratio < 1.5 and pixel_ratio > 1.2:
-         # create a new image with the back cover (left half) deleted
+         # create a new image with the back cover (left half) deleted.  if 
+         # that fails, don't leak the new image (or the original one.)
          new_image = Bitmap(image.Width/2, image.Height)
-         graphics = Graphics.FromImage(new_image)
-         graphics.DrawImage(image, -image.Width/2, 0)
-         graphics.Dispose()
-         image.Dispose();
+         try:
+            graphics = Graphics.FromImage(new_image)
+            try:
+               graphics.DrawImage(image, -image.Width/2, 0)
+            finally:
+               graphics.Dispose()
+         except:
+            new_image.Dispose()
+            raise
+         finally:
+            image.Dispose()
          image = new_image
           
    return image
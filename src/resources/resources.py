@@ -32,6 +32,18 @@ class Resources(object):
    # the location of the app's chosen series file.
    SERIES_FILE = None
    
+   # the location of the app's local series index file.
+   SERIES_INDEX_FILE = None
+   
+   # the location of the app's (optional) mirror database file.
+   MIRROR_DATABASE_FILE = None
+   
+   # the location of the app's journal of the current (or last) scrape.
+   JOURNAL_FILE = None
+   
+   # the location of the report written by the last dry run scrape.
+   DRY_RUN_FILE = None
+   
    # the location of the app's localization default strings file
    I18N_DEFAULTS_FILE = None
    
@@ -103,6 +115,10 @@ class Resources(object):
       cls.ADVANCED_FILE = profile_dir + r'\advanced.dat'
       cls.GEOMETRY_FILE = profile_dir + r'\geometry.dat'
       cls.SERIES_FILE = profile_dir + r'\series.dat'
+      cls.SERIES_INDEX_FILE = profile_dir + r'\seriesindex.dat'
+      cls.MIRROR_DATABASE_FILE = profile_dir + r'\mirror.db'
+      cls.JOURNAL_FILE = profile_dir + r'\journal.dat'
+      cls.DRY_RUN_FILE = profile_dir + r'\dryrun.txt'
       cls.LOCAL_CACHE_DIRECTORY = profile_dir + r'\localCache'
       cls.I18N_DEFAULTS_FILE = script_dir + r"\en.zip"
       